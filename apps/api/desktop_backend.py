@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
 import sys
 from collections.abc import Mapping
@@ -47,4 +48,7 @@ def run() -> None:
 
 
 if __name__ == "__main__":
+    # Pool workers for DOCX math conversion start as new processes; in the frozen
+    # build they re-run this executable and must stop here instead of serving.
+    multiprocessing.freeze_support()
     run()
@@ -3,35 +3,48 @@ from __future__ import annotations
 import io
 import os
 from importlib import import_module
+from pathlib import Path
 from typing import Any, Callable
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 
 from .export_stats import get_export_stats, increment_export_count
-from .schemas import GenerateRequest, PreviewRequest
+from .schemas import BibliographyConfig, BibliographyUploadRequest, GenerateRequest, OutlineRequest, PreviewRequest
 
 _build_preview_payload: Callable[..., Any] | None = None
+_build_ast_payload: Callable[..., Any] | None = None
+_ast_media_type: str | None = None
 _build_docx: Callable[..., Any] | None = None
 _build_format_config: Callable[..., Any] | None = None
+_build_outline: Callable[..., Any] | None = None
+_store_bibliography_library: Callable[..., Any] | None = None
 
 
 def _ensure_formatter_loaded() -> None:
-    global _build_preview_payload, _build_docx, _build_format_config
+    global _build_preview_payload, _build_ast_payload, _ast_media_type, _build_docx, _build_format_config
+    global _store_bibliography_library
 
     if (
         _build_preview_payload is not None
+        and _build_ast_payload is not None
+        and _ast_media_type is not None
         and _build_docx is not None
         and _build_format_config is not None
+        and _store_bibliography_library is not None
     ):
         return
 
     app_logic = import_module("formatter.app_logic")
+    ast_codec = import_module("formatter.ast_codec")
     docx_builder = import_module("formatter.docx_builder")
     ui_config = import_module("formatter.ui_config")
 
     _build_preview_payload = getattr(app_logic, "build_preview_payload")
+    _build_ast_payload = getattr(app_logic, "build_ast_payload")
+    _store_bibliography_library = getattr(app_logic, "store_bibliography_library")
+    _ast_media_type = getattr(ast_codec, "AST_MEDIA_TYPE")
     _build_docx = getattr(docx_builder, "build_docx")
     _build_format_config = getattr(ui_config, "build_format_config")
 
@@ -43,10 +56,77 @@ def build_preview_payload(*args: Any, **kwargs: Any) -> Any:
     return _build_preview_payload(*args, **kwargs)
 
 
+def build_outline(*args: Any, **kwargs: Any) -> Any:
+    # Loaded on its own so outline requests never import the markdown-it pipeline.
+    global _build_outline
+
+    if _build_outline is None:
+        _build_outline = getattr(import_module("formatter.outline"), "build_outline")
+    return _build_outline(*args, **kwargs)
+
+
+def build_ast_payload(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _build_ast_payload is None:
+        raise RuntimeError("formatter.app_logic.build_ast_payload is unavailable")
+    return _build_ast_payload(*args, **kwargs)
+
+
+def store_bibliography_library(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _store_bibliography_library is None:
+        raise RuntimeError("formatter.app_logic.store_bibliography_library is unavailable")
+    return _store_bibliography_library(*args, **kwargs)
+
+
+def ast_media_type() -> str:
+    _ensure_formatter_loaded()
+    if _ast_media_type is None:
+        raise RuntimeError("formatter.ast_codec.AST_MEDIA_TYPE is unavailable")
+    return _ast_media_type
+
+
+def _ast_cache_dir() -> str:
+    configured = os.getenv("AST_CACHE_DIR")
+    if configured is not None:
+        return configured
+    return str(Path(__file__).resolve().parent / "data" / "ast_cache")
+
+
+def _bibliography_db_path() -> str:
+    configured = os.getenv("BIBLIOGRAPHY_DB_PATH")
+    if configured:
+        return configured
+    return str(Path(__file__).resolve().parent / "data" / "bibliography.db")
+
+
+def _math_cache_path() -> str:
+    configured = os.getenv("MATH_CACHE_PATH")
+    if configured is not None:
+        return configured
+    return str(Path(__file__).resolve().parent / "data" / "omml_cache.db")
+
+
+def _bibliography_options(bibliography: BibliographyConfig) -> dict[str, Any]:
+    return {
+        "bibliography_style": bibliography.style,
+        "bibliography_sources": bibliography.sources_text,
+        "bibliography_library_id": bibliography.library_id,
+        "library_db": _bibliography_db_path(),
+    }
+
+
+def _accepts(accept: str | None, media_type: str) -> bool:
+    if not accept:
+        return False
+    return any(part.split(";", 1)[0].strip().lower() == media_type for part in accept.split(","))
+
+
 def build_docx(*args: Any, **kwargs: Any) -> Any:
     _ensure_formatter_loaded()
     if _build_docx is None:
         raise RuntimeError("formatter.docx_builder.build_docx is unavailable")
+    kwargs.setdefault("math_cache_path", _math_cache_path())
     return _build_docx(*args, **kwargs)
 
 
@@ -78,6 +158,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Math-Over-Budget"],
 )
 
 
@@ -87,21 +168,46 @@ async def healthz() -> dict[str, str]:
 
 
 @app.post("/api/preview")
-async def preview(payload: PreviewRequest) -> dict[str, object]:
-    return build_preview_payload(
-        payload.markdown,
-        bibliography_style=payload.bibliography.style,
-        bibliography_sources=payload.bibliography.sources_text,
-    )
+async def preview(
+    payload: PreviewRequest, accept: str | None = Header(default=None)
+) -> Any:
+    options = _bibliography_options(payload.bibliography)
+    try:
+        if _accepts(accept, ast_media_type()):
+            return Response(
+                content=build_ast_payload(payload.markdown, cache_dir=_ast_cache_dir(), **options),
+                media_type=ast_media_type(),
+                headers={"Vary": "Accept"},
+            )
+        if payload.window is not None:
+            return build_preview_payload(payload.markdown, window=payload.window.model_dump(), **options)
+        # Typing previews are served by the in-memory incremental parser; writing a
+        # cache file per keystroke would only churn the disk cache.
+        return build_preview_payload(payload.markdown, **options)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.post("/api/bibliography")
+async def upload_bibliography(payload: BibliographyUploadRequest) -> dict[str, Any]:
+    return store_bibliography_library(payload.sources_text, library_db=_bibliography_db_path())
+
+
+@app.post("/api/outline")
+async def outline(payload: OutlineRequest) -> dict[str, object]:
+    return build_outline(payload.markdown)
 
 
 @app.post("/api/generate")
 async def generate(payload: GenerateRequest) -> Response:
-    preview_payload = build_preview_payload(
-        payload.markdown,
-        bibliography_style=payload.bibliography.style,
-        bibliography_sources=payload.bibliography.sources_text,
-    )
+    try:
+        preview_payload = build_preview_payload(
+            payload.markdown,
+            cache_dir=_ast_cache_dir(),
+            **_bibliography_options(payload.bibliography),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
 
     try:
         if isinstance(payload.config, dict):
@@ -113,7 +219,7 @@ async def generate(payload: GenerateRequest) -> Response:
         raise HTTPException(status_code=422, detail=str(exc)) from exc
 
     output_buffer = io.BytesIO()
-    build_docx(preview_payload["ast"], output_buffer, config=format_config)
+    rejected = build_docx(preview_payload["ast"], output_buffer, config=format_config) or []
     data = output_buffer.getvalue()
 
     increment_export_count()
@@ -121,7 +227,11 @@ async def generate(payload: GenerateRequest) -> Response:
     return Response(
         content=data,
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": "attachment; filename=ai-report.docx"},
+        headers={
+            "Content-Disposition": "attachment; filename=ai-report.docx",
+            # Formulas of this export written as LaTeX text for exceeding the math budget.
+            "X-Math-Over-Budget": str(len(rejected)),
+        },
     )
 
 
@@ -8,6 +8,24 @@ from pydantic import BaseModel, Field
 class BibliographyConfig(BaseModel):
     style: Literal["ieee", "gbt", "apa"] = "ieee"
     sources_text: str = ""
+    library_id: str | None = None
+
+    class Config:
+        extra = "forbid"
+
+
+class BibliographyUploadRequest(BaseModel):
+    sources_text: str
+
+    class Config:
+        extra = "forbid"
+
+
+class PreviewWindow(BaseModel):
+    start_line: int | None = Field(default=None, ge=1)
+    end_line: int | None = Field(default=None, ge=1)
+    section: int | None = Field(default=None, ge=0)
+    margin_lines: int = Field(default=20, ge=0, le=1000)
 
     class Config:
         extra = "forbid"
@@ -16,6 +34,14 @@ class BibliographyConfig(BaseModel):
 class PreviewRequest(BaseModel):
     markdown: str = ""
     bibliography: BibliographyConfig = Field(default_factory=lambda: BibliographyConfig())
+    window: PreviewWindow | None = None
+
+    class Config:
+        extra = "forbid"
+
+
+class OutlineRequest(BaseModel):
+    markdown: str = ""
 
     class Config:
         extra = "forbid"
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import pytest
 from fastapi.testclient import TestClient
 from docx import Document
 
@@ -10,6 +11,12 @@ from apps.api.export_stats import get_export_stats
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def _isolated_caches(tmp_path, monkeypatch):
+    monkeypatch.setenv("AST_CACHE_DIR", str(tmp_path / "ast_cache"))
+    monkeypatch.setenv("MATH_CACHE_PATH", str(tmp_path / "omml_cache.db"))
+
+
 def test_healthz_returns_ok():
     resp = client.get("/healthz")
     assert resp.status_code == 200
@@ -51,6 +58,7 @@ def test_generate_returns_numbered_math_block(tmp_path):
     payload = {"markdown": "$$ x $$", "config": {}}
     resp = client.post("/api/generate", json=payload)
     assert resp.status_code == 200, resp.text
+    assert resp.headers["x-math-over-budget"] == "0"
 
     doc_path = tmp_path / "out.docx"
     doc_path.write_bytes(resp.content)
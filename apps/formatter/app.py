@@ -7,6 +7,7 @@ import streamlit as st
 from formatter.app_logic import build_preview_payload
 from formatter.config import FormatConfig
 from formatter.docx_builder import build_docx
+from formatter.preview import lint_math_budget
 from formatter.ui_config import build_format_config
 
 
@@ -122,7 +123,9 @@ def main() -> None:
     if st.button("生成并下载 Word 文档", disabled=not text.strip()):
         try:
             with tempfile.NamedTemporaryFile(suffix=".docx") as tmp:
-                build_docx(payload["ast"], tmp.name, config=config)
+                rejected = build_docx(payload["ast"], tmp.name, config=config)
+                for warning in lint_math_budget(rejected):
+                    st.warning(warning["message"])
                 tmp.seek(0)
                 st.download_button(
                     label="下载 Word",
@@ -2,9 +2,89 @@ from __future__ import annotations
 
 from typing import Any
 
-from .markdown_parser import render_preview_html
-from .pipeline import format_markdown
-from .preview import build_export_quality_report, lint_structure, summarize_ast
+from .ast_cache import AstCache
+from .ast_codec import encode_ast
+from .ast_nodes import Heading, ast_to_dicts, coerce_ast
+from .bib_library import BibliographyLibrary
+from .citations import (
+    build_bibliography_nodes,
+    has_bibliography_heading,
+    parse_bibliography_report,
+)
+from .incremental import IncrementalParser
+from .markdown_parser import _detect_profile, build_ast, render_document_html, tokenize_markdown
+from .outline import build_outline
+from .pipeline import collect_bibliography_sources, format_markdown
+from .preprocess import CitationIndex, preprocess_markdown
+from .preview import (
+    build_export_quality_report,
+    lint_bibliography_coverage,
+    lint_bibliography_sources,
+    lint_structure,
+    summarize_ast,
+)
+from .window import PreviewWindow, resolve_window_lines, window_bounds
+
+_PREVIEW_PARSER = IncrementalParser()
+_PREVIEW_CITATIONS = CitationIndex()
+_AST_CACHES: dict[str, AstCache] = {}
+_LIBRARIES: dict[str, BibliographyLibrary] = {}
+
+
+def _get_ast_cache(cache_dir: str | None) -> AstCache | None:
+    if not cache_dir:
+        return None
+    cache = _AST_CACHES.get(cache_dir)
+    if cache is None:
+        cache = _AST_CACHES.setdefault(cache_dir, AstCache(cache_dir))
+    return cache
+
+
+def _get_bibliography_library(library_db: str) -> BibliographyLibrary:
+    library = _LIBRARIES.get(library_db)
+    if library is None:
+        library = _LIBRARIES.setdefault(library_db, BibliographyLibrary(library_db))
+    return library
+
+
+def _referenced_library(library_db: str | None, library_id: str | None) -> BibliographyLibrary | None:
+    if not library_id:
+        return None
+    if not library_db:
+        raise ValueError("bibliography library storage is not configured")
+    return _get_bibliography_library(library_db)
+
+
+def store_bibliography_library(sources_text: str, *, library_db: str) -> dict[str, Any]:
+    stored = _get_bibliography_library(library_db).store(sources_text)
+    return {
+        "library_id": stored.library_id,
+        "entries": stored.entries,
+        "lint_warnings": lint_bibliography_sources(stored.malformed),
+    }
+
+
+def _format_compact(
+    text: str,
+    *,
+    bibliography_style: str,
+    bibliography_sources: str,
+    incremental: bool,
+    cache_dir: str | None,
+    bibliography_library_id: str | None,
+    library_db: str | None,
+) -> dict[str, Any]:
+    return format_markdown(
+        text,
+        bibliography_style=bibliography_style,
+        bibliography_sources=bibliography_sources,
+        parser=_PREVIEW_PARSER if incremental else None,
+        citations=_PREVIEW_CITATIONS if incremental else None,
+        compact=True,
+        cache=_get_ast_cache(cache_dir),
+        bibliography_library=_referenced_library(library_db, bibliography_library_id),
+        bibliography_library_id=bibliography_library_id or "",
+    )
 
 
 def build_preview_payload(
@@ -12,21 +92,147 @@ def build_preview_payload(
     *,
     bibliography_style: str = "ieee",
     bibliography_sources: str = "",
+    incremental: bool = True,
+    cache_dir: str | None = None,
+    window: PreviewWindow | dict[str, Any] | None = None,
+    bibliography_library_id: str | None = None,
+    library_db: str | None = None,
 ) -> dict[str, Any]:
-    result = format_markdown(
+    if window is not None:
+        if isinstance(window, dict):
+            window = PreviewWindow(**window)
+        return _build_window_payload(
+            text,
+            window,
+            bibliography_style=bibliography_style,
+            bibliography_sources=bibliography_sources,
+            incremental=incremental,
+            bibliography_library_id=bibliography_library_id,
+            library_db=library_db,
+        )
+    result = _format_compact(
         text,
         bibliography_style=bibliography_style,
         bibliography_sources=bibliography_sources,
+        incremental=incremental,
+        cache_dir=cache_dir,
+        bibliography_library_id=bibliography_library_id,
+        library_db=library_db,
     )
     summary = summarize_ast(result["ast"])
-    preview_html = render_preview_html(result["normalized_markdown"])
+    preview_html = result.get("preview_html")
+    if preview_html is None:
+        preview_html = render_document_html(result["document"])
+    coverage = result.get("bibliography_coverage")
     lint_warnings = lint_structure(result["ast"], result["refs"])
+    lint_warnings += lint_bibliography_sources(parse_bibliography_report(bibliography_sources)[1])
+    lint_warnings += lint_bibliography_coverage(coverage)
     quality_report = build_export_quality_report(result["ast"], result["refs"], lint_warnings)
-    return {
+    payload = {
         "summary": summary,
         "refs": result["refs"],
-        "ast": result["ast"],
+        "ast": ast_to_dicts(result["ast"]),
+        "preview_html": preview_html,
+        "lint_warnings": lint_warnings,
+        "quality_report": quality_report,
+    }
+    if coverage is not None:
+        payload["bibliography_coverage"] = coverage
+    return payload
+
+
+def _build_window_payload(
+    text: str,
+    window: PreviewWindow,
+    *,
+    bibliography_style: str,
+    bibliography_sources: str,
+    incremental: bool,
+    bibliography_library_id: str | None,
+    library_db: str | None,
+) -> dict[str, Any]:
+    # Counts and heading lint come from the line scan over the whole document; only
+    # the blocks around the window are parsed and rendered.
+    outline = build_outline(text)
+    first_line, last_line = resolve_window_lines(outline, window)
+    preprocessed = preprocess_markdown(text, index=_PREVIEW_CITATIONS if incremental else None)
+    normalized, refs = preprocessed.text, preprocessed.refs
+    if "]:" in normalized or _detect_profile(normalized)[1]:
+        # Link reference definitions resolve across the whole document, and footnotes
+        # of either form are numbered document-wide and collected at the end.
+        start, end = 0, len(text)
+    else:
+        start, end = window_bounds(text, first_line, last_line)
+    fragment_start = preprocessed.offsets.to_normalized(start)
+    fragment_end = preprocessed.offsets.to_normalized(end) if end < len(text) else len(normalized)
+    fragment = normalized[fragment_start:fragment_end]
+
+    if incremental:
+        nodes, preview_html = _PREVIEW_PARSER.parse(fragment, compact=True, normalized=True)
+    else:
+        document = tokenize_markdown(fragment, normalized=True)
+        nodes = build_ast(document, compact=True)
+        preview_html = render_document_html(document)
+
+    headings = [Heading(item["level"], item["text"], []) for item in outline["headings"]]
+    sources, coverage = collect_bibliography_sources(
+        bibliography_sources,
+        refs,
+        preprocessed.key_number_map,
+        library=_referenced_library(library_db, bibliography_library_id),
+        library_id=bibliography_library_id or "",
+    )
+    ast = list(nodes)
+    if fragment_end == len(normalized) and refs and not has_bibliography_heading(headings):
+        bibliography = build_bibliography_nodes(
+            refs,
+            style=bibliography_style,
+            sources=sources,
+            key_number_map=preprocessed.key_number_map,
+        )
+        ast.extend(coerce_ast(bibliography))
+
+    lint_warnings = lint_structure(headings, refs)
+    lint_warnings += lint_bibliography_sources(parse_bibliography_report(bibliography_sources)[1])
+    lint_warnings += lint_bibliography_coverage(coverage)
+    quality_report = build_export_quality_report(ast, refs, lint_warnings)
+    quality_report["stats"] = {**outline["summary"], "refs": len(refs)}
+    payload = {
+        "summary": outline["summary"],
+        "refs": refs,
+        "ast": ast_to_dicts(ast),
         "preview_html": preview_html,
         "lint_warnings": lint_warnings,
         "quality_report": quality_report,
+        "outline": outline["headings"],
+        "window": {
+            "start_line": text.count("\n", 0, start) + 1,
+            "end_line": text.count("\n", 0, max(start, end - 1)) + 1,
+            "total_lines": outline["lines"],
+        },
     }
+    if coverage is not None:
+        payload["bibliography_coverage"] = coverage
+    return payload
+
+
+def build_ast_payload(
+    text: str,
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    incremental: bool = True,
+    cache_dir: str | None = None,
+    bibliography_library_id: str | None = None,
+    library_db: str | None = None,
+) -> bytes:
+    result = _format_compact(
+        text,
+        bibliography_style=bibliography_style,
+        bibliography_sources=bibliography_sources,
+        incremental=incremental,
+        cache_dir=cache_dir,
+        bibliography_library_id=bibliography_library_id,
+        library_db=library_db,
+    )
+    return encode_ast(result["ast"])
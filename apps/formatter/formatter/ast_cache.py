@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from formatter.ast_codec import decode_ast, encode_ast
+from formatter.ast_nodes import Node
+
+# Bump when parser output changes so entries written by older code stop matching.
+CACHE_VERSION = 3
+DEFAULT_MAX_ENTRIES = 512
+
+_ENTRY_MAGIC = b"RFAC"
+_LENGTH = struct.Struct("<I")
+
+
+@dataclass
+class CachedAst:
+    nodes: list[Node]
+    preview_html: str | None = None
+
+
+def document_key(
+    text: str, bibliography_style: str = "", bibliography_sources: str = "", bibliography_library: str = ""
+) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    for part in (str(CACHE_VERSION), bibliography_style, bibliography_sources, bibliography_library, text):
+        encoded = part.encode("utf-8")
+        digest.update(_LENGTH.pack(len(encoded)))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class AstCache:
+    def __init__(self, directory: str | os.PathLike[str], max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Entries on disk, counted once and then tracked per write; the directory is
+        # only rescanned when the count overshoots the limit by the slack.
+        self._count: int | None = None
+        self._slack = max_entries // 8
+        self._lock = Lock()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.ast"
+
+    def get(self, key: str) -> CachedAst | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            entry = _decode_entry(data)
+            os.utime(path)
+        except (OSError, ValueError, struct.error):
+            # Missing, torn or foreign files are misses; the next store overwrites them.
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, nodes: list[Node], preview_html: str | None = None) -> None:
+        data = _encode_entry(nodes, preview_html)
+        path = self._path(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        created = not path.exists()
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._count is None:
+                self._count = self._evict()
+            elif created:
+                self._count += 1
+                if self._count > self.max_entries + self._slack:
+                    self._count = self._evict()
+
+    def _evict(self) -> int:
+        # Returns the number of entries left on disk.
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".ast")]
+        except OSError:
+            return 0
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return len(entries)
+        entries.sort(key=_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        return self.max_entries
+
+
+def _mtime(entry: os.DirEntry[str]) -> float:
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _encode_entry(nodes: list[Node], preview_html: str | None) -> bytes:
+    out = bytearray(_ENTRY_MAGIC)
+    if preview_html is None:
+        out.append(0)
+    else:
+        html = preview_html.encode("utf-8")
+        out.append(1)
+        out += _LENGTH.pack(len(html))
+        out += html
+    out += encode_ast(nodes)
+    return bytes(out)
+
+
+def _decode_entry(data: bytes) -> CachedAst:
+    if not data.startswith(_ENTRY_MAGIC) or len(data) <= len(_ENTRY_MAGIC):
+        raise ValueError("not an AST cache entry")
+    pos = len(_ENTRY_MAGIC) + 1
+    preview_html = None
+    if data[pos - 1]:
+        (length,) = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        preview_html = data[pos : pos + length].decode("utf-8")
+        pos += length
+    return CachedAst(decode_ast(data[pos:]), preview_html)
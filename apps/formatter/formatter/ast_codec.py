@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+from itertools import chain, repeat
+from typing import Iterable, Iterator
+
+from formatter.ast_nodes import (
+    STYLE_KEYS,
+    Blockquote,
+    Cell,
+    CodeBlock,
+    Figure,
+    Heading,
+    InlineRun,
+    ListNode,
+    MathBlock,
+    MathRun,
+    Node,
+    Paragraph,
+    Run,
+    Table,
+)
+
+AST_MEDIA_TYPE = "application/vnd.ai-report.ast"
+
+_MAGIC = b"RFAST"
+_VERSION = 1
+
+# One header byte per node: the type tag in the low three bits, flags above it.
+_NODE_TYPES: tuple[type[Node], ...] = (
+    Heading,
+    Paragraph,
+    ListNode,
+    Table,
+    Blockquote,
+    MathBlock,
+    CodeBlock,
+    Figure,
+)
+_TAGS = {node_type: tag for tag, node_type in enumerate(_NODE_TYPES)}
+_TAG_BITS = 3
+_AUTO_GENERATED = 1 << _TAG_BITS
+_FLAG_A = 1 << (_TAG_BITS + 1)
+_FLAG_B = 1 << (_TAG_BITS + 2)
+
+# Runs are stored as a style column then a string column; math runs take the one
+# style value no combination of style flags can produce.
+_MATH_STYLE = 1 << len(STYLE_KEYS)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class _Encoder:
+    __slots__ = ("out", "strings")
+
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self.strings: dict[str, int] = {}
+
+    def varint(self, value: int) -> None:
+        _write_varint(self.out, value)
+
+    def string(self, value: str) -> None:
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        _write_varint(self.out, index)
+
+    def runs(self, runs: list[InlineRun]) -> None:
+        self.varint(len(runs))
+        for run in runs:
+            self.varint(run.style if type(run) is Run else _MATH_STYLE)
+        for run in runs:
+            self.string(run.text if type(run) is Run else run.latex)
+
+    def cells(self, cells: list[Cell]) -> None:
+        self.varint(len(cells))
+        for cell in cells:
+            self.string(cell.text)
+            self.runs(cell.runs)
+
+    def node(self, node: Node) -> Iterator[Node] | None:
+        header = _TAGS[type(node)] | (_AUTO_GENERATED if node.auto_generated else 0)
+        if type(node) is Heading:
+            self.out.append(header)
+            self.varint(node.level)
+            self.string(node.text)
+            self.runs(node.runs)
+        elif type(node) is Paragraph:
+            if node.checked is not None:
+                header |= _FLAG_A | (_FLAG_B if node.checked else 0)
+            self.out.append(header)
+            self.string(node.text)
+            self.runs(node.runs)
+        elif type(node) is ListNode:
+            self.out.append(header | (_FLAG_A if node.ordered else 0))
+            self.varint(node.level)
+            self.varint(node.start << 1 if node.start >= 0 else (~node.start << 1) | 1)
+            self.varint(len(node.items))
+            for item in node.items:
+                self.varint(len(item))
+            return chain.from_iterable(node.items)
+        elif type(node) is Table:
+            self.out.append(header)
+            self.varint(len(node.align))
+            for align in node.align:
+                self.string(align)
+            self.cells(node.header)
+            self.varint(len(node.rows))
+            for row in node.rows:
+                self.cells(row)
+        elif type(node) is Blockquote:
+            self.out.append(header)
+            self.varint(len(node.children))
+            return iter(node.children)
+        elif type(node) is MathBlock:
+            self.out.append(header)
+            self.string(node.latex)
+        elif type(node) is CodeBlock:
+            self.out.append(header)
+            self.string(node.text)
+            self.string(node.info)
+        else:
+            self.out.append(header)
+            self.string(node.src)
+            self.string(node.alt)
+            self.string(node.caption)
+        return None
+
+
+def encode_ast(nodes: Iterable[Node]) -> bytes:
+    # Nodes are written depth first; containers record their child counts up front
+    # so the decoder can rebuild nesting with an explicit stack.
+    nodes = list(nodes)
+    encoder = _Encoder()
+    encoder.varint(len(nodes))
+    stack: list[Iterator[Node]] = [iter(nodes)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        children = encoder.node(node)
+        if children is not None:
+            stack.append(children)
+
+    out = bytearray(_MAGIC)
+    out.append(_VERSION)
+    _write_varint(out, len(encoder.strings))
+    for value in encoder.strings:
+        encoded = value.encode("utf-8")
+        _write_varint(out, len(encoded))
+        out += encoded
+    out += encoder.out
+    return bytes(out)
+
+
+class _Decoder:
+    __slots__ = ("data", "pos", "strings")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+        self.strings: list[str] = []
+
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def varint(self) -> int:
+        data = self.data
+        pos = self.pos
+        value = data[pos]
+        pos += 1
+        if value > 0x7F:
+            value &= 0x7F
+            shift = 7
+            while True:
+                part = data[pos]
+                pos += 1
+                value |= (part & 0x7F) << shift
+                if part < 0x80:
+                    break
+                shift += 7
+        self.pos = pos
+        return value
+
+    def string(self) -> str:
+        return self.strings[self.varint()]
+
+    def runs(self) -> list[InlineRun]:
+        styles = [self.varint() for _ in range(self.varint())]
+        runs: list[InlineRun] = []
+        for style in styles:
+            text = self.string()
+            runs.append(MathRun(text) if style == _MATH_STYLE else Run(text, style))
+        return runs
+
+    def cells(self) -> list[Cell]:
+        cells: list[Cell] = []
+        for _ in range(self.varint()):
+            text = self.string()
+            cells.append(Cell(text, self.runs()))
+        return cells
+
+    def node(self) -> tuple[Node, Iterator[list[Node]] | None]:
+        header = self.byte()
+        node_type = _NODE_TYPES[header & ((1 << _TAG_BITS) - 1)]
+        auto_generated = bool(header & _AUTO_GENERATED)
+        if node_type is Heading:
+            level = self.varint()
+            text = self.string()
+            return Heading(level, text, self.runs(), auto_generated), None
+        if node_type is Paragraph:
+            checked = bool(header & _FLAG_B) if header & _FLAG_A else None
+            text = self.string()
+            return Paragraph(text, self.runs(), checked, auto_generated), None
+        if node_type is ListNode:
+            level = self.varint()
+            start = self.varint()
+            start = ~(start >> 1) if start & 1 else start >> 1
+            items: list[list[Node]] = [[] for _ in range(self.varint())]
+            counts = [self.varint() for _ in items]
+            targets = chain.from_iterable(map(repeat, items, counts))
+            return ListNode(bool(header & _FLAG_A), level, start, items, auto_generated), targets
+        if node_type is Table:
+            align = [self.string() for _ in range(self.varint())]
+            header_cells = self.cells()
+            rows = [self.cells() for _ in range(self.varint())]
+            return Table(align, header_cells, rows, auto_generated), None
+        if node_type is Blockquote:
+            children: list[Node] = []
+            return Blockquote(children, auto_generated), repeat(children, self.varint())
+        if node_type is MathBlock:
+            return MathBlock(self.string(), auto_generated), None
+        if node_type is CodeBlock:
+            text = self.string()
+            return CodeBlock(text, self.string(), auto_generated), None
+        src = self.string()
+        alt = self.string()
+        return Figure(src, alt, self.string(), auto_generated), None
+
+
+def decode_ast(data: bytes) -> list[Node]:
+    if not data.startswith(_MAGIC) or len(data) <= len(_MAGIC):
+        raise ValueError("not an encoded AST")
+    if data[len(_MAGIC)] != _VERSION:
+        raise ValueError(f"unsupported AST encoding version {data[len(_MAGIC)]}")
+
+    decoder = _Decoder(data)
+    decoder.pos = len(_MAGIC) + 1
+    try:
+        for _ in range(decoder.varint()):
+            length = decoder.varint()
+            end = decoder.pos + length
+            if end > len(data):
+                raise IndexError(end)
+            decoder.strings.append(data[decoder.pos : end].decode("utf-8"))
+            decoder.pos = end
+
+        # Each stack entry yields the list that receives the next decoded node, once
+        # per child still expected there.
+        result: list[Node] = []
+        stack: list[Iterator[list[Node]]] = [repeat(result, decoder.varint())]
+        while stack:
+            target = next(stack[-1], None)
+            if target is None:
+                stack.pop()
+                continue
+            node, children = decoder.node()
+            target.append(node)
+            if children is not None:
+                stack.append(children)
+    except IndexError as exc:
+        raise ValueError("truncated or corrupt AST encoding") from exc
+    if decoder.pos != len(data):
+        raise ValueError("trailing bytes after encoded AST")
+    return result
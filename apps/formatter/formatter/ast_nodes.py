@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+from itertools import chain
+from typing import Any, Iterable, Iterator, Union
+
+STYLE_KEYS = (
+    "bold",
+    "italic",
+    "strike",
+    "highlight",
+    "superscript",
+    "subscript",
+    "code",
+    "link",
+)
+
+BOLD = 1 << 0
+ITALIC = 1 << 1
+STRIKE = 1 << 2
+HIGHLIGHT = 1 << 3
+SUPERSCRIPT = 1 << 4
+SUBSCRIPT = 1 << 5
+CODE = 1 << 6
+LINK = 1 << 7
+
+STYLE_FLAGS = {key: 1 << idx for idx, key in enumerate(STYLE_KEYS)}
+
+
+def style_from_dict(data: dict[str, Any]) -> int:
+    style = 0
+    for key, flag in STYLE_FLAGS.items():
+        if data.get(key):
+            style |= flag
+    return style
+
+
+def style_to_dict(style: int) -> dict[str, bool]:
+    return {key: bool(style & flag) for key, flag in STYLE_FLAGS.items()}
+
+
+def heading_level(markdown_level: int) -> int:
+    # "#" and "##" both become level 1; deeper headings move up one level, down to 4.
+    return max(1, min(4, markdown_level - 1))
+
+
+class _Slotted:
+    __slots__ = ()
+    type = ""
+    _fields: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ()))
+
+    def _values(self) -> tuple[Any, ...]:
+        return tuple([getattr(self, name) for name in self._fields])
+
+    def __reduce__(self) -> tuple[type, tuple[Any, ...]]:
+        # Slots line up with each constructor's parameters, which keeps pickled
+        # fragments small when they travel back from worker processes.
+        return type(self), self._values()
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and self._values() == other._values()  # type: ignore[attr-defined]
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self._values()!r}"
+
+
+class Run(_Slotted):
+    __slots__ = ("text", "style")
+    type = "text"
+
+    def __init__(self, text: str, style: int = 0) -> None:
+        self.text = text
+        self.style = style
+
+    def to_dict(self) -> dict[str, Any]:
+        data: dict[str, Any] = {"text": self.text}
+        data.update(style_to_dict(self.style))
+        return data
+
+
+class MathRun(_Slotted):
+    __slots__ = ("latex",)
+    type = "math"
+
+    def __init__(self, latex: str) -> None:
+        self.latex = latex
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": "math", "latex": self.latex}
+
+
+InlineRun = Union[Run, MathRun]
+
+
+def runs_text(runs: list[InlineRun]) -> str:
+    return "".join(run.text for run in runs if type(run) is Run).strip()
+
+
+class Node(_Slotted):
+    __slots__ = ("auto_generated",)
+
+    def _extra_dict(self) -> dict[str, Any]:
+        return {"auto_generated": True} if self.auto_generated else {}
+
+
+ChildLists = list[tuple[Iterable[Any], list[Any]]]
+
+
+class _ContainerNode(Node):
+    __slots__ = ()
+
+    def to_dict(self) -> dict[str, Any]:
+        return ast_to_dicts([self])[0]
+
+    def _shallow_dict(self) -> tuple[dict[str, Any], ChildLists]:
+        raise NotImplementedError
+
+
+class Heading(Node):
+    __slots__ = ("level", "text", "runs")
+    type = "heading"
+
+    def __init__(self, level: int, text: str, runs: list[InlineRun], auto_generated: bool = False) -> None:
+        self.level = level
+        self.text = text
+        self.runs = runs
+        self.auto_generated = auto_generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "type": "heading",
+            "level": self.level,
+            "text": self.text,
+            "runs": [run.to_dict() for run in self.runs],
+            **self._extra_dict(),
+        }
+
+
+class Paragraph(Node):
+    __slots__ = ("text", "runs", "checked")
+    type = "paragraph"
+
+    def __init__(
+        self,
+        text: str,
+        runs: list[InlineRun],
+        checked: bool | None = None,
+        auto_generated: bool = False,
+    ) -> None:
+        self.text = text
+        self.runs = runs
+        self.checked = checked
+        self.auto_generated = auto_generated
+
+    @property
+    def task(self) -> bool:
+        return self.checked is not None
+
+    def to_dict(self) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "type": "paragraph",
+            "text": self.text,
+            "runs": [run.to_dict() for run in self.runs],
+        }
+        if self.checked is not None:
+            data["task"] = True
+            data["checked"] = self.checked
+        data.update(self._extra_dict())
+        return data
+
+
+class ListNode(_ContainerNode):
+    __slots__ = ("ordered", "level", "start", "items")
+    type = "list"
+
+    def __init__(
+        self,
+        ordered: bool,
+        level: int,
+        start: int,
+        items: list[list[Node]],
+        auto_generated: bool = False,
+    ) -> None:
+        self.ordered = ordered
+        self.level = level
+        self.start = start
+        self.items = items
+        self.auto_generated = auto_generated
+
+    def _shallow_dict(self) -> tuple[dict[str, Any], ChildLists]:
+        items: list[list[dict[str, Any]]] = [[] for _ in self.items]
+        data = {
+            "type": "list",
+            "ordered": self.ordered,
+            "level": self.level,
+            "start": self.start,
+            "items": items,
+            **self._extra_dict(),
+        }
+        return data, list(zip(self.items, items))
+
+
+class Cell(_Slotted):
+    __slots__ = ("text", "runs")
+
+    def __init__(self, text: str, runs: list[InlineRun]) -> None:
+        self.text = text
+        self.runs = runs
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"text": self.text, "runs": [run.to_dict() for run in self.runs]}
+
+
+class Table(Node):
+    __slots__ = ("align", "header", "rows")
+    type = "table"
+
+    def __init__(
+        self,
+        align: list[str],
+        header: list[Cell],
+        rows: list[list[Cell]],
+        auto_generated: bool = False,
+    ) -> None:
+        self.align = align
+        self.header = header
+        self.rows = rows
+        self.auto_generated = auto_generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "type": "table",
+            "align": self.align,
+            "header": [cell.to_dict() for cell in self.header],
+            "rows": [[cell.to_dict() for cell in row] for row in self.rows],
+            **self._extra_dict(),
+        }
+
+
+class Blockquote(_ContainerNode):
+    __slots__ = ("children",)
+    type = "blockquote"
+
+    def __init__(self, children: list[Node], auto_generated: bool = False) -> None:
+        self.children = children
+        self.auto_generated = auto_generated
+
+    def _shallow_dict(self) -> tuple[dict[str, Any], ChildLists]:
+        children: list[dict[str, Any]] = []
+        data = {"type": "blockquote", "children": children, **self._extra_dict()}
+        return data, [(self.children, children)]
+
+
+class MathBlock(Node):
+    __slots__ = ("latex",)
+    type = "math_block"
+
+    def __init__(self, latex: str, auto_generated: bool = False) -> None:
+        self.latex = latex
+        self.auto_generated = auto_generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": "math_block", "latex": self.latex, **self._extra_dict()}
+
+
+class CodeBlock(Node):
+    __slots__ = ("text", "info")
+    type = "code_block"
+
+    def __init__(self, text: str, info: str = "", auto_generated: bool = False) -> None:
+        self.text = text
+        self.info = info
+        self.auto_generated = auto_generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": "code_block", "text": self.text, "info": self.info, **self._extra_dict()}
+
+
+class Figure(Node):
+    __slots__ = ("src", "alt", "caption")
+    type = "figure"
+
+    def __init__(self, src: str, alt: str, caption: str, auto_generated: bool = False) -> None:
+        self.src = src
+        self.alt = alt
+        self.caption = caption
+        self.auto_generated = auto_generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "type": "figure",
+            "src": self.src,
+            "alt": self.alt,
+            "caption": self.caption,
+            **self._extra_dict(),
+        }
+
+
+def ast_to_dicts(nodes: Iterable[Node]) -> list[dict[str, Any]]:
+    # Child lists are allocated up front and filled from a work list, so arbitrarily
+    # deep lists and quotes convert without recursion.
+    result: list[dict[str, Any]] = []
+    pending: ChildLists = [(nodes, result)]
+    while pending:
+        source, target = pending.pop()
+        for node in source:
+            if isinstance(node, _ContainerNode):
+                data, children = node._shallow_dict()
+                pending.extend(children)
+            else:
+                data = node.to_dict()
+            target.append(data)
+    return result
+
+
+def run_from_dict(data: dict[str, Any]) -> InlineRun:
+    if data.get("type") == "math":
+        return MathRun(str(data.get("latex") or ""))
+    return Run(str(data.get("text") or ""), style_from_dict(data))
+
+
+def _runs_from_dicts(runs: Any) -> list[InlineRun]:
+    return [run_from_dict(run) for run in runs or [] if isinstance(run, dict)]
+
+
+def _cell_from_dict(data: dict[str, Any]) -> Cell:
+    return Cell(str(data.get("text") or ""), _runs_from_dicts(data.get("runs")))
+
+
+def node_from_dict(data: dict[str, Any]) -> Node | None:
+    node, pending = _shallow_node_from_dict(data)
+    while pending:
+        source, target = pending.pop()
+        for child in source:
+            if not isinstance(child, dict):
+                target.append(child)
+                continue
+            converted, children = _shallow_node_from_dict(child)
+            if converted is not None:
+                target.append(converted)
+                pending.extend(children)
+    return node
+
+
+def _shallow_node_from_dict(data: dict[str, Any]) -> tuple[Node | None, ChildLists]:
+    ntype = data.get("type")
+    auto_generated = bool(data.get("auto_generated"))
+    if ntype == "heading":
+        return (
+            Heading(
+                int(data.get("level", 1)),
+                str(data.get("text") or ""),
+                _runs_from_dicts(data.get("runs")),
+                auto_generated,
+            ),
+            [],
+        )
+    if ntype == "paragraph":
+        checked = bool(data.get("checked")) if data.get("task") else None
+        runs = _runs_from_dicts(data.get("runs"))
+        return Paragraph(str(data.get("text") or ""), runs, checked, auto_generated), []
+    if ntype == "list":
+        sources = data.get("items", [])
+        items: list[list[Node]] = [[] for _ in sources]
+        node = ListNode(
+            bool(data.get("ordered", False)),
+            int(data.get("level", 1)),
+            int(data.get("start", 1)),
+            items,
+            auto_generated,
+        )
+        return node, list(zip(sources, items))
+    if ntype == "table":
+        return (
+            Table(
+                list(data.get("align", [])),
+                [_cell_from_dict(cell) for cell in data.get("header", [])],
+                [[_cell_from_dict(cell) for cell in row] for row in data.get("rows", [])],
+                auto_generated,
+            ),
+            [],
+        )
+    if ntype == "blockquote":
+        children: list[Node] = []
+        return Blockquote(children, auto_generated), [(data.get("children", []), children)]
+    if ntype == "math_block":
+        return MathBlock(str(data.get("latex") or ""), auto_generated), []
+    if ntype == "code_block":
+        return CodeBlock(str(data.get("text") or ""), str(data.get("info") or ""), auto_generated), []
+    if ntype == "figure":
+        return (
+            Figure(
+                str(data.get("src") or ""),
+                str(data.get("alt") or ""),
+                str(data.get("caption") or ""),
+                auto_generated,
+            ),
+            [],
+        )
+    return None, []
+
+
+def coerce_ast(nodes: Iterable[Node | dict[str, Any]]) -> Iterator[Node]:
+    for node in nodes:
+        if isinstance(node, dict):
+            converted = node_from_dict(node)
+            if converted is not None:
+                yield converted
+        else:
+            yield node
+
+
+def walk_nodes(nodes: Iterable[Node]) -> Iterator[Node]:
+    # Every node in document order, descending into list items and quotes.
+    stack: list[Iterator[Node]] = [iter(nodes)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        yield node
+        if isinstance(node, ListNode):
+            stack.append(chain.from_iterable(node.items))
+        elif isinstance(node, Blockquote):
+            stack.append(iter(node.children))
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+
+from formatter.bibtex import BibEntry, MalformedEntry
+from formatter.citations import Source, parse_bibliography_report, source_text
+
+# SQLite caps bound parameters per statement; key lookups are issued in batches.
+_LOOKUP_BATCH = 500
+
+
+@dataclass
+class StoredLibrary:
+    library_id: str
+    entries: int
+    malformed: list[MalformedEntry] = field(default_factory=list)
+
+
+@dataclass
+class LibraryLookup:
+    sources: dict[str, Source]
+    unused: list[str]
+
+
+def library_id_for(sources_text: str) -> str:
+    return hashlib.blake2b(sources_text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _encode_entry(source: Source) -> str | None:
+    if isinstance(source, str):
+        return None
+    return json.dumps({"type": source.entry_type, "fields": source.fields}, ensure_ascii=False)
+
+
+def _decode_entry(key: str, entry: str) -> BibEntry:
+    data = json.loads(entry)
+    return BibEntry(data["type"], key, data["fields"])
+
+
+class BibliographyLibrary:
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self.path = Path(path)
+        self._lock = Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return sqlite3.connect(self.path)
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bibliography_libraries (
+                library_id TEXT PRIMARY KEY,
+                entry_count INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bibliography_entries (
+                library_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                text TEXT NOT NULL,
+                entry TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(bibliography_entries)")}
+        if "entry" not in columns:
+            # Databases written before entries kept their BibTeX fields.
+            conn.execute("ALTER TABLE bibliography_entries ADD COLUMN entry TEXT")
+        # Covers key-only scans, so unused-entry reports never read entry text.
+        conn.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS bibliography_entries_key
+            ON bibliography_entries (library_id, key)
+            """
+        )
+        conn.commit()
+
+    def store(self, sources_text: str) -> StoredLibrary:
+        # Libraries are immutable and named by content hash, so uploading the same
+        # text again returns the existing library.
+        library_id = library_id_for(sources_text)
+        sources, malformed = parse_bibliography_report(sources_text)
+        with self._lock:
+            conn = self._connect()
+            try:
+                self._ensure_schema(conn)
+                row = conn.execute(
+                    "SELECT entry_count FROM bibliography_libraries WHERE library_id = ?", (library_id,)
+                ).fetchone()
+                if row is not None:
+                    return StoredLibrary(library_id, int(row[0]), malformed)
+                # Another worker may store the same library between the check and
+                # these inserts; its rows are identical, so duplicates are skipped.
+                conn.executemany(
+                    "INSERT OR IGNORE INTO bibliography_entries (library_id, key, text, entry) VALUES (?, ?, ?, ?)",
+                    (
+                        (library_id, key, source_text(source), _encode_entry(source))
+                        for key, source in sources.items()
+                    ),
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO bibliography_libraries (library_id, entry_count, created_at) VALUES (?, ?, ?)",
+                    (library_id, len(sources), datetime.now(timezone.utc).isoformat()),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        return StoredLibrary(library_id, len(sources), malformed)
+
+    def lookup(self, library_id: str, keys: Iterable[str]) -> LibraryLookup:
+        wanted = sorted(set(keys))
+        with self._lock:
+            conn = self._connect()
+            try:
+                self._ensure_schema(conn)
+                if conn.execute(
+                    "SELECT 1 FROM bibliography_libraries WHERE library_id = ?", (library_id,)
+                ).fetchone() is None:
+                    raise ValueError(f"unknown bibliography library {library_id}")
+                wanted_set = set(wanted)
+                unused = [
+                    key
+                    for (key,) in conn.execute(
+                        "SELECT key FROM bibliography_entries WHERE library_id = ? ORDER BY key",
+                        (library_id,),
+                    )
+                    if key not in wanted_set
+                ]
+                sources: dict[str, Source] = {}
+                for start in range(0, len(wanted), _LOOKUP_BATCH):
+                    batch = wanted[start : start + _LOOKUP_BATCH]
+                    placeholders = ", ".join("?" * len(batch))
+                    for key, text, entry in conn.execute(
+                        f"SELECT key, text, entry FROM bibliography_entries "
+                        f"WHERE library_id = ? AND key IN ({placeholders})",
+                        (library_id, *batch),
+                    ):
+                        sources[key] = _decode_entry(key, entry) if entry else text
+            finally:
+                conn.close()
+        return LibraryLookup(sources, unused)
@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Union
+
+from formatter.bibtex import BibEntry
+
+DEFAULT_STYLE = "ieee"
+DEFAULT_MAX_FORMATTED = 8192
+
+# Each template is a list of (separator, part). A part is dropped when one of its
+# fields is empty; <...> marks an optional piece inside a part. The separator is
+# only written between two rendered parts.
+Template = list[tuple[str, str]]
+
+_TEMPLATES: dict[str, dict[str, Template]] = {
+    "ieee": {
+        "article": [
+            ("", "{authors}"), (", ", '"{title}"'), (", ", "{journal}"), (", ", "vol. {volume}"),
+            (", ", "no. {number}"), (", ", "pp. {pages}"), (", ", "<{month} >{year}"), (", ", "doi: {doi}"),
+        ],
+        "inproceedings": [
+            ("", "{authors}"), (", ", '"{title}"'), (", ", "in {booktitle}"), (", ", "<{address}, >{year}"),
+            (", ", "pp. {pages}"), (", ", "doi: {doi}"),
+        ],
+        "book": [
+            ("", "{authors}"), (", ", "{title}"), (", ", "{edition} ed"), (". ", "<{address}: >{publisher}"),
+            (", ", "{year}"),
+        ],
+        "thesis": [
+            ("", "{authors}"), (", ", '"{title}"'), (", ", "{thesis}"), (", ", "{school}"),
+            (", ", "<{address}, >{year}"),
+        ],
+        "techreport": [
+            ("", "{authors}"), (", ", '"{title}"'), (", ", "{institution}"), (", ", "<{address}, >Tech. Rep.< {number}>"),
+            (", ", "{year}"),
+        ],
+        "misc": [
+            ("", "{authors}"), (", ", '"{title}"'), (", ", "{howpublished}"), (", ", "{year}"),
+            (". ", "[Online]. Available: {url}"),
+        ],
+    },
+    "gbt": {
+        "article": [
+            ("", "{authors}"), (". ", "{title}[J]"), (". ", "{journal}"), (", ", "{year}"),
+            (", ", "{volume}<({number})>"), (": ", "{pages}"), (". ", "DOI: {doi}"),
+        ],
+        "inproceedings": [
+            ("", "{authors}"), (". ", "{title}[C]"), ("//", "{booktitle}"), (". ", "<{address}: >{publisher}"),
+            (", ", "{year}"), (": ", "{pages}"),
+        ],
+        "book": [
+            ("", "{authors}"), (". ", "{title}[M]"), (". ", "{edition}版"), (". ", "<{address}: >{publisher}"),
+            (", ", "{year}"),
+        ],
+        "thesis": [
+            ("", "{authors}"), (". ", "{title}[D]"), (". ", "<{address}: >{school}"), (", ", "{year}"),
+        ],
+        "techreport": [
+            ("", "{authors}"), (". ", "{title}[R]"), (". ", "<{address}: >{institution}"), (", ", "{year}"),
+        ],
+        "misc": [
+            ("", "{authors}"), (". ", "{title}[{medium}]"), (". ", "{howpublished}"), (", ", "{year}"),
+            (". ", "{url}"),
+        ],
+    },
+    "apa": {
+        "article": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title}"), (". ", "{journal}"),
+            (", ", "{volume}<({number})>"), (", ", "{pages}"), (". ", "https://doi.org/{doi}"),
+        ],
+        "inproceedings": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title}"), (". ", "In {booktitle}< (pp. {pages})>"),
+            (". ", "{publisher}"), (". ", "https://doi.org/{doi}"),
+        ],
+        "book": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title}"), (" ", "({edition} ed.)"), (". ", "{publisher}"),
+        ],
+        "thesis": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title} [{thesis}]"), (". ", "{school}"),
+        ],
+        "techreport": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title}< (Report No. {number})>"), (". ", "{institution}"),
+        ],
+        "misc": [
+            ("", "{authors}"), (" ", "({year})"), (". ", "{title}"), (". ", "{howpublished}"), (". ", "{url}"),
+        ],
+    },
+}
+
+_ENTRY_KINDS = {
+    "article": "article",
+    "book": "book",
+    "booklet": "book",
+    "inbook": "book",
+    "inproceedings": "inproceedings",
+    "conference": "inproceedings",
+    "incollection": "inproceedings",
+    "phdthesis": "thesis",
+    "mastersthesis": "thesis",
+    "thesis": "thesis",
+    "techreport": "techreport",
+    "report": "techreport",
+}
+
+_THESIS_LABELS = {
+    "ieee": ("Ph.D. dissertation", "M.S. thesis"),
+    "gbt": ("", ""),
+    "apa": ("Doctoral dissertation", "Master's thesis"),
+}
+
+_PLACEHOLDER_RE = re.compile(r"<([^<>]*)>|\{(\w+)\}|([^<{]+)")
+_FIELD_RE = re.compile(r"\{(\w+)\}")
+_AND_RE = re.compile(r"\s+and\s+", re.I)
+_PAGE_RANGE_RE = re.compile(r"\s*-{1,2}\s*|\s*–\s*")
+
+
+def _is_cjk(text: str) -> bool:
+    return any("一" <= char <= "鿿" for char in text)
+
+
+def _split_name(name: str) -> tuple[str, str]:
+    # Returns (family, given) for "Family, Given" and "Given Family".
+    if "," in name:
+        family, given = name.split(",", 1)
+        return family.strip(), given.strip()
+    parts = name.split()
+    if len(parts) == 1:
+        return parts[0], ""
+    return parts[-1], " ".join(parts[:-1])
+
+
+def _initials(given: str, separator: str) -> str:
+    initials = []
+    for word in given.replace(".", " ").split():
+        initials.append("-".join(f"{piece[0]}{separator}" for piece in word.split("-") if piece))
+    return " ".join(initials)
+
+
+def _ieee_name(name: str) -> str:
+    if _is_cjk(name):
+        return name
+    family, given = _split_name(name)
+    return f"{_initials(given, '.')} {family}".strip()
+
+
+def _apa_name(name: str) -> str:
+    if _is_cjk(name):
+        return name
+    family, given = _split_name(name)
+    initials = _initials(given, ".")
+    return f"{family}, {initials}" if initials else family
+
+
+def _gbt_name(name: str) -> str:
+    if _is_cjk(name):
+        return name
+    family, given = _split_name(name)
+    return f"{family.upper()} {_initials(given, '')}".strip()
+
+
+def _ieee_authors(names: list[str], others: bool) -> str:
+    if len(names) > 6 or (others and names):
+        return f"{_ieee_name(names[0])} et al."
+    formatted = [_ieee_name(name) for name in names]
+    if len(formatted) <= 2:
+        return " and ".join(formatted)
+    return f"{', '.join(formatted[:-1])}, and {formatted[-1]}"
+
+
+def _apa_authors(names: list[str], others: bool) -> str:
+    formatted = [_apa_name(name) for name in names[:20]]
+    if others and formatted:
+        return f"{', '.join(formatted)}, et al."
+    if len(formatted) <= 1:
+        return "".join(formatted)
+    return f"{', '.join(formatted[:-1])}, & {formatted[-1]}"
+
+
+def _gbt_authors(names: list[str], others: bool) -> str:
+    formatted = [_gbt_name(name) for name in names[:3]]
+    if (len(names) > 3 or others) and formatted:
+        return f"{', '.join(formatted)}, {'等' if _is_cjk(names[0]) else 'et al'}"
+    return ", ".join(formatted)
+
+
+_AUTHOR_FORMATTERS: dict[str, Callable[[list[str], bool], str]] = {
+    "ieee": _ieee_authors,
+    "apa": _apa_authors,
+    "gbt": _gbt_authors,
+}
+_PAGE_DASHES = {"ieee": "–", "apa": "–", "gbt": "-"}
+
+
+def _edition(edition: str, style: str) -> str:
+    if style == "gbt" or not edition.isdigit():
+        return edition
+    number = int(edition)
+    suffix = "th" if 10 <= number % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+
+Piece = Union[str, tuple[str], list[str]]
+
+
+def _compile_part(pattern: str) -> tuple[tuple[str, ...], list[Piece]]:
+    # A part compiles to the fields it requires plus pieces: literal strings,
+    # (field,) for a required field and, for each <...> group, the list produced by
+    # splitting it on fields (odd positions are field names).
+    required: list[str] = []
+    pieces: list[Piece] = []
+    for group, field, literal in _PLACEHOLDER_RE.findall(pattern):
+        if group:
+            pieces.append(_FIELD_RE.split(group))
+        elif field:
+            required.append(field)
+            pieces.append((field,))
+        else:
+            pieces.append(literal)
+    return tuple(required), pieces
+
+
+def _render_pieces(pieces: list[Piece], values: dict[str, str]) -> str:
+    out: list[str] = []
+    for piece in pieces:
+        if type(piece) is str:
+            out.append(piece)
+        elif type(piece) is tuple:
+            out.append(values[piece[0]])
+        elif all(values[name] for name in piece[1::2]):
+            out.append("".join(values[part] if index % 2 else part for index, part in enumerate(piece)))
+    return "".join(out)
+
+
+class StyleFormatter:
+    def __init__(self, style: str) -> None:
+        self.style = style
+        self._parts = {
+            kind: [(separator, *_compile_part(pattern)) for separator, pattern in template]
+            for kind, template in _TEMPLATES[style].items()
+        }
+
+    def _values(self, entry: BibEntry) -> dict[str, str]:
+        fields = entry.fields
+        names = [name.strip() for name in _AND_RE.split(fields.get("author") or fields.get("editor") or "")]
+        others = bool(names) and names[-1].lower() == "others"
+        names = [name for name in names if name and name.lower() != "others"]
+        pages = fields.get("pages", "")
+        if pages:
+            pages = _PAGE_RANGE_RE.sub(_PAGE_DASHES[self.style], pages)
+        doctoral, masters = _THESIS_LABELS[self.style]
+        values = {
+            "authors": _AUTHOR_FORMATTERS[self.style](names, others),
+            "title": fields.get("title", ""),
+            "journal": fields.get("journal") or fields.get("journaltitle", ""),
+            "booktitle": fields.get("booktitle", ""),
+            "publisher": fields.get("publisher", ""),
+            "address": fields.get("address") or fields.get("location", ""),
+            "school": fields.get("school") or fields.get("institution", ""),
+            "institution": fields.get("institution", ""),
+            "edition": _edition(fields.get("edition", ""), self.style),
+            "volume": fields.get("volume", ""),
+            "number": fields.get("number") or fields.get("issue", ""),
+            "pages": pages,
+            "month": fields.get("month", ""),
+            "year": fields.get("year") or fields.get("date", "")[:4] or ("n.d." if self.style == "apa" else ""),
+            "doi": fields.get("doi", ""),
+            "url": fields.get("url", ""),
+            "howpublished": fields.get("howpublished", ""),
+            "thesis": doctoral if entry.entry_type == "phdthesis" else masters,
+            "medium": "EB/OL" if fields.get("url") else "Z",
+        }
+        if self.style == "apa" and not values["authors"]:
+            # APA moves the title into the author position when there is no author.
+            values["authors"], values["title"] = values["title"], ""
+        return values
+
+    def format(self, entry: BibEntry) -> str:
+        values = self._values(entry)
+        out = ""
+        last = ""
+        for separator, required, pieces in self._parts[_ENTRY_KINDS.get(entry.entry_type, "misc")]:
+            if not all(values[name] for name in required):
+                continue
+            part = _render_pieces(pieces, values)
+            if not part:
+                continue
+            if out:
+                if out.endswith(".") and separator.startswith("."):
+                    separator = separator[1:]
+                out += separator
+            out += part
+            last = part
+        if not out:
+            return ""
+        if self.style == "ieee":
+            # IEEE puts the comma after a quoted title inside the quotes.
+            out = out.replace('", ', '," ')
+        if "://" in last:
+            # A trailing link is left bare so it stays copyable.
+            return out
+        if self.style == "ieee" and out.endswith('"'):
+            return f'{out[:-1]}."'
+        return out if out.endswith(".") else f"{out}."
+
+
+_COMPILED: dict[str, StyleFormatter] = {}
+
+
+def get_style_formatter(style: str) -> StyleFormatter:
+    normalized = style.strip().lower()
+    if normalized not in _TEMPLATES:
+        normalized = DEFAULT_STYLE
+    formatter = _COMPILED.get(normalized)
+    if formatter is None:
+        formatter = _COMPILED.setdefault(normalized, StyleFormatter(normalized))
+    return formatter
+
+
+class FormattedEntryCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_FORMATTED) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str, tuple[tuple[str, str], ...]], str] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def format(self, entry: BibEntry, style: str) -> str:
+        formatter = get_style_formatter(style)
+        key = (formatter.style, entry.entry_type, tuple(entry.fields.items()))
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = formatter.format(entry)
+        with self._lock:
+            self._entries[key] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+
+_FORMAT_CACHE = FormattedEntryCache()
+
+
+def format_bib_entry(entry: BibEntry, style: str = DEFAULT_STYLE) -> str:
+    return _FORMAT_CACHE.format(entry, style)
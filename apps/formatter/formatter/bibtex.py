@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import codecs
+import re
+from dataclasses import dataclass, field
+from typing import IO, Any, Iterator, Union
+
+CHUNK_SIZE = 1 << 16
+
+BibSource = Union[str, bytes, bytearray, memoryview, IO[str], IO[bytes], Any]
+
+_ENTRY_START_RE = re.compile(r"@[ \t]*([A-Za-z][A-Za-z0-9_-]*)[ \t\r\n]*([{(])?")
+_SPACE_RE = re.compile(r"[ \t\r\n]*")
+_KEY_RE = re.compile(r"[^,\s{}()=\"#]*")
+_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_\-:.+/']*")
+_BARE_RE = re.compile(r"[A-Za-z0-9_\-:.+/']+")
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+# Fast path for the common field shape: a flat braced, quoted or numeric value
+# followed by the next delimiter. Anything else goes through the full scanner.
+_FLAT_FIELD_RE = re.compile(
+    r"[\s,]*([A-Za-z_][A-Za-z0-9_\-:.+/']*)[ \t\r\n]*=[ \t\r\n]*"
+    r"(?:\{([^{}@]*)\}|\"([^{}\"@]*)\"|([0-9]+))[ \t\r\n]*(?=[,})])"
+)
+# Brace scans also stop at an entry header at the start of a line: an unbalanced
+# value then costs only its own entry instead of swallowing the rest of the file.
+_BRACE_RE = re.compile(r"[{}]|\n[ \t]*@[A-Za-z]+[ \t]*[{(]")
+_QUOTED_RE = re.compile(r'[{}"]|\n[ \t]*@[A-Za-z]+[ \t]*[{(]')
+_PAREN_RE = re.compile(r"[{})]|\n[ \t]*@[A-Za-z]+[ \t]*[{(]")
+_RESYNC_RE = re.compile(r"\n[ \t]*@")
+
+
+@dataclass
+class BibEntry:
+    entry_type: str
+    key: str
+    fields: dict[str, str] = field(default_factory=dict)
+    line: int = 0
+
+
+@dataclass
+class MalformedEntry:
+    line: int
+    key: str
+    message: str
+
+
+class _NeedMore(Exception):
+    pass
+
+
+class _Malformed(Exception):
+    def __init__(self, message: str, resume: int, key: str = "") -> None:
+        super().__init__(message)
+        self.message = message
+        self.resume = resume
+        self.key = key
+
+
+def _iter_text_chunks(source: BibSource, chunk_size: int) -> Iterator[str]:
+    if isinstance(source, str):
+        yield source
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        reads = (view[pos : pos + chunk_size] for pos in range(0, len(view), chunk_size))
+    else:
+        # File objects and mmap.mmap both expose read(size).
+        reads = iter(lambda: source.read(chunk_size), source.read(0))
+    decoder = None
+    for chunk in reads:
+        if not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    if decoder is not None:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _clean_value(value: str) -> str:
+    # Braces only protect case in BibTeX; the plain reference text drops them.
+    if "{" in value or "}" in value:
+        value = value.replace("{", "").replace("}", "")
+    return " ".join(value.split())
+
+
+class _Scanner:
+    __slots__ = ("buf", "final", "macros", "start")
+
+    def __init__(self, macros: dict[str, str]) -> None:
+        self.buf = ""
+        self.final = False
+        self.macros = macros
+        self.start = 0
+
+    def _at(self, pos: int) -> str:
+        if pos >= len(self.buf):
+            if not self.final:
+                raise _NeedMore
+            raise _Malformed("条目在文件结尾处截断", len(self.buf))
+        return self.buf[pos]
+
+    def _skip_space(self, pos: int) -> int:
+        return _SPACE_RE.match(self.buf, pos).end()  # type: ignore[union-attr]
+
+    def _resync(self, pos: int) -> int:
+        # Search from the start of the line holding pos: the scan may already have
+        # skipped the newline before the next entry's "@".
+        line_start = self.buf.rfind("\n", self.start, pos)
+        match = _RESYNC_RE.search(self.buf, pos if line_start < 0 else line_start)
+        return match.end() - 1 if match else len(self.buf)
+
+    def _close_group(self, pos: int, pattern: re.Pattern[str], closer: str) -> int:
+        depth = 0
+        for match in pattern.finditer(self.buf, pos):
+            token = match.group()
+            if token == "{":
+                depth += 1
+            elif token == "}" and depth:
+                depth -= 1
+            elif token == closer and not depth:
+                return match.end()
+            elif len(token) > 1:
+                raise _Malformed("花括号不配对", match.start() + token.index("@"))
+        if not self.final:
+            raise _NeedMore
+        raise _Malformed("花括号不配对", len(self.buf))
+
+    def _value(self, pos: int) -> tuple[str, int]:
+        parts: list[str] = []
+        while True:
+            pos = self._skip_space(pos)
+            char = self._at(pos)
+            if char == "{":
+                end = self._close_group(pos + 1, _BRACE_RE, "}")
+                parts.append(self.buf[pos + 1 : end - 1])
+            elif char == '"':
+                end = self._close_group(pos + 1, _QUOTED_RE, '"')
+                parts.append(self.buf[pos + 1 : end - 1])
+            else:
+                match = _BARE_RE.match(self.buf, pos)
+                if match is None:
+                    raise _Malformed("缺少字段值", self._resync(pos))
+                end = match.end()
+                self._at(end)
+                word = match.group()
+                parts.append(word if word.isdigit() else self.macros.get(word.lower(), word))
+            pos = self._skip_space(end)
+            if self._at(pos) != "#":
+                return "".join(parts), pos
+            pos += 1
+
+    def _fields(self, pos: int, closer: str) -> tuple[dict[str, str], int]:
+        fields: dict[str, str] = {}
+        while True:
+            flat = _FLAT_FIELD_RE.match(self.buf, pos)
+            if flat is not None:
+                name, braced, quoted, number = flat.groups()
+                value = braced if braced is not None else quoted if quoted is not None else number
+                fields[name.lower()] = " ".join(value.split())
+                pos = flat.end()
+            else:
+                pos = _SEPARATOR_RE.match(self.buf, pos).end()  # type: ignore[union-attr]
+                char = self._at(pos)
+                if char == closer:
+                    return fields, pos + 1
+                match = _NAME_RE.match(self.buf, pos)
+                if match is None:
+                    raise _Malformed(f"无法识别的字段：{char}", self._resync(pos))
+                name = match.group()
+                pos = self._skip_space(self._check_end(match.end()))
+                if self._at(pos) != "=":
+                    raise _Malformed(f"字段 {name} 缺少 '='", self._resync(pos))
+                value, pos = self._value(pos + 1)
+                fields[name.lower()] = _clean_value(value)
+            char = self._at(pos)
+            if char not in (",", closer):
+                raise _Malformed(f"字段 {name} 之后缺少逗号", self._resync(pos))
+
+    def _check_end(self, pos: int) -> int:
+        self._at(pos)
+        return pos
+
+    def entry(self, at: int) -> tuple[BibEntry | None, int]:
+        self.start = at
+        match = _ENTRY_START_RE.match(self.buf, at)
+        if at and self.buf[at - 1].isalnum():
+            # Addresses such as user@example.com in the text between entries.
+            return None, at + 1
+        if match is None:
+            # A stray "@" outside an entry is comment text, as in BibTeX.
+            if self._skip_space(at + 1) >= len(self.buf) and not self.final:
+                raise _NeedMore
+            return None, at + 1
+        self._check_end(match.end())
+        entry_type = match.group(1).lower()
+        if match.group(2) is None:
+            raise _Malformed(f"@{match.group(1)} 后缺少 '{{'", self._resync(match.end()))
+        closer = "}" if match.group(2) == "{" else ")"
+        pos = match.end()
+
+        if entry_type in ("comment", "preamble"):
+            return None, self._close_group(pos, _BRACE_RE if closer == "}" else _PAREN_RE, closer)
+        if entry_type == "string":
+            fields, end = self._fields(pos, closer)
+            self.macros.update(fields)
+            return None, end
+
+        pos = self._skip_space(pos)
+        key_match = _KEY_RE.match(self.buf, pos)
+        key = key_match.group() if key_match else ""
+        pos = self._skip_space(self._check_end(pos + len(key)))
+        if not key:
+            raise _Malformed("缺少条目键", self._resync(pos))
+        try:
+            char = self._at(pos)
+            if char == closer:
+                return BibEntry(entry_type, key), pos + 1
+            if char != ",":
+                raise _Malformed("条目键之后缺少逗号", self._resync(pos))
+            fields, end = self._fields(pos + 1, closer)
+        except _Malformed as exc:
+            exc.key = key
+            raise
+        return BibEntry(entry_type, key, fields), end
+
+
+def iter_bibtex(source: BibSource, *, chunk_size: int = CHUNK_SIZE) -> Iterator[BibEntry | MalformedEntry]:
+    # Reads str, bytes, text or binary file objects and mmap objects chunk by chunk.
+    # Each entry is scanned once from its "@"; only an entry cut by a chunk boundary
+    # is rescanned after the next chunk arrives, so the cost stays linear.
+    scanner = _Scanner({})
+    chunks = _iter_text_chunks(source, chunk_size)
+    line = 1
+    counted = 0
+    pos = 0
+    while True:
+        at = scanner.buf.find("@", pos)
+        # Keep the last character so an "@" at the start of the next chunk still
+        # sees what precedes it.
+        keep = max(pos, len(scanner.buf) - 1)
+        if at >= 0:
+            try:
+                entry, end = scanner.entry(at)
+            except _NeedMore:
+                keep = at
+            except _Malformed as exc:
+                line += scanner.buf.count("\n", counted, at)
+                counted = at
+                yield MalformedEntry(line, exc.key, exc.message)
+                pos = max(exc.resume, at + 1)
+                continue
+            else:
+                if entry is not None:
+                    line += scanner.buf.count("\n", counted, at)
+                    counted = at
+                    entry.line = line
+                    yield entry
+                pos = end
+                continue
+        if scanner.final:
+            return
+        # Drop what has been consumed and append the next chunk.
+        line += scanner.buf.count("\n", counted, keep)
+        chunk = next(chunks, None)
+        scanner.buf = scanner.buf[keep:] + (chunk or "")
+        scanner.final = chunk is None
+        pos = counted = 0
+
+
+def parse_bibtex(
+    source: BibSource, *, chunk_size: int = CHUNK_SIZE
+) -> tuple[list[BibEntry], list[MalformedEntry]]:
+    entries: list[BibEntry] = []
+    malformed: list[MalformedEntry] = []
+    for item in iter_bibtex(source, chunk_size=chunk_size):
+        if isinstance(item, BibEntry):
+            entries.append(item)
+        else:
+            malformed.append(item)
+    return entries, malformed
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import hashlib
 import re
-from typing import Any
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Iterable, Mapping, Union
+
+from formatter.ast_nodes import Heading, Node, coerce_ast
+from formatter.bib_styles import format_bib_entry
+from formatter.bibtex import BibEntry, MalformedEntry, iter_bibtex
 
 _CITATION_RE = re.compile(r"\[(\d+)\]")
 _KEY_CITATION_RE = re.compile(r"\[@([A-Za-z0-9:_-]+)\]")
 _MANUAL_SOURCE_RE = re.compile(r"^\[(?P<id>[^\]]+)\]\s*(?P<text>.+)$")
-_BIB_ENTRY_RE = re.compile(
-    r"@(?P<entry_type>[A-Za-z]+)\s*\{\s*(?P<key>[^,\s]+)\s*,(?P<body>.*?)\}\s*(?=@|$)",
-    re.S,
-)
-_BIB_FIELD_RE = re.compile(r"(?P<name>[A-Za-z]+)\s*=\s*(?P<value>\{.*?\}|\".*?\")\s*,?", re.S)
 AstNode = dict[str, Any]
+# Manual sources are display text; BibTeX entries keep their fields so each
+# bibliography style formats them its own way.
+Source = Union[str, BibEntry]
+BibliographyReport = tuple[dict[str, Source], list[MalformedEntry]]
+_REFERENCE_FIELDS = ("author", "title", "journal", "booktitle", "publisher", "year")
+
+DEFAULT_MAX_SOURCE_TEXTS = 32
 
 
 def _plain_run(text: str) -> AstNode:
@@ -31,25 +40,6 @@ def _normalize_source_key(raw_key: str) -> str:
     return raw_key.strip().lower()
 
 
-def _clean_bib_value(raw_value: str) -> str:
-    value = raw_value.strip()
-    if (value.startswith("{") and value.endswith("}")) or (
-        value.startswith('"') and value.endswith('"')
-    ):
-        value = value[1:-1]
-    return re.sub(r"\s+", " ", value).strip()
-
-
-def _parse_bib_fields(body: str) -> dict[str, str]:
-    fields: dict[str, str] = {}
-    for field_match in _BIB_FIELD_RE.finditer(body):
-        name = field_match.group("name").strip().lower()
-        value = _clean_bib_value(field_match.group("value"))
-        if value:
-            fields[name] = value
-    return fields
-
-
 def _format_bib_entry(fields: dict[str, str]) -> str | None:
     author = fields.get("author", "").replace(" and ", ", ").strip()
     title = fields.get("title", "").strip()
@@ -66,8 +56,9 @@ def _format_bib_entry(fields: dict[str, str]) -> str | None:
     return text
 
 
-def parse_bibliography_sources(text: str) -> dict[str, str]:
-    sources: dict[str, str] = {}
+def _parse_bibliography_report(text: str) -> BibliographyReport:
+    sources: dict[str, Source] = {}
+    malformed: list[MalformedEntry] = []
 
     for line in text.splitlines():
         stripped = line.strip()
@@ -80,14 +71,76 @@ def parse_bibliography_sources(text: str) -> dict[str, str]:
             if source_id and source_text:
                 sources[source_id] = source_text
 
-    for entry_match in _BIB_ENTRY_RE.finditer(text):
-        source_id = _normalize_source_key(entry_match.group("key"))
-        fields = _parse_bib_fields(entry_match.group("body"))
-        formatted = _format_bib_entry(fields)
-        if source_id and formatted and source_id not in sources:
-            sources[source_id] = formatted
+    for entry in iter_bibtex(text):
+        if isinstance(entry, MalformedEntry):
+            malformed.append(entry)
+            continue
+        source_id = _normalize_source_key(entry.key)
+        has_fields = any(entry.fields.get(name) for name in _REFERENCE_FIELDS)
+        if source_id and has_fields and source_id not in sources:
+            sources[source_id] = entry
+
+    return sources, malformed
+
+
+class BibliographySourceCache:
+    # Sources text arrives unchanged with almost every preview request, so parsed
+    # results are kept per content hash and handed out as copies.
+    def __init__(self, max_entries: int = DEFAULT_MAX_SOURCE_TEXTS) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._reports: OrderedDict[bytes, BibliographyReport] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reports.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._reports)}
+
+    def parse(self, text: str) -> BibliographyReport:
+        if not text.strip():
+            return {}, []
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if report is None:
+            report = _parse_bibliography_report(text)
+            with self._lock:
+                self._reports[key] = report
+                while len(self._reports) > self.max_entries:
+                    self._reports.popitem(last=False)
+        return dict(report[0]), list(report[1])
+
+
+_SOURCE_CACHE = BibliographySourceCache()
+
+
+def parse_bibliography_report(text: str) -> BibliographyReport:
+    return _SOURCE_CACHE.parse(text)
+
+
+def source_text(source: Source, style: str | None = None) -> str:
+    # Without a style, BibTeX entries get the plain author. title. container. year. form.
+    if isinstance(source, str):
+        return source
+    if style is None:
+        return _format_bib_entry(source.fields) or ""
+    return format_bib_entry(source, style)
 
-    return sources
+
+def parse_bibliography_sources(text: str) -> dict[str, str]:
+    return {key: source_text(source) for key, source in parse_bibliography_report(text)[0].items()}
 
 
 def normalize_citations(text: str) -> tuple[str, list[str], dict[int, str]]:
@@ -127,10 +180,46 @@ def _parse_ref_number(ref: str) -> int | None:
     return int(match.group(1))
 
 
-def has_bibliography_heading(ast: list[AstNode]) -> bool:
+def _lookup_source(
+    ref_number: int, sources: Mapping[str, Source], key_number_map: dict[int, str]
+) -> Source | None:
+    source = sources.get(str(ref_number))
+    if source is None:
+        source_key = key_number_map.get(ref_number)
+        if source_key:
+            source = sources.get(_normalize_source_key(source_key))
+    return source
+
+
+def cited_source_keys(refs: list[str], key_number_map: dict[int, str]) -> list[str]:
+    # Every source key build_bibliography_nodes may look up for these refs.
+    keys: list[str] = []
+    for ref in refs:
+        ref_number = _parse_ref_number(ref)
+        if ref_number is None:
+            continue
+        keys.append(str(ref_number))
+        source_key = key_number_map.get(ref_number)
+        if source_key:
+            keys.append(_normalize_source_key(source_key))
+    return keys
+
+
+def unresolved_citations(
+    refs: list[str], sources: Mapping[str, Source], key_number_map: dict[int, str]
+) -> list[str]:
+    unresolved: list[str] = []
+    for ref in refs:
+        ref_number = _parse_ref_number(ref)
+        if ref_number is None or _lookup_source(ref_number, sources, key_number_map) is not None:
+            continue
+        unresolved.append(key_number_map.get(ref_number) or ref)
+    return unresolved
+
+
+def has_bibliography_heading(ast: Iterable[AstNode | Node]) -> bool:
     return any(
-        node.get("type") == "heading" and str(node.get("text", "")).strip() == "参考文献"
-        for node in ast
+        isinstance(node, Heading) and node.text.strip() == "参考文献" for node in coerce_ast(ast)
     )
 
 
@@ -138,7 +227,7 @@ def build_bibliography_nodes(
     refs: list[str],
     *,
     style: str = "ieee",
-    sources: dict[str, str] | None = None,
+    sources: Mapping[str, Source] | None = None,
     key_number_map: dict[int, str] | None = None,
 ) -> list[AstNode]:
     if not refs:
@@ -158,15 +247,8 @@ def build_bibliography_nodes(
     items = []
     for ref in refs:
         ref_number = _parse_ref_number(ref)
-        source_text = None
-        if ref_number is not None:
-            source_text = sources.get(str(ref_number).lower())
-            if source_text is None:
-                source_key = key_number_map.get(ref_number)
-                if source_key:
-                    source_text = sources.get(_normalize_source_key(source_key))
-
-        text = _format_reference_item(ref, source_text, style)
+        source = _lookup_source(ref_number, sources, key_number_map) if ref_number is not None else None
+        text = _format_reference_item(ref, source_text(source, style) if source is not None else None, style)
         items.append(
             [
                 {
@@ -3,7 +3,11 @@ from __future__ import annotations
 import base64
 import io
 import os
-from typing import Any
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import chain
+from threading import Lock
+from typing import Any, Iterable, Iterator
 from urllib.parse import unquote, urlparse
 from urllib.request import urlopen
 
@@ -13,10 +17,28 @@ from docx.oxml import OxmlElement, parse_xml
 from docx.oxml.ns import qn
 from docx.shared import Cm, Pt, RGBColor
 
+from formatter.ast_nodes import (
+    BOLD,
+    CODE,
+    HIGHLIGHT,
+    ITALIC,
+    LINK,
+    STRIKE,
+    SUBSCRIPT,
+    SUPERSCRIPT,
+    Cell,
+    InlineRun,
+    ListNode,
+    Node,
+    Run,
+    coerce_ast,
+)
 from formatter.config import FormatConfig
-from formatter.latex import latex_to_omml
+from formatter.latex import DEFAULT_MAX_FORMULAS, cached_latex_to_omml
+from formatter.math_prepare import DEFAULT_MATH_BUDGET, MathBudget, collect_formulas, prepare_formulas
+from formatter.math_store import get_omml_store
 
-Node = dict[str, Any]
+AstNode = dict[str, Any]
 
 
 def _set_style_fonts(style, ascii_font: str, east_asia_font: str | None = None) -> None:
@@ -37,6 +59,8 @@ def _chars_to_pt(chars: int, font_size_pt: int) -> Pt:
 
 
 LIST_INDENT_PT = 18
+BLOCKQUOTE_INDENT_PT = 21
+BLOCKQUOTE_MAX_INDENT_LEVELS = 8
 THREE_LINE_BORDER_THICK_SZ = 12
 THREE_LINE_BORDER_THIN_SZ = 6
 
@@ -80,12 +104,49 @@ def _add_page_number(section, position: str) -> None:
     run._r.append(fld)
 
 
+class OmmlElementCache:
+    # Parsed OMML trees keyed by LaTeX source. Each run gets a deep copy, which is
+    # a C-level tree copy in lxml and several times cheaper than parsing again.
+    def __init__(self, max_entries: int = DEFAULT_MAX_FORMULAS) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def element(self, latex: str):
+        with self._lock:
+            element = self._entries.get(latex)
+            if element is not None:
+                self._entries.move_to_end(latex)
+                self.hits += 1
+                return deepcopy(element)
+            self.misses += 1
+        element = parse_xml(_ensure_omml_namespace(cached_latex_to_omml(latex)))
+        with self._lock:
+            self._entries[latex] = element
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return deepcopy(element)
+
+
+_OMML_ELEMENTS = OmmlElementCache()
+
+
 def _add_math_run(paragraph, latex: str) -> None:
     run = paragraph.add_run()
     try:
-        omml = latex_to_omml(latex)
-        omml = _ensure_omml_namespace(omml)
-        run._r.append(parse_xml(omml))
+        run._r.append(_OMML_ELEMENTS.element(latex))
     except Exception:
         run.text = latex
 
@@ -143,22 +204,24 @@ def _add_equation_number_field(paragraph) -> None:
     paragraph.add_run(")")
 
 
-def _apply_run_styles(docx_run, run: Node) -> None:
-    docx_run.bold = bool(run.get("bold"))
-    docx_run.italic = bool(run.get("italic"))
-    if run.get("strike"):
+def _apply_run_styles(docx_run, style: int) -> None:
+    docx_run.bold = bool(style & BOLD)
+    docx_run.italic = bool(style & ITALIC)
+    if not style & ~(BOLD | ITALIC):
+        return
+    if style & STRIKE:
         docx_run.font.strike = True
-    if run.get("highlight"):
+    if style & HIGHLIGHT:
         docx_run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-    if run.get("superscript"):
+    if style & SUPERSCRIPT:
         docx_run.font.superscript = True
-    if run.get("subscript"):
+    if style & SUBSCRIPT:
         docx_run.font.subscript = True
-    if run.get("code"):
+    if style & CODE:
         docx_run.font.name = "Consolas"
-        if not run.get("highlight"):
+        if not style & HIGHLIGHT:
             docx_run.font.highlight_color = WD_COLOR_INDEX.GRAY_25
-    if run.get("link"):
+    if style & LINK:
         docx_run.font.color.rgb = RGBColor(0x05, 0x63, 0xC1)
         docx_run.font.underline = True
 
@@ -179,37 +242,37 @@ def _ensure_omml_namespace(omml: str) -> str:
     )
 
 
-def _add_runs(paragraph, runs: list[Node], fallback_text: str = "") -> None:
+def _add_runs(paragraph, runs: list[InlineRun], fallback_text: str = "") -> None:
     if not runs:
         if fallback_text:
             paragraph.add_run(fallback_text)
         return
     for run in runs:
-        if run.get("type") == "math":
-            _add_math_run(paragraph, run.get("latex", ""))
+        if type(run) is not Run:
+            _add_math_run(paragraph, run.latex)
             continue
-        text = run.get("text", "")
+        text = run.text
         if not text:
             continue
         docx_run = paragraph.add_run(text)
-        _apply_run_styles(docx_run, run)
+        _apply_run_styles(docx_run, run.style)
 
 
-def _trim_leading_text_runs(runs: list[Node]) -> list[Node]:
+def _trim_leading_text_runs(runs: list[InlineRun]) -> list[InlineRun]:
     if not runs:
         return runs
-    trimmed_runs: list[Node] = []
+    trimmed_runs: list[InlineRun] = []
     trimmed = False
     for run in runs:
-        if run.get("type") == "math":
+        if type(run) is not Run:
             trimmed_runs.append(run)
             continue
-        text = run.get("text", "")
+        text = run.text
         if not trimmed:
             stripped = text.lstrip()
             if stripped:
                 if stripped != text:
-                    run = {**run, "text": stripped}
+                    run = Run(stripped, run.style)
                 trimmed = True
             else:
                 if not text:
@@ -231,7 +294,7 @@ def _add_code_block(doc, node: Node) -> None:
     _apply_paragraph_shading(paragraph, "F2F2F2")
 
     code_font = "Consolas"
-    lines = (node.get("text") or "").splitlines()
+    lines = node.text.splitlines()
     for idx, line in enumerate(lines):
         if idx > 0:
             paragraph.add_run().add_break()
@@ -280,7 +343,7 @@ def _load_figure_source(src: str):
 
 
 def _add_figure(doc, node: Node, config: FormatConfig, figure_index: int) -> int:
-    src = str(node.get("src", "")).strip()
+    src = node.src.strip()
     source = _load_figure_source(src)
     alignment = _figure_alignment(config.figure_style.align)
 
@@ -299,7 +362,7 @@ def _add_figure(doc, node: Node, config: FormatConfig, figure_index: int) -> int
 
     picture_paragraph.add_run().add_picture(source, width=Cm(width_cm))
 
-    caption_text = str(node.get("caption") or node.get("alt") or "").strip()
+    caption_text = (node.caption or node.alt).strip()
     if caption_text:
         caption = f"图 {figure_index} {caption_text}"
     else:
@@ -327,42 +390,75 @@ def _add_math_block(paragraph, latex: str, center_tab: int, right_tab: int) -> N
     _add_equation_number_field(paragraph)
 
 
-def _add_list(
+def _add_list_child(
     doc,
-    node: Node,
+    node: ListNode,
+    child: Node,
     config: FormatConfig,
     center_tab: int,
     right_tab: int,
     figure_state: dict[str, int],
 ) -> None:
-    for item in node.get("items", []):
-        for child in item:
-            if child.get("type") == "paragraph":
-                style_name = _list_style_name(node.get("ordered", False), node.get("level", 1))
-                paragraph = doc.add_paragraph("", style=style_name)
-                runs = child.get("runs", [])
-                fallback_text = child.get("text", "")
-                if child.get("task"):
-                    paragraph.add_run("☑ " if child.get("checked") else "☐ ")
-                    runs = _trim_leading_text_runs(runs)
-                    fallback_text = fallback_text.lstrip()
-                _add_runs(paragraph, runs, fallback_text)
-                _apply_list_indents(paragraph, node.get("level", 1))
-            elif child.get("type") == "list":
-                _add_list(doc, child, config, center_tab, right_tab, figure_state)
-            elif child.get("type") == "math_block":
-                paragraph = doc.add_paragraph("", style=_list_style_name(node.get("ordered", False), node.get("level", 1)))
-                _add_math_block(paragraph, child.get("latex", ""), center_tab, right_tab)
-                _apply_list_indents(paragraph, node.get("level", 1))
-            elif child.get("type") == "table":
-                _add_table(doc, child)
-            elif child.get("type") == "code_block":
-                _add_code_block(doc, child)
-            elif child.get("type") == "figure":
-                figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
-
-
-def _add_blockquote(
+    if child.type == "paragraph":
+        style_name = _list_style_name(node.ordered, node.level)
+        paragraph = doc.add_paragraph("", style=style_name)
+        runs = child.runs
+        fallback_text = child.text
+        if child.task:
+            paragraph.add_run("☑ " if child.checked else "☐ ")
+            runs = _trim_leading_text_runs(runs)
+            fallback_text = fallback_text.lstrip()
+        _add_runs(paragraph, runs, fallback_text)
+        _apply_list_indents(paragraph, node.level)
+    elif child.type == "math_block":
+        paragraph = doc.add_paragraph("", style=_list_style_name(node.ordered, node.level))
+        _add_math_block(paragraph, child.latex, center_tab, right_tab)
+        _apply_list_indents(paragraph, node.level)
+    elif child.type == "table":
+        _add_table(doc, child)
+    elif child.type == "code_block":
+        _add_code_block(doc, child)
+    elif child.type == "figure":
+        figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
+
+
+def _add_blockquote_child(
+    doc,
+    child: Node,
+    quote_depth: int,
+    config: FormatConfig,
+    center_tab: int,
+    right_tab: int,
+    figure_state: dict[str, int],
+) -> None:
+    indent = Pt(BLOCKQUOTE_INDENT_PT * min(quote_depth, BLOCKQUOTE_MAX_INDENT_LEVELS))
+    if child.type == "paragraph":
+        paragraph = doc.add_paragraph("")
+        _add_runs(paragraph, child.runs, child.text)
+        paragraph.paragraph_format.left_indent = indent
+        paragraph.paragraph_format.first_line_indent = Pt(0)
+        for run in paragraph.runs:
+            if run.italic is None:
+                run.italic = True
+    elif child.type == "table":
+        _add_table(doc, child)
+    elif child.type == "math_block":
+        paragraph = doc.add_paragraph("")
+        _add_math_block(paragraph, child.latex, center_tab, right_tab)
+        paragraph.paragraph_format.left_indent = indent
+    elif child.type == "code_block":
+        _add_code_block(doc, child)
+    elif child.type == "figure":
+        figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
+
+
+def _container_frame(node: Node, quote_depth: int) -> tuple[Node, Iterator[Node], int]:
+    if isinstance(node, ListNode):
+        return node, chain.from_iterable(node.items), quote_depth
+    return node, iter(node.children), quote_depth + 1
+
+
+def _add_nested(
     doc,
     node: Node,
     config: FormatConfig,
@@ -370,27 +466,20 @@ def _add_blockquote(
     right_tab: int,
     figure_state: dict[str, int],
 ) -> None:
-    for child in node.get("children", []):
-        if child.get("type") == "paragraph":
-            paragraph = doc.add_paragraph("")
-            _add_runs(paragraph, child.get("runs", []), child.get("text", ""))
-            paragraph.paragraph_format.left_indent = Pt(21)
-            paragraph.paragraph_format.first_line_indent = Pt(0)
-            for run in paragraph.runs:
-                if run.italic is None:
-                    run.italic = True
-        elif child.get("type") == "list":
-            _add_list(doc, child, config, center_tab, right_tab, figure_state)
-        elif child.get("type") == "table":
-            _add_table(doc, child)
-        elif child.get("type") == "math_block":
-            paragraph = doc.add_paragraph("")
-            _add_math_block(paragraph, child.get("latex", ""), center_tab, right_tab)
-            paragraph.paragraph_format.left_indent = Pt(21)
-        elif child.get("type") == "code_block":
-            _add_code_block(doc, child)
-        elif child.get("type") == "figure":
-            figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
+    # Lists and quotes are walked with an explicit stack so that the nesting depth of
+    # a document is not limited by the interpreter's recursion limit.
+    stack = [_container_frame(node, 0)]
+    while stack:
+        parent, children, quote_depth = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+        elif child.type in {"list", "blockquote"}:
+            stack.append(_container_frame(child, quote_depth))
+        elif isinstance(parent, ListNode):
+            _add_list_child(doc, parent, child, config, center_tab, right_tab, figure_state)
+        else:
+            _add_blockquote_child(doc, child, quote_depth, config, center_tab, right_tab, figure_state)
 
 
 def _cell_alignment(align: str):
@@ -443,8 +532,8 @@ def _apply_header_bottom_border(row) -> None:
 
 
 def _add_table(doc, node: Node) -> None:
-    header = node.get("header", [])
-    rows = node.get("rows", [])
+    header = node.header
+    rows = node.rows
     if not header:
         return
     table = doc.add_table(rows=1 + len(rows), cols=len(header))
@@ -455,14 +544,14 @@ def _add_table(doc, node: Node) -> None:
         table.style = "Table Grid"
     _apply_three_line_table(table)
 
-    all_rows = [header] + rows
+    all_rows: list[list[Cell]] = [header] + rows
     for r_idx, row in enumerate(all_rows):
         for c_idx, cell in enumerate(row):
             cell_obj = table.cell(r_idx, c_idx)
             cell_obj.text = ""
             paragraph = cell_obj.paragraphs[0]
-            runs = _trim_leading_text_runs(cell.get("runs", []))
-            fallback_text = (cell.get("text") or "").lstrip()
+            runs = _trim_leading_text_runs(cell.runs)
+            fallback_text = cell.text.lstrip()
             paragraph.paragraph_format.left_indent = Pt(0)
             paragraph.paragraph_format.right_indent = Pt(0)
             paragraph.paragraph_format.first_line_indent = Pt(0)
@@ -473,8 +562,28 @@ def _add_table(doc, node: Node) -> None:
             _apply_header_bottom_border(table.rows[r_idx])
 
 
-def build_docx(ast: list[Node], output_path, config: FormatConfig | None = None) -> None:
+def build_docx(
+    ast: Iterable[AstNode | Node],
+    output_path,
+    config: FormatConfig | None = None,
+    *,
+    math_workers: int | None = None,
+    math_cache_path: str | None = None,
+    math_budget: MathBudget | None = DEFAULT_MATH_BUDGET,
+) -> list[str]:
     config = config or FormatConfig()
+    nodes: Iterable[Node] = coerce_ast(ast)
+    rejected: list[str] = []
+    # Formulas are prepared up front only for an AST already held in memory;
+    # streamed nodes are not collected, and their formulas convert as they are
+    # reached. With a math budget uncached formulas convert in the process pool,
+    # where one over the budget is abandoned.
+    workers = math_workers if math_workers is not None else (os.cpu_count() or 1)
+    if isinstance(ast, (list, tuple)) and (workers > 1 or math_cache_path or math_budget is not None):
+        nodes = list(nodes)
+        store = get_omml_store(math_cache_path) if math_cache_path else None
+        prepared = prepare_formulas(collect_formulas(nodes), workers=workers, store=store, budget=math_budget)
+        rejected = prepared.rejected
     doc = Document()
 
     section = doc.sections[0]
@@ -540,13 +649,14 @@ def build_docx(ast: list[Node], output_path, config: FormatConfig | None = None)
 
     figure_state = {"index": 1}
 
-    for node in ast:
-        if node.get("type") == "heading":
-            paragraph = doc.add_heading("", level=node.get("level", 1))
-            _add_runs(paragraph, node.get("runs", []), node.get("text", ""))
-        elif node.get("type") == "paragraph":
+    for node in nodes:
+        ntype = node.type
+        if ntype == "heading":
+            paragraph = doc.add_heading("", level=node.level)
+            _add_runs(paragraph, node.runs, node.text)
+        elif ntype == "paragraph":
             paragraph = doc.add_paragraph("")
-            _add_runs(paragraph, node.get("runs", []), node.get("text", ""))
+            _add_runs(paragraph, node.runs, node.text)
             if config.body_style.justify:
                 paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
             paragraph.paragraph_format.left_indent = _chars_to_pt(
@@ -558,18 +668,20 @@ def build_docx(ast: list[Node], output_path, config: FormatConfig | None = None)
             paragraph.paragraph_format.first_line_indent = _chars_to_pt(
                 config.body_style.first_line_indent_chars, config.body_style.size_pt
             )
-        elif node.get("type") == "list":
-            _add_list(doc, node, config, center_tab, right_tab, figure_state)
-        elif node.get("type") == "table":
+        elif ntype == "list":
+            _add_nested(doc, node, config, center_tab, right_tab, figure_state)
+        elif ntype == "table":
             _add_table(doc, node)
-        elif node.get("type") == "math_block":
+        elif ntype == "math_block":
             paragraph = doc.add_paragraph("")
-            _add_math_block(paragraph, node.get("latex", ""), center_tab, right_tab)
-        elif node.get("type") == "code_block":
+            _add_math_block(paragraph, node.latex, center_tab, right_tab)
+        elif ntype == "code_block":
             _add_code_block(doc, node)
-        elif node.get("type") == "blockquote":
-            _add_blockquote(doc, node, config, center_tab, right_tab, figure_state)
-        elif node.get("type") == "figure":
+        elif ntype == "blockquote":
+            _add_nested(doc, node, config, center_tab, right_tab, figure_state)
+        elif ntype == "figure":
             figure_state["index"] = _add_figure(doc, node, config, figure_state["index"])
 
     doc.save(output_path)
+    # Formulas rendered as LaTeX text because they were over the math budget.
+    return rejected
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+
+from markdown_it.rules_core import StateCore
+
+from formatter.ast_nodes import Node, ast_to_dicts
+from formatter.markdown_parser import (
+    AstNode,
+    _detect_profile,
+    _normalize_math_blocks,
+    _parse_blocks,
+    _split_core_rules,
+    _top_level_blocks,
+    get_markdown_it,
+)
+
+BlockEntry = tuple[list[Node], str]
+
+DEFAULT_MAX_BLOCKS = 4096
+
+
+def _references_signature(env: dict[str, Any]) -> str:
+    references = env.get("references") or {}
+    if not references:
+        return ""
+    return repr(sorted((label, sorted(ref.items())) for label, ref in references.items()))
+
+
+class IncrementalParser:
+    def __init__(self, max_blocks: int = DEFAULT_MAX_BLOCKS) -> None:
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self._blocks: OrderedDict[str, BlockEntry] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._blocks)}
+
+    def parse(
+        self, text: str, *, compact: bool = False, normalized: bool = False
+    ) -> tuple[list[AstNode] | list[Node], str]:
+        ast, html = self._parse_nodes(text if normalized else _normalize_math_blocks(text))
+        return (ast if compact else ast_to_dicts(ast)), html
+
+    def _parse_nodes(self, text: str) -> tuple[list[Node], str]:
+        profile = _detect_profile(text)
+        md = get_markdown_it(text)
+        env: dict[str, Any] = {}
+
+        if profile[1]:
+            # Footnote refs resolve against definitions anywhere in the document and the
+            # footnote section is appended at the end, so these documents parse in full.
+            tokens = md.parse(text, env)
+            ast, _ = _parse_blocks(tokens, 0)
+            return ast, md.renderer.render(tokens, md.options, env)
+
+        head_rules, tail_rules = _split_core_rules(md)
+        state = StateCore(text, md, env)
+        for rule in head_rules:
+            rule(state)
+
+        lines = state.src.split("\n")
+        references = _references_signature(env)
+        profile_tag = "".join("1" if flag else "0" for flag in profile)
+
+        ast: list[Node] = []
+        html_parts: list[str] = []
+        for start, end in _top_level_blocks(state.tokens):
+            block_tokens = state.tokens[start:end]
+            line_map = block_tokens[0].map
+            source = "\n".join(lines[line_map[0] : line_map[1]]) if line_map else ""
+            # A last line without "\n" renders differently for html_block and fence.
+            unterminated = bool(line_map) and line_map[1] >= len(lines)
+            key = self._block_key(profile_tag, source, references, unterminated)
+
+            entry = self._lookup(key) if line_map else None
+            if entry is None:
+                block_state = StateCore(state.src, md, env, block_tokens)
+                for rule in tail_rules:
+                    rule(block_state)
+                nodes, _ = _parse_blocks(block_tokens, 0)
+                entry = (nodes, md.renderer.render(block_tokens, md.options, env))
+                if line_map:
+                    self._store(key, entry)
+
+            ast.extend(entry[0])
+            html_parts.append(entry[1])
+
+        return ast, "".join(html_parts)
+
+    def _block_key(self, profile_tag: str, source: str, references: str, unterminated: bool) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(profile_tag.encode("ascii"))
+        digest.update(b"$" if unterminated else b"\n")
+        digest.update(source.encode("utf-8"))
+        if references and "[" in source:
+            digest.update(b"\0")
+            digest.update(references.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _lookup(self, key: str) -> BlockEntry | None:
+        with self._lock:
+            entry = self._blocks.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key: str, entry: BlockEntry) -> None:
+        with self._lock:
+            self._blocks[key] = entry
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable
 from xml.sax.saxutils import escape
 
 from latex2mathml.converter import convert as latex_to_mathml
 from mathml2omml import convert as mathml_to_omml
 
+from formatter.omml_direct import direct_latex_to_omml
+
 MATHML_NS = "http://www.w3.org/1998/Math/MathML"
 OMML_NS = "http://schemas.openxmlformats.org/officeDocument/2006/math"
 ALIGNED_PATTERN = re.compile(
@@ -13,6 +18,14 @@ ALIGNED_PATTERN = re.compile(
     re.DOTALL,
 )
 
+DEFAULT_MAX_FORMULAS = 4096
+# Bump when latex_to_omml output changes so persisted conversions stop matching.
+CONVERTER_VERSION = "2"
+# Cached in place of OMML for formulas that exceeded the conversion budget, and
+# for formulas a prepare stage already failed to convert.
+_OVER_BUDGET = ""
+_FAILED = "\0"
+
 
 def _extract_mathml_body(mathml: str) -> str:
     match = re.search(r"<math[^>]*>(.*)</math>", mathml, flags=re.DOTALL)
@@ -70,6 +83,14 @@ def _convert_aligned_to_mathml(latex: str) -> str | None:
 
 
 def latex_to_omml(latex: str) -> str:
+    omml = direct_latex_to_omml(latex)
+    if omml is not None:
+        return omml
+    return mathml_latex_to_omml(latex)
+
+
+def mathml_latex_to_omml(latex: str) -> str:
+    # The latex2mathml -> mathml2omml chain, for everything the direct converter declines.
     aligned_mathml = _convert_aligned_to_mathml(latex)
     if aligned_mathml is not None:
         return _ensure_omml_namespace(mathml_to_omml(aligned_mathml))
@@ -85,3 +106,70 @@ def _ensure_omml_namespace(omml: str) -> str:
         f'<m:oMath xmlns:m="{OMML_NS}"',
         1,
     )
+
+
+class OmmlCache:
+    # Reports repeat the same symbols constantly, so each distinct LaTeX source is
+    # converted once per process. Failed conversions are only stored when a prepare
+    # stage marks them, so the builder does not run them again.
+    def __init__(self, max_entries: int = DEFAULT_MAX_FORMULAS) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def missing(self, sources: Iterable[str]) -> list[str]:
+        with self._lock:
+            return [latex for latex in sources if latex not in self._entries]
+
+    def rejected(self, sources: Iterable[str]) -> list[str]:
+        with self._lock:
+            return [latex for latex in sources if self._entries.get(latex) == _OVER_BUDGET]
+
+    def reject(self, latex: str) -> None:
+        # Later conversions of this formula fail fast instead of running again.
+        self.put(latex, _OVER_BUDGET)
+
+    def fail(self, latex: str) -> None:
+        self.put(latex, _FAILED)
+
+    def put(self, latex: str, omml: str) -> None:
+        with self._lock:
+            self._entries[latex] = omml
+            self._entries.move_to_end(latex)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def convert(self, latex: str) -> str:
+        with self._lock:
+            omml = self._entries.get(latex)
+            if omml is not None:
+                self._entries.move_to_end(latex)
+                self.hits += 1
+                if omml == _OVER_BUDGET:
+                    raise ValueError("formula exceeded the conversion budget")
+                if omml == _FAILED:
+                    raise ValueError("formula could not be converted")
+                return omml
+            self.misses += 1
+        omml = latex_to_omml(latex)
+        self.put(latex, omml)
+        return omml
+
+
+_OMML_CACHE = OmmlCache()
+
+
+def cached_latex_to_omml(latex: str) -> str:
+    return _OMML_CACHE.convert(latex)
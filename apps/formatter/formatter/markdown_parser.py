@@ -1,278 +1,275 @@
 from __future__ import annotations
 
-from typing import Any
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Iterator
 
 from markdown_it import MarkdownIt
+from markdown_it.rules_core import StateCore
+from markdown_it.token import Token
 from mdit_py_plugins.dollarmath.index import dollarmath_plugin
 from mdit_py_plugins.footnote.index import footnote_plugin
 from mdit_py_plugins.tasklists import tasklists_plugin
 
+from formatter.ast_nodes import (
+    BOLD,
+    CODE,
+    HIGHLIGHT,
+    ITALIC,
+    LINK,
+    STRIKE,
+    SUBSCRIPT,
+    SUPERSCRIPT,
+    Blockquote,
+    Cell,
+    CodeBlock,
+    Figure,
+    Heading,
+    InlineRun,
+    ListNode,
+    MathBlock,
+    MathRun,
+    Node,
+    Paragraph,
+    Run,
+    Table,
+    ast_to_dicts,
+    heading_level,
+    runs_text,
+)
+
 AstNode = dict[str, Any]
 RunNode = dict[str, Any]
 
-STYLE_KEYS = (
-    "bold",
-    "italic",
-    "strike",
-    "highlight",
-    "superscript",
-    "subscript",
-    "code",
-    "link",
-)
+def _append_run(runs: list[InlineRun], text: str, style: int, force_new: bool = False) -> None:
+    if not text:
+        return
+    if not force_new and runs:
+        last = runs[-1]
+        if type(last) is Run and last.style == style:
+            last.text += text
+            return
+    runs.append(Run(text, style))
 
 
-def _default_style() -> dict[str, bool]:
-    return {key: False for key in STYLE_KEYS}
+_MARKER_START_RE = re.compile(r"[\^~]|=(?==)")
+_MARKER_STYLES = {"=": HIGHLIGHT, "^": SUPERSCRIPT, "~": SUBSCRIPT}
 
 
-def _style_key(style: dict[str, bool]) -> tuple[bool, ...]:
-    return tuple(style.get(key, False) for key in STYLE_KEYS)
+def _next_position(positions: list[int], start: int) -> int:
+    idx = bisect_left(positions, start)
+    return positions[idx] if idx < len(positions) else -1
 
 
-def _append_run(runs: list[RunNode], text: str, style: dict[str, bool], force_new: bool = False) -> None:
-    if not text:
+def _emit_text_with_markers(text: str, base_style: int, runs: list[InlineRun]) -> None:
+    if "^" not in text and "~" not in text and "==" not in text:
+        _append_run(runs, text, base_style)
         return
-    if not force_new and runs and runs[-1].get("type") != "math" and _style_key(runs[-1]) == _style_key(style):
-        runs[-1]["text"] += text
-    else:
-        run: RunNode = {"text": text}
-        run.update(style)
-        runs.append(run)
-
-
-def _plain_run(text: str) -> RunNode:
-    run: RunNode = {"text": text}
-    run.update(_default_style())
-    return run
 
+    starts = [match.start() for match in _MARKER_START_RE.finditer(text)]
+    positions: dict[str, list[int]] = {"=": [], "^": [], "~": []}
+    for pos in starts:
+        positions[text[pos]].append(pos)
 
-def _emit_text_with_markers(text: str, base_style: dict[str, bool], runs: list[RunNode]) -> None:
     idx = 0
+    k = 0
     length = len(text)
     while idx < length:
-        if text.startswith("==", idx):
-            end = text.find("==", idx + 2)
-            if end != -1:
-                segment = text[idx + 2 : end]
-                if segment:
-                    style = base_style.copy()
-                    style["highlight"] = True
-                    _append_run(runs, segment, style)
-                idx = end + 2
-                continue
-        if text.startswith("^", idx):
-            end = text.find("^", idx + 1)
-            if end != -1:
-                segment = text[idx + 1 : end]
-                if segment:
-                    style = base_style.copy()
-                    style["superscript"] = True
-                    _append_run(runs, segment, style)
-                idx = end + 1
-                continue
-        if text.startswith("~", idx):
-            end = text.find("~", idx + 1)
-            if end != -1:
-                segment = text[idx + 1 : end]
-                if segment:
-                    style = base_style.copy()
-                    style["subscript"] = True
-                    _append_run(runs, segment, style)
-                idx = end + 1
-                continue
-        next_starts_marker = False
-        if idx + 1 < length:
-            next_char = text[idx + 1]
-            if next_char in {"^", "~"} or text.startswith("==", idx + 1):
-                next_starts_marker = True
-        _append_run(runs, text[idx], base_style, force_new=next_starts_marker)
-        idx += 1
+        while k < len(starts) and starts[k] < idx:
+            k += 1
+        if k == len(starts):
+            _append_run(runs, text[idx:], base_style)
+            return
 
+        pos = starts[k]
+        if pos > idx:
+            _append_run(runs, text[idx : pos - 1], base_style)
+            _append_run(runs, text[pos - 1], base_style, force_new=True)
 
-def _build_inline_runs(token) -> tuple[str, list[RunNode]]:
-    runs: list[RunNode] = []
-    style = _default_style()
-    link_stack: list[str] = []
-
-    for child in token.children or []:
-        if child.type == "link_open":
-            link_stack.append(child.attrGet("href") or "")
-            continue
-        if child.type == "link_close":
-            href = link_stack.pop() if link_stack else ""
-            if href:
-                _append_run(runs, f" ({href})", style)
-            continue
-        if child.type == "strong_open":
-            style["bold"] = True
-            continue
-        if child.type == "strong_close":
-            style["bold"] = False
-            continue
-        if child.type == "em_open":
-            style["italic"] = True
-            continue
-        if child.type == "em_close":
-            style["italic"] = False
-            continue
-        if child.type in {"s_open", "strike_open"}:
-            style["strike"] = True
-            continue
-        if child.type in {"s_close", "strike_close"}:
-            style["strike"] = False
-            continue
-        if child.type in {"softbreak", "hardbreak"}:
-            _append_run(runs, " ", style)
-            continue
-        if child.type == "code_inline":
-            code_style = style.copy()
-            code_style["code"] = True
-            _append_run(runs, child.content, code_style)
-            continue
-        if child.type == "math_inline":
-            runs.append({"type": "math", "latex": child.content})
-            continue
-        if child.type == "footnote_ref":
-            label = str((child.meta or {}).get("label") or "").strip()
-            if label:
-                footnote_style = style.copy()
-                footnote_style["superscript"] = True
-                _append_run(runs, f"[{label}]", footnote_style, force_new=True)
-            continue
-        if child.type == "html_inline" and "task-list-item-checkbox" in (child.content or ""):
+        marker = text[pos]
+        width = 2 if marker == "=" else 1
+        end = _next_position(positions[marker], pos + width)
+        if end != -1:
+            segment = text[pos + width : end]
+            if segment:
+                _append_run(runs, segment, base_style | _MARKER_STYLES[marker])
+            idx = end + width
             continue
 
-        text_style = style.copy()
-        if link_stack:
-            text_style["link"] = True
+        next_starts_marker = k + 1 < len(starts) and starts[k + 1] == pos + 1
+        _append_run(runs, marker, base_style, force_new=next_starts_marker)
+        idx = pos + 1
 
-        if child.type == "text":
-            _emit_text_with_markers(child.content, text_style, runs)
-            continue
-        if child.content:
-            _emit_text_with_markers(child.content, text_style, runs)
 
-    text = "".join(run.get("text", "") for run in runs if run.get("type") != "math").strip()
-    return text, runs
+class _InlineState:
+    __slots__ = ("runs", "style", "link_stack", "nodes", "task_checked", "split_blocks")
 
+    def __init__(self, split_blocks: bool) -> None:
+        self.runs: list[InlineRun] = []
+        self.style = 0
+        self.link_stack: list[str] = []
+        self.nodes: list[Node] = []
+        self.task_checked: bool | None = None
+        self.split_blocks = split_blocks
 
-def _flush_inline_paragraph(
-    nodes: list[AstNode], runs: list[RunNode], task_checked: bool | None = None
-) -> None:
-    if not runs:
+    def flush(self) -> None:
+        _flush_inline_paragraph(self.nodes, self.runs, self.task_checked)
+        self.runs = []
+        self.task_checked = None
+
+
+InlineHandler = Callable[[_InlineState, Token], None]
+
+_INLINE_STYLE_FLAGS: dict[str, int] = {
+    "strong_open": BOLD,
+    "strong_close": BOLD,
+    "em_open": ITALIC,
+    "em_close": ITALIC,
+    "s_open": STRIKE,
+    "s_close": STRIKE,
+    "strike_open": STRIKE,
+    "strike_close": STRIKE,
+}
+
+
+def _handle_text(state: _InlineState, child: Token) -> None:
+    if child.content:
+        style = state.style | LINK if state.link_stack else state.style
+        _emit_text_with_markers(child.content, style, state.runs)
+
+
+def _handle_link_open(state: _InlineState, child: Token) -> None:
+    state.link_stack.append(child.attrGet("href") or "")
+
+
+def _handle_link_close(state: _InlineState, child: Token) -> None:
+    href = state.link_stack.pop() if state.link_stack else ""
+    if href:
+        _append_run(state.runs, f" ({href})", state.style)
+
+
+def _handle_break(state: _InlineState, child: Token) -> None:
+    _append_run(state.runs, " ", state.style)
+
+
+def _handle_code_inline(state: _InlineState, child: Token) -> None:
+    _append_run(state.runs, child.content, state.style | CODE)
+
+
+def _handle_math_inline(state: _InlineState, child: Token) -> None:
+    state.runs.append(MathRun(child.content))
+
+
+def _handle_footnote_ref(state: _InlineState, child: Token) -> None:
+    meta = child.meta or {}
+    label = str(meta.get("label") or "").strip()
+    if not label and "id" in meta:
+        # Inline ^[...] footnotes have no label; number them as the footnote section does.
+        label = str(int(meta["id"]) + 1)
+    if label:
+        _append_run(state.runs, f"[{label}]", state.style | SUPERSCRIPT, force_new=True)
+
+
+def _handle_html_inline(state: _InlineState, child: Token) -> None:
+    content = child.content or ""
+    if "task-list-item-checkbox" in content:
+        if state.split_blocks:
+            state.task_checked = "checked" in content
+        return
+    _handle_text(state, child)
+
+
+def _handle_image(state: _InlineState, child: Token) -> None:
+    if not state.split_blocks:
+        _handle_text(state, child)
+        return
+    state.flush()
+    src = (child.attrGet("src") or "").strip()
+    if not src:
         return
-    text = "".join(run.get("text", "") for run in runs if run.get("type") != "math").strip()
-    paragraph: AstNode = {
-        "type": "paragraph",
-        "text": text,
-        "runs": runs or [{"text": text, **_default_style()}],
-    }
-    if task_checked is not None:
-        paragraph["task"] = True
-        paragraph["checked"] = task_checked
-    nodes.append(paragraph)
-
-
-def _build_inline_nodes(token) -> list[AstNode]:
-    nodes: list[AstNode] = []
-    runs: list[RunNode] = []
-    style = _default_style()
-    task_checked: bool | None = None
-    link_stack: list[str] = []
+    alt = (child.content or "").strip()
+    caption = (child.attrGet("title") or "").strip() or alt
+    state.nodes.append(Figure(src, alt, caption))
 
+
+def _handle_math_inline_double(state: _InlineState, child: Token) -> None:
+    if not state.split_blocks:
+        state.runs.append(MathRun(child.content.strip()))
+        return
+    state.flush()
+    state.nodes.append(MathBlock(child.content.strip()))
+
+
+_INLINE_HANDLERS: dict[str, InlineHandler] = {
+    "text": _handle_text,
+    "link_open": _handle_link_open,
+    "link_close": _handle_link_close,
+    "softbreak": _handle_break,
+    "hardbreak": _handle_break,
+    "code_inline": _handle_code_inline,
+    "math_inline": _handle_math_inline,
+    "math_inline_double": _handle_math_inline_double,
+    "footnote_ref": _handle_footnote_ref,
+    "html_inline": _handle_html_inline,
+    "image": _handle_image,
+}
+
+
+def _walk_inline(token, split_blocks: bool) -> _InlineState:
+    state = _InlineState(split_blocks)
+    handlers = _INLINE_HANDLERS
+    style_flags = _INLINE_STYLE_FLAGS
+    style = 0
     for child in token.children or []:
-        if child.type == "link_open":
-            link_stack.append(child.attrGet("href") or "")
-            continue
-        if child.type == "link_close":
-            href = link_stack.pop() if link_stack else ""
-            if href:
-                _append_run(runs, f" ({href})", style)
-            continue
-        if child.type == "strong_open":
-            style["bold"] = True
-            continue
-        if child.type == "strong_close":
-            style["bold"] = False
-            continue
-        if child.type == "em_open":
-            style["italic"] = True
-            continue
-        if child.type == "em_close":
-            style["italic"] = False
-            continue
-        if child.type in {"s_open", "strike_open"}:
-            style["strike"] = True
-            continue
-        if child.type in {"s_close", "strike_close"}:
-            style["strike"] = False
-            continue
-        if child.type in {"softbreak", "hardbreak"}:
-            _append_run(runs, " ", style)
-            continue
-        if child.type == "code_inline":
-            code_style = style.copy()
-            code_style["code"] = True
-            _append_run(runs, child.content, code_style)
-            continue
-        if child.type == "math_inline":
-            runs.append({"type": "math", "latex": child.content})
-            continue
-        if child.type == "footnote_ref":
-            label = str((child.meta or {}).get("label") or "").strip()
-            if label:
-                footnote_style = style.copy()
-                footnote_style["superscript"] = True
-                _append_run(runs, f"[{label}]", footnote_style, force_new=True)
+        ctype = child.type
+        if ctype == "text":
+            content = child.content
+            if not content:
+                continue
+            text_style = style | LINK if state.link_stack else style
+            if "^" in content or "~" in content or "==" in content:
+                _emit_text_with_markers(content, text_style, state.runs)
+                continue
+            runs = state.runs
+            last = runs[-1] if runs else None
+            if type(last) is Run and last.style == text_style:
+                last.text += content
+            else:
+                runs.append(Run(content, text_style))
             continue
-        if child.type == "html_inline" and "task-list-item-checkbox" in (child.content or ""):
-            task_checked = "checked" in (child.content or "")
+        flag = style_flags.get(ctype)
+        if flag is not None:
+            style = style | flag if child.nesting == 1 else style & ~flag
             continue
-        if child.type == "image":
-            _flush_inline_paragraph(nodes, runs, task_checked)
-            runs = []
-            task_checked = None
+        state.style = style
+        handlers.get(ctype, _handle_text)(state, child)
+    return state
 
-            src = (child.attrGet("src") or "").strip()
-            if not src:
-                continue
 
-            alt = (child.content or "").strip()
-            caption = (child.attrGet("title") or "").strip() or alt
-            nodes.append(
-                {
-                    "type": "figure",
-                    "src": src,
-                    "alt": alt,
-                    "caption": caption,
-                }
-            )
-            continue
-        if child.type == "math_inline_double":
-            _flush_inline_paragraph(nodes, runs, task_checked)
-            runs = []
-            task_checked = None
-            nodes.append({"type": "math_block", "latex": child.content.strip()})
-            continue
+def _build_inline_runs(token) -> tuple[str, list[InlineRun]]:
+    runs = _walk_inline(token, split_blocks=False).runs
+    return runs_text(runs), runs
 
-        text_style = style.copy()
-        if link_stack:
-            text_style["link"] = True
 
-        if child.type == "text":
-            _emit_text_with_markers(child.content, text_style, runs)
-            continue
-        if child.content:
-            _emit_text_with_markers(child.content, text_style, runs)
+def _flush_inline_paragraph(
+    nodes: list[Node], runs: list[InlineRun], task_checked: bool | None = None
+) -> None:
+    if not runs:
+        return
+    nodes.append(Paragraph(runs_text(runs), runs, task_checked))
 
-    _flush_inline_paragraph(nodes, runs, task_checked)
-    return nodes
 
+def _build_inline_nodes(token) -> list[Node]:
+    state = _walk_inline(token, split_blocks=True)
+    state.flush()
+    return state.nodes
 
-def _parse_table(tokens, i: int) -> tuple[AstNode, int]:
-    header: list[AstNode] = []
-    rows: list[list[AstNode]] = []
+
+def _parse_table(tokens, i: int) -> tuple[Node, int]:
+    header: list[Cell] = []
+    rows: list[list[Cell]] = []
     align: list[str] = []
     i += 1
     while i < len(tokens):
@@ -288,7 +285,7 @@ def _parse_table(tokens, i: int) -> tuple[AstNode, int]:
             continue
         if token.type == "tr_open":
             i += 1
-            cells: list[AstNode] = []
+            cells: list[Cell] = []
             while tokens[i].type != "tr_close":
                 if tokens[i].type in {"th_open", "td_open"}:
                     cell_token = tokens[i]
@@ -303,7 +300,7 @@ def _parse_table(tokens, i: int) -> tuple[AstNode, int]:
                     i += 1
                     inline = tokens[i]
                     text, runs = _build_inline_runs(inline)
-                    cells.append({"text": text, "runs": runs})
+                    cells.append(Cell(text, runs))
                     i += 1
                 else:
                     i += 1
@@ -319,158 +316,141 @@ def _parse_table(tokens, i: int) -> tuple[AstNode, int]:
         align = ["left"] * (len(header) if header else 0)
     else:
         align = align[: len(header)]
-    return {"type": "table", "align": align, "header": header, "rows": rows}, i
-
+    return Table(align, header, rows), i
 
-def _parse_footnote_block(tokens, i: int) -> tuple[list[AstNode], int]:
-    nodes: list[AstNode] = []
-    footnotes: list[AstNode] = []
-    i += 1
 
-    while i < len(tokens):
-        token = tokens[i]
-        if token.type == "footnote_block_close":
-            i += 1
-            break
-
-        if token.type != "footnote_open":
-            i += 1
-            continue
+def _append_footnote_entry(footnotes: list[Node], label: str, entry_nodes: list[Node]) -> None:
+    if not entry_nodes:
+        footnotes.append(Paragraph(f"[{label}]", [Run(f"[{label}]")]))
+        return
 
-        meta = token.meta or {}
-        label = str(meta.get("label") or "").strip()
-        if not label:
-            label = str(int(meta.get("id", len(footnotes))) + 1)
+    first = entry_nodes[0]
+    if isinstance(first, Paragraph):
+        prefix = f"[{label}] "
+        first.text = f"{prefix}{first.text.strip()}".strip()
+        first.runs = [Run(prefix)] + first.runs
+    else:
+        entry_nodes.insert(0, Paragraph(f"[{label}]", [Run(f"[{label}]")]))
 
-        i += 1
-        entry_nodes, i = _parse_blocks(tokens, i, stop={"footnote_close"})
-        if i < len(tokens) and tokens[i].type == "footnote_close":
-            i += 1
+    footnotes.extend(entry_nodes)
 
-        if not entry_nodes:
-            footnotes.append(
-                {
-                    "type": "paragraph",
-                    "text": f"[{label}]",
-                    "runs": [_plain_run(f"[{label}]")],
-                }
-            )
-            continue
 
-        first = entry_nodes[0]
-        if first.get("type") == "paragraph":
-            prefix = f"[{label}] "
-            first["text"] = f"{prefix}{first.get('text', '').strip()}".strip()
-            first["runs"] = [_plain_run(prefix)] + first.get("runs", [])
-        else:
-            entry_nodes.insert(
-                0,
-                {
-                    "type": "paragraph",
-                    "text": f"[{label}]",
-                    "runs": [_plain_run(f"[{label}]")],
-                },
-            )
+class _BlockFrame:
+    __slots__ = ("kind", "nodes", "list_level", "node", "label")
 
-        footnotes.extend(entry_nodes)
+    def __init__(
+        self,
+        kind: str,
+        nodes: list[Node],
+        list_level: int,
+        node: ListNode | None = None,
+        label: str = "",
+    ) -> None:
+        self.kind = kind
+        self.nodes = nodes
+        self.list_level = list_level
+        self.node = node
+        self.label = label
 
-    if footnotes:
-        nodes.append(
-            {
-                "type": "heading",
-                "level": 1,
-                "text": "脚注",
-                "runs": [_plain_run("脚注")],
-            }
-        )
-        nodes.extend(footnotes)
 
-    return nodes, i
+_FRAME_CLOSE = {
+    "blockquote": "blockquote_close",
+    "list_item": "list_item_close",
+    "footnote": "footnote_close",
+}
+_LIST_OPEN = {"bullet_list_open", "ordered_list_open"}
+_LIST_CLOSE = {"bullet_list_close", "ordered_list_close"}
 
 
 def _parse_blocks(
     tokens, i: int, stop: set[str] | None = None, list_level: int = 0
-) -> tuple[list[AstNode], int]:
-    ast: list[AstNode] = []
+) -> tuple[list[Node], int]:
+    # Containers are tracked on an explicit stack rather than by recursion, so the
+    # nesting depth of quotes and lists is bounded by memory, not the interpreter.
+    ast: list[Node] = []
+    stack = [_BlockFrame("root", ast, list_level)]
     while i < len(tokens):
         token = tokens[i]
-        if stop and token.type in stop:
-            break
-        if token.type == "heading_open":
-            level = max(1, min(4, int(token.tag[1]) - 1))
+        ttype = token.type
+        frame = stack[-1]
+        kind = frame.kind
+
+        if kind == "list":
+            if ttype in _LIST_CLOSE:
+                stack.pop()
+            elif ttype == "list_item_open":
+                item: list[Node] = []
+                frame.node.items.append(item)  # type: ignore[union-attr]
+                stack.append(_BlockFrame("list_item", item, frame.list_level))
+            i += 1
+            continue
+        if kind == "footnotes":
+            if ttype == "footnote_block_close":
+                stack.pop()
+                if frame.nodes:
+                    parent = stack[-1].nodes
+                    parent.append(Heading(1, "脚注", [Run("脚注")]))
+                    parent.extend(frame.nodes)
+            elif ttype == "footnote_open":
+                meta = token.meta or {}
+                label = str(meta.get("label") or "").strip()
+                if not label:
+                    label = str(int(meta.get("id", len(frame.nodes))) + 1)
+                stack.append(_BlockFrame("footnote", [], 0, label=label))
+            i += 1
+            continue
+        if kind == "root":
+            if stop and ttype in stop:
+                break
+        elif ttype == _FRAME_CLOSE[kind]:
+            stack.pop()
+            if kind == "footnote":
+                _append_footnote_entry(stack[-1].nodes, frame.label, frame.nodes)
+            i += 1
+            continue
+
+        nodes = frame.nodes
+        if ttype == "heading_open":
+            level = heading_level(int(token.tag[1]))
             text_token = tokens[i + 1]
             text, runs = _build_inline_runs(text_token)
-            ast.append(
-                {
-                    "type": "heading",
-                    "level": level,
-                    "text": text,
-                    "runs": runs or [{"text": text, **_default_style()}],
-                }
-            )
+            nodes.append(Heading(level, text, runs or [Run(text)]))
             i += 3
             continue
-        if token.type == "blockquote_open":
+        if ttype == "blockquote_open":
+            children: list[Node] = []
+            nodes.append(Blockquote(children))
+            stack.append(_BlockFrame("blockquote", children, frame.list_level))
             i += 1
-            children, i = _parse_blocks(tokens, i, stop={"blockquote_close"}, list_level=list_level)
-            ast.append({"type": "blockquote", "children": children})
-            if i < len(tokens) and tokens[i].type == "blockquote_close":
-                i += 1
             continue
-        if token.type == "paragraph_open":
+        if ttype == "paragraph_open":
             text_token = tokens[i + 1]
-            nodes = _build_inline_nodes(text_token)
-            ast.extend(nodes)
+            nodes.extend(_build_inline_nodes(text_token))
             i += 3
             continue
-        if token.type in {"bullet_list_open", "ordered_list_open"}:
-            ordered = token.type == "ordered_list_open"
+        if ttype in _LIST_OPEN:
+            ordered = ttype == "ordered_list_open"
             start = int(token.attrGet("start") or 1)
-            current_level = list_level + 1
-            i += 1
-            items: list[list[AstNode]] = []
-            while i < len(tokens) and tokens[i].type not in {"bullet_list_close", "ordered_list_close"}:
-                if tokens[i].type == "list_item_open":
-                    i += 1
-                    item_nodes, i = _parse_blocks(tokens, i, stop={"list_item_close"}, list_level=current_level)
-                    items.append(item_nodes)
-                    i += 1
-                    continue
-                i += 1
+            current_level = frame.list_level + 1
+            list_node = ListNode(ordered, current_level, start, [])
+            nodes.append(list_node)
+            stack.append(_BlockFrame("list", nodes, current_level, node=list_node))
             i += 1
-            ast.append(
-                {
-                    "type": "list",
-                    "ordered": ordered,
-                    "level": current_level,
-                    "start": start,
-                    "items": items,
-                }
-            )
             continue
-        if token.type == "table_open":
+        if ttype == "table_open":
             table_node, i = _parse_table(tokens, i)
-            ast.append(table_node)
-            continue
-        if token.type == "footnote_block_open":
-            footnote_nodes, i = _parse_footnote_block(tokens, i)
-            ast.extend(footnote_nodes)
+            nodes.append(table_node)
             continue
-        if token.type == "math_block":
-            ast.append({"type": "math_block", "latex": token.content.strip()})
+        if ttype == "footnote_block_open":
+            stack.append(_BlockFrame("footnotes", [], 0))
             i += 1
             continue
-        if token.type in {"fence", "code_block"}:
-            ast.append(
-                {
-                    "type": "code_block",
-                    "text": token.content.rstrip("\n"),
-                    "info": (token.info or "").strip(),
-                }
-            )
+        if ttype == "math_block":
+            nodes.append(MathBlock(token.content.strip()))
             i += 1
             continue
-        if token.type == "hr":
+        if ttype in {"fence", "code_block"}:
+            nodes.append(CodeBlock(token.content.rstrip("\n"), (token.info or "").strip()))
             i += 1
             continue
         i += 1
@@ -498,24 +478,144 @@ def _normalize_math_blocks(text: str) -> str:
     return "\n".join(normalized)
 
 
-def _build_markdown_it() -> MarkdownIt:
-    md = MarkdownIt("commonmark")
+MarkdownProfile = tuple[bool, bool, bool]
+
+_FULL_PROFILE: MarkdownProfile = (True, True, True)
+_TASK_MARKERS = ("[ ]", "[x]", "[X]")
+_MARKDOWN_IT_CACHE: dict[MarkdownProfile, MarkdownIt] = {}
+_MARKDOWN_IT_LOCK = Lock()
+# The commonmark preset stops nesting at 20 levels and flattens the rest into text.
+# markdown-it's own block rules still recurse, so stay well under the interpreter limit.
+MAX_NESTING = 100
+
+
+def _detect_profile(text: str) -> MarkdownProfile:
+    return (
+        "$" in text,
+        "[^" in text or "^[" in text,
+        any(marker in text for marker in _TASK_MARKERS),
+    )
+
+
+def _build_markdown_it(profile: MarkdownProfile = _FULL_PROFILE) -> MarkdownIt:
+    math, footnotes, tasks = profile
+    md = MarkdownIt("commonmark", {"maxNesting": MAX_NESTING})
     md.enable("table").enable("strikethrough")
-    md.use(dollarmath_plugin, double_inline=True)
-    md.use(footnote_plugin)
-    md.use(tasklists_plugin, enabled=True)
+    if math:
+        md.use(dollarmath_plugin, double_inline=True)
+    if footnotes:
+        md.use(footnote_plugin)
+    if tasks:
+        md.use(tasklists_plugin, enabled=True)
     return md
 
 
+def get_markdown_it(text: str | None = None) -> MarkdownIt:
+    profile = _FULL_PROFILE if text is None else _detect_profile(text)
+    md = _MARKDOWN_IT_CACHE.get(profile)
+    if md is not None:
+        return md
+    with _MARKDOWN_IT_LOCK:
+        md = _MARKDOWN_IT_CACHE.get(profile)
+        if md is None:
+            md = _build_markdown_it(profile)
+            _MARKDOWN_IT_CACHE[profile] = md
+    return md
+
+
+def _split_core_rules(
+    md: MarkdownIt,
+) -> tuple[list[Callable[[StateCore], Any]], list[Callable[[StateCore], Any]]]:
+    rules = [rule for rule in md.core.ruler.__rules__ if rule.enabled]
+    names = [rule.name for rule in rules]
+    split = names.index("block") + 1
+    return [rule.fn for rule in rules[:split]], [rule.fn for rule in rules[split:]]
+
+
+def _top_level_blocks(tokens: list[Token]) -> list[tuple[int, int]]:
+    blocks: list[tuple[int, int]] = []
+    i = 0
+    while i < len(tokens):
+        start = i
+        if tokens[i].nesting == 1:
+            depth = 0
+            while i < len(tokens):
+                depth += tokens[i].nesting
+                i += 1
+                if depth == 0:
+                    break
+        else:
+            i += 1
+        blocks.append((start, i))
+    return blocks
+
+
+@dataclass
+class ParsedDocument:
+    text: str
+    tokens: list[Token]
+    md: MarkdownIt
+    env: dict[str, Any] = field(default_factory=dict)
+
+
+def tokenize_markdown(text: str, *, normalized: bool = False) -> ParsedDocument:
+    if not normalized:
+        text = _normalize_math_blocks(text)
+    md = get_markdown_it(text)
+    env: dict[str, Any] = {}
+    tokens = md.parse(text, env)
+    return ParsedDocument(text=text, tokens=tokens, md=md, env=env)
+
+
+def build_ast(document: ParsedDocument, *, compact: bool = False) -> list[AstNode] | list[Node]:
+    ast, _ = _parse_blocks(document.tokens, 0)
+    return ast if compact else ast_to_dicts(ast)
+
+
+def render_document_html(document: ParsedDocument) -> str:
+    return document.md.renderer.render(document.tokens, document.md.options, document.env)
+
+
 def render_preview_html(text: str) -> str:
-    text = _normalize_math_blocks(text)
-    md = _build_markdown_it()
-    return md.render(text)
+    return render_document_html(tokenize_markdown(text))
+
+
+def parse_markdown(text: str, *, compact: bool = False) -> list[AstNode] | list[Node]:
+    return build_ast(tokenize_markdown(text), compact=compact)
+
 
+def parse_markdown_iter(
+    text: str, *, compact: bool = False, normalized: bool = False
+) -> Iterator[AstNode] | Iterator[Node]:
+    nodes = _iter_nodes(text if normalized else _normalize_math_blocks(text))
+    if compact:
+        return nodes
+    return (node.to_dict() for node in nodes)
+
+
+def _iter_nodes(text: str) -> Iterator[Node]:
+    md = get_markdown_it(text)
+    env: dict[str, Any] = {}
+
+    if _detect_profile(text)[1]:
+        tokens = md.parse(text, env)
+        for start, end in _top_level_blocks(tokens):
+            nodes, _ = _parse_blocks(tokens[start:end], 0)
+            yield from nodes
+        return
 
-def parse_markdown(text: str) -> list[AstNode]:
-    text = _normalize_math_blocks(text)
-    md = _build_markdown_it()
-    tokens = md.parse(text)
-    ast, _ = _parse_blocks(tokens, 0)
-    return ast
+    head_rules, tail_rules = _split_core_rules(md)
+    state = StateCore(text, md, env)
+    for rule in head_rules:
+        rule(state)
+
+    tokens = state.tokens
+    for start, end in _top_level_blocks(tokens):
+        block_tokens = tokens[start:end]
+        block_state = StateCore(state.src, md, env, block_tokens)
+        for rule in tail_rules:
+            rule(block_state)
+        nodes, _ = _parse_blocks(block_tokens, 0)
+        for token in block_tokens:
+            token.children = None
+        yield from nodes
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import queue
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Iterable
+
+from formatter.ast_nodes import Node, Table, walk_nodes
+from formatter.latex import _OMML_CACHE, _OVER_BUDGET, OmmlCache, latex_to_omml
+from formatter.math_store import OmmlStore
+
+# A process pool costs far more per task than a typical conversion; without a
+# budget, below this many uncached formulas converting in-process is faster.
+PARALLEL_MIN_FORMULAS = 256
+CHUNKS_PER_WORKER = 4
+
+# Workers are spawned rather than forked: the API server runs threads that must
+# not be copied into a child, and frozen builds only support spawn.
+_POOL_CONTEXT = multiprocessing.get_context("spawn")
+_POOL_LOCK = Lock()
+_POLL_SECONDS = 0.05
+_POOL_START_SECONDS = 30.0
+_pool = None
+_pool_unavailable = False
+_pool_workers = 0
+_pool_started = None
+_batches = itertools.count()
+
+# Set in each pool worker by _init_worker.
+_worker_started = None
+
+
+@dataclass(frozen=True)
+class MathBudget:
+    # Per-formula limits: wall-clock seconds of conversion and characters of OMML.
+    seconds: float = 2.0
+    max_omml_chars: int = 1_000_000
+
+
+DEFAULT_MATH_BUDGET = MathBudget()
+
+
+@dataclass
+class PreparedFormulas:
+    converted: int = 0
+    # Formulas of this batch that are over budget and render as LaTeX text.
+    rejected: list[str] = field(default_factory=list)
+
+
+def collect_formulas(nodes: Iterable[Node]) -> list[str]:
+    # Distinct LaTeX sources in document order, including those nested in lists,
+    # quotes and table cells.
+    formulas: dict[str, None] = {}
+    for node in walk_nodes(nodes):
+        latex = getattr(node, "latex", None)
+        if latex is not None:
+            formulas[latex] = None
+            continue
+        if isinstance(node, Table):
+            runs = [run for cell in node.header for run in cell.runs]
+            runs.extend(run for row in node.rows for cell in row for run in cell.runs)
+        else:
+            runs = getattr(node, "runs", ())
+        for run in runs:
+            if run.type == "math":
+                formulas[run.latex] = None
+    return list(formulas)
+
+
+def _convert_formula(latex: str, max_chars: int = 0) -> str | None:
+    try:
+        omml = latex_to_omml(latex)
+    except Exception:
+        # Cached as failed; the builder falls back to a plain-text run.
+        return None
+    if max_chars and len(omml) > max_chars:
+        return _OVER_BUDGET
+    return omml
+
+
+def _convert_timed(latex: str, budget: MathBudget) -> str | None:
+    # Only used when pool workers cannot start here. In-process conversions cannot
+    # be interrupted, so a formula that ran over is only rejected afterwards.
+    start = time.perf_counter()
+    omml = _convert_formula(latex, budget.max_omml_chars)
+    if omml is not None and time.perf_counter() - start > budget.seconds:
+        return _OVER_BUDGET
+    return omml
+
+
+def _init_worker(started) -> None:
+    global _worker_started
+    _worker_started = started
+    # Imports and converter setup happen before any formula's budget starts.
+    latex_to_omml("x")
+    started.put((None, None, time.monotonic()))
+
+
+def _convert_reported(batch: int, index: int, latex: str, max_chars: int) -> tuple[int, str | None]:
+    # The start time is reported so the budget runs from when the worker picks
+    # the formula up, not from when it was queued.
+    _worker_started.put((batch, index, time.monotonic()))
+    return index, _convert_formula(latex, max_chars)
+
+
+def _get_pool(workers: int):
+    # One pool per process, created on first use and kept for later exports. None
+    # when workers cannot start here; they would be respawned forever.
+    global _pool, _pool_workers, _pool_started, _pool_unavailable
+    if _pool_unavailable:
+        return None
+    if _pool is not None and _pool_workers == workers:
+        return _pool
+    _discard_pool()
+    started = _POOL_CONTEXT.SimpleQueue()
+    pool = _POOL_CONTEXT.Pool(workers, initializer=_init_worker, initargs=(started,))
+    deadline = time.monotonic() + _POOL_START_SECONDS
+    ready = 0
+    while ready < workers:
+        if not started.empty():
+            started.get()
+            ready += 1
+        elif time.monotonic() < deadline:
+            time.sleep(_POLL_SECONDS)
+        else:
+            pool.terminate()
+            pool.join()
+            _pool_unavailable = True
+            return None
+    _pool, _pool_workers, _pool_started = pool, workers, started
+    return pool
+
+
+def _discard_pool() -> None:
+    global _pool, _pool_started
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _pool_started = None
+
+
+def _convert_in_pool(formulas: list[str], workers: int) -> list[str | None]:
+    chunksize = max(1, len(formulas) // (workers * CHUNKS_PER_WORKER))
+    with _POOL_LOCK:
+        pool = _get_pool(workers)
+        if pool is not None:
+            return pool.map(_convert_formula, formulas, chunksize)
+    return [_convert_formula(latex) for latex in formulas]
+
+
+def _convert_within_budget(formulas: list[str], workers: int, budget: MathBudget) -> list[str | None]:
+    # At most one formula per worker is in flight. When one runs past its budget
+    # it is marked over budget, the pool is terminated, and the formulas that were
+    # still running are queued again on a fresh pool.
+    results: list[str | None] = [None] * len(formulas)
+    pending = list(reversed(range(len(formulas))))
+    with _POOL_LOCK:
+        while pending:
+            pool, started = _get_pool(workers), _pool_started
+            if pool is None:
+                for index in reversed(pending):
+                    results[index] = _convert_timed(formulas[index], budget)
+                break
+            batch = next(_batches)
+            finished: queue.SimpleQueue[tuple[int, str | None]] = queue.SimpleQueue()
+            deadlines: dict[int, float] = {}
+            while pending or deadlines:
+                while pending and len(deadlines) < workers:
+                    index = pending.pop()
+                    # Replaced by the reported start; covers a worker lost before it.
+                    deadlines[index] = time.monotonic() + _POOL_START_SECONDS + budget.seconds
+                    pool.apply_async(
+                        _convert_reported,
+                        (batch, index, formulas[index], budget.max_omml_chars),
+                        callback=finished.put,
+                        error_callback=lambda _exc, index=index: finished.put((index, None)),
+                    )
+                while not started.empty():
+                    started_batch, index, at = started.get()
+                    if started_batch == batch and index in deadlines:
+                        deadlines[index] = at + budget.seconds
+                try:
+                    index, omml = finished.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    pass
+                else:
+                    del deadlines[index]
+                    results[index] = omml
+                now = time.monotonic()
+                expired = [index for index, deadline in deadlines.items() if deadline <= now]
+                if expired:
+                    for index in expired:
+                        results[index] = _OVER_BUDGET
+                        del deadlines[index]
+                    pending.extend(deadlines)
+                    _discard_pool()
+                    break
+    return results
+
+
+def prepare_formulas(
+    formulas: Iterable[str],
+    *,
+    workers: int,
+    executor: Executor | None = None,
+    cache: OmmlCache | None = None,
+    store: OmmlStore | None = None,
+    budget: MathBudget | None = None,
+) -> PreparedFormulas:
+    # Converts the formulas the cache does not hold yet so DOCX assembly only reads
+    # converted OMML. With a budget every conversion runs in the pool, where a late
+    # one can be abandoned; formulas over it are cached as rejected and render as
+    # text. Without one the pool only takes large batches. With a store, earlier
+    # conversions are loaded from it and new ones written back.
+    cache = cache or _OMML_CACHE
+    formulas = list(formulas)
+    missing = cache.missing(formulas)
+    if store is not None and missing:
+        stored = store.get_many(missing)
+        for latex, omml in stored.items():
+            cache.put(latex, omml)
+        missing = [latex for latex in missing if latex not in stored]
+    if not missing:
+        return PreparedFormulas(rejected=cache.rejected(formulas))
+    parallel = len(missing) >= PARALLEL_MIN_FORMULAS and (workers > 1 or executor is not None)
+    if parallel and executor is not None:
+        chunksize = max(1, len(missing) // (max(workers, 1) * CHUNKS_PER_WORKER))
+        results = list(executor.map(_convert_formula, missing, chunksize=chunksize))
+    elif budget is not None:
+        results = _convert_within_budget(missing, max(workers, 1), budget)
+    elif parallel:
+        results = _convert_in_pool(missing, workers)
+    elif store is not None:
+        results = [_convert_formula(latex) for latex in missing]
+    else:
+        return PreparedFormulas(rejected=cache.rejected(formulas))
+    converted: dict[str, str] = {}
+    for latex, omml in zip(missing, results):
+        if omml == _OVER_BUDGET:
+            cache.reject(latex)
+        elif omml is None:
+            cache.fail(latex)
+        else:
+            converted[latex] = omml
+            cache.put(latex, omml)
+    if store is not None:
+        store.put_many(converted)
+    return PreparedFormulas(len(missing), cache.rejected(formulas))
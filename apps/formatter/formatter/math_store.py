@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+
+from formatter.latex import CONVERTER_VERSION
+
+DEFAULT_MAX_STORED = 50_000
+# SQLite caps bound parameters per statement; keys are looked up in batches.
+_LOOKUP_BATCH = 500
+# Seconds a connection waits for another process's write lock before giving up.
+_BUSY_TIMEOUT = 10.0
+
+
+def _package_version(name: str) -> str:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return ""
+
+
+def converter_signature() -> str:
+    # Entries written by other converter versions simply stop matching.
+    return ":".join((CONVERTER_VERSION, _package_version("latex2mathml"), _package_version("mathml2omml")))
+
+
+def formula_key(latex: str, signature: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(signature.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(latex.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OmmlStore:
+    # LaTeX -> OMML results shared by every process on the machine. WAL mode lets
+    # readers proceed while one writer commits; the store is best effort, so a
+    # locked or damaged database, or a directory it cannot be created in, only
+    # costs a conversion.
+    def __init__(self, path: str | os.PathLike[str], max_entries: int = DEFAULT_MAX_STORED) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.signature = converter_signature()
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS omml_cache (
+                key TEXT PRIMARY KEY,
+                omml TEXT NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS omml_cache_used_at ON omml_cache (used_at)")
+        conn.commit()
+
+    def get_many(self, formulas: Iterable[str]) -> dict[str, str]:
+        keys = {formula_key(latex, self.signature): latex for latex in formulas}
+        found: dict[str, str] = {}
+        if not keys:
+            return found
+        wanted = list(keys)
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    self._ensure_schema(conn)
+                    for start in range(0, len(wanted), _LOOKUP_BATCH):
+                        batch = wanted[start : start + _LOOKUP_BATCH]
+                        placeholders = ", ".join("?" * len(batch))
+                        rows = conn.execute(
+                            f"SELECT key, omml FROM omml_cache WHERE key IN ({placeholders})", batch
+                        ).fetchall()
+                        for key, omml in rows:
+                            found[keys[key]] = omml
+                        if rows:
+                            conn.execute(
+                                f"UPDATE omml_cache SET used_at = ? "
+                                f"WHERE key IN ({', '.join('?' * len(rows))})",
+                                (time.time(), *(key for key, _ in rows)),
+                            )
+                    conn.commit()
+                finally:
+                    conn.close()
+        except (OSError, sqlite3.Error):
+            found = {}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, converted: dict[str, str]) -> None:
+        if not converted:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    self._ensure_schema(conn)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO omml_cache (key, omml, used_at) VALUES (?, ?, ?)",
+                        ((formula_key(latex, self.signature), omml, now) for latex, omml in converted.items()),
+                    )
+                    # Least recently used entries go first once the store is full.
+                    (count,) = conn.execute("SELECT COUNT(*) FROM omml_cache").fetchone()
+                    if count > self.max_entries:
+                        conn.execute(
+                            "DELETE FROM omml_cache WHERE key IN "
+                            "(SELECT key FROM omml_cache ORDER BY used_at LIMIT ?)",
+                            (count - self.max_entries,),
+                        )
+                    conn.commit()
+                finally:
+                    conn.close()
+        except (OSError, sqlite3.Error):
+            pass
+
+
+_STORES: dict[str, OmmlStore] = {}
+
+
+def get_omml_store(path: str) -> OmmlStore:
+    store = _STORES.get(path)
+    if store is None:
+        store = _STORES.setdefault(path, OmmlStore(path))
+    return store
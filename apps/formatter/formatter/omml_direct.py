@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import re
+from xml.sax.saxutils import escape
+
+# Builds OMML straight from LaTeX for the constructs reports use most: symbols,
+# sub/superscripts, fractions, roots, matrices, cases and top-level aligned
+# blocks. The output follows what latex2mathml + mathml2omml produce for the same
+# source, minus their redundant m:box wrappers. Anything else returns None and
+# goes through that chain instead.
+
+OMML_NS = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+
+_TOKEN_RE = re.compile(r"\\([A-Za-z]+|.)|(\d+(?:\.\d+)?|\.\d+)|(\S)", re.DOTALL)
+_ALIGNED_RE = re.compile(
+    r"\\begin\{(?P<env>aligned|align\*?)\}(?P<body>.*?)\\end\{(?P=env)\}",
+    re.DOTALL,
+)
+
+# Characters as latex2mathml classifies them: identifiers are italic ("i"),
+# numbers and operators upright ("p").
+_OPERATOR_CHARS = {
+    "+": "+",
+    "-": "\u2212",
+    "=": "=",
+    "<": "<",
+    ">": ">",
+    "/": "/",
+    ",": ",",
+    "(": "(",
+    ")": ")",
+    "[": "[",
+    "]": "]",
+    "|": "|",
+    "!": "!",
+    ".": ".",
+    "*": "*",
+    "?": "?",
+}
+_IDENTIFIER_CHARS = frozenset(";:")
+
+_GREEK = {
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "epsilon": "ϵ", "varepsilon": "ε",
+    "zeta": "ζ", "eta": "η", "theta": "θ", "vartheta": "ϑ", "iota": "ι", "kappa": "κ",
+    "lambda": "λ", "mu": "μ", "nu": "ν", "xi": "ξ", "pi": "π", "varpi": "ϖ", "rho": "ρ",
+    "varrho": "ϱ", "sigma": "σ", "varsigma": "ς", "tau": "τ", "upsilon": "υ", "phi": "ϕ",
+    "varphi": "φ", "chi": "χ", "psi": "ψ", "omega": "ω", "Gamma": "Γ", "Delta": "Δ",
+    "Theta": "Θ", "Lambda": "Λ", "Xi": "Ξ", "Pi": "Π", "Sigma": "Σ", "Upsilon": "Υ",
+    "Phi": "Φ", "Psi": "Ψ", "Omega": "Ω",
+}  # fmt: skip
+_SYMBOLS = {
+    **{name: ("i", char) for name, char in _GREEK.items()},
+    "pm": ("i", "±"), "ldots": ("i", "…"), "perp": ("i", "⟂"), "bullet": ("i", "•"), "neg": ("i", "¬"),
+    "cdot": ("p", "·"), "times": ("p", "×"), "mp": ("p", "∓"), "div": ("p", "÷"), "ast": ("p", "*"),
+    "le": ("p", "≤"), "leq": ("p", "≤"), "ge": ("p", "≥"), "geq": ("p", "≥"), "ne": ("p", "≠"),
+    "neq": ("p", "≠"), "approx": ("p", "≈"), "equiv": ("p", "≡"), "simeq": ("p", "≃"),
+    "cong": ("p", "≅"), "propto": ("p", "∝"), "ll": ("p", "≪"), "gg": ("p", "≫"),
+    "to": ("p", "→"), "rightarrow": ("p", "→"), "leftarrow": ("p", "←"), "Rightarrow": ("p", "⇒"),
+    "Leftarrow": ("p", "⇐"), "Leftrightarrow": ("p", "⇔"), "leftrightarrow": ("p", "↔"),
+    "infty": ("p", "∞"), "partial": ("p", "∂"), "nabla": ("p", "∇"), "forall": ("p", "∀"),
+    "exists": ("p", "∃"), "emptyset": ("p", "∅"), "angle": ("p", "∠"), "in": ("p", "∈"),
+    "notin": ("p", "∉"), "ni": ("p", "∋"), "subset": ("p", "⊂"), "subseteq": ("p", "⊆"),
+    "supset": ("p", "⊃"), "supseteq": ("p", "⊇"), "cup": ("p", "∪"), "cap": ("p", "∩"),
+    "circ": ("p", "∘"), "star": ("p", "⋆"), "oplus": ("p", "⊕"), "otimes": ("p", "⊗"),
+    "wedge": ("p", "∧"), "vee": ("p", "∨"), "parallel": ("p", "∥"), "mid": ("p", "∣"),
+    "cdots": ("p", "⋯"), "vdots": ("p", "⋮"), "ddots": ("p", "⋱"),
+    "{": ("p", "{"), "}": ("p", "}"), "|": ("p", "‖"),
+}  # fmt: skip
+_FUNCTIONS = frozenset(
+    "sin cos tan cot sec csc arcsin arccos arctan sinh cosh tanh ln log lg exp det "
+    "lim max min sup inf deg dim gcd hom ker Pr".split()
+)
+_FRACTIONS = frozenset(("frac", "dfrac", "tfrac"))
+# Matrix environments and their delimiters; None is a bare matrix.
+_MATRICES = {
+    "matrix": None,
+    "pmatrix": ("(", ")"),
+    "bmatrix": ("[", "]"),
+    "Bmatrix": ("{", "}"),
+    "vmatrix": ("|", "|"),
+    "Vmatrix": ("‖", "‖"),
+    "cases": ("{", ""),
+}
+
+Token = tuple[str, str]
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _run(style: str, text: str) -> str:
+    return f'<m:r><m:rPr><m:sty m:val="{style}"/></m:rPr><m:t>{escape(text)}</m:t></m:r>'
+
+
+_EMPTY_CELL = _run("p", "\u00a0")
+
+
+def _tokenize(latex: str) -> list[Token]:
+    tokens: list[Token] = []
+    for match in _TOKEN_RE.finditer(latex):
+        command, number, char = match.groups()
+        if command is not None:
+            tokens.append(("cmd", command))
+        elif number is not None:
+            tokens.append(("num", number))
+        else:
+            tokens.append(("chr", char))
+    return tokens
+
+
+class _Parser:
+    __slots__ = ("tokens", "pos")
+
+    def __init__(self, tokens: list[Token]) -> None:
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self) -> Token | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Token:
+        if self.pos >= len(self.tokens):
+            raise _Unsupported
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, token: Token) -> None:
+        if self._next() != token:
+            raise _Unsupported
+
+    def expression(self, stops: frozenset[Token] = frozenset()) -> str:
+        parts: list[str] = []
+        while True:
+            token = self._peek()
+            if token is None or token in stops:
+                return "".join(parts)
+            parts.append(self._atom())
+
+    def _atom(self) -> str:
+        token = self._next()
+        base = self._primary(token)
+        sub = sup = None
+        while self._peek() in (("chr", "^"), ("chr", "_")):
+            if token == ("cmd", "begin"):
+                # latex2mathml rejects scripts on environments; keep its behaviour.
+                raise _Unsupported
+            _, marker = self._next()
+            if (sup if marker == "^" else sub) is not None:
+                raise _Unsupported
+            if marker == "^":
+                sup = self._argument()
+            else:
+                sub = self._argument()
+        if sub is not None and sup is not None:
+            return f"<m:sSubSup><m:e>{base}</m:e><m:sub>{sub}</m:sub><m:sup>{sup}</m:sup></m:sSubSup>"
+        if sup is not None:
+            return f"<m:sSup><m:e>{base}</m:e><m:sup>{sup}</m:sup></m:sSup>"
+        if sub is not None:
+            return f"<m:sSub><m:e>{base}</m:e><m:sub>{sub}</m:sub></m:sSub>"
+        return base
+
+    def _argument(self) -> str:
+        kind, value = self._next()
+        if kind == "num" and len(value) > 1:
+            # Like TeX, a script or fraction argument takes a single digit.
+            self.tokens.insert(self.pos, ("num", value[1:]))
+            value = value[0]
+            if value == ".":
+                raise _Unsupported
+        if (kind, value) in (("chr", "^"), ("chr", "_")):
+            raise _Unsupported
+        return self._primary((kind, value))
+
+    def _group(self) -> str:
+        content = self.expression(frozenset((("chr", "}"),)))
+        self._expect(("chr", "}"))
+        return content
+
+    def _primary(self, token: Token) -> str:
+        kind, value = token
+        if kind == "num":
+            return _run("p", value)
+        if kind == "chr":
+            if value == "{":
+                return self._group()
+            if value.isascii() and value.isalpha():
+                return _run("i", value)
+            if value in _OPERATOR_CHARS:
+                return _run("p", _OPERATOR_CHARS[value])
+            if value in _IDENTIFIER_CHARS:
+                return _run("i", value)
+            raise _Unsupported
+        symbol = _SYMBOLS.get(value)
+        if symbol is not None:
+            return _run(*symbol)
+        if value in _FUNCTIONS:
+            return _run("p", value)
+        if value in _FRACTIONS:
+            num = self._argument()
+            return f"<m:f><m:num>{num}</m:num><m:den>{self._argument()}</m:den></m:f>"
+        if value == "sqrt":
+            degree = None
+            if self._peek() == ("chr", "["):
+                self.pos += 1
+                degree = self.expression(frozenset((("chr", "]"),)))
+                self._expect(("chr", "]"))
+            radicand = self._argument()
+            if degree is None:
+                return f"<m:rad><m:e>{radicand}</m:e></m:rad>"
+            return f"<m:rad><m:deg>{degree}</m:deg><m:e>{radicand}</m:e></m:rad>"
+        if value == "begin":
+            return self._environment()
+        raise _Unsupported
+
+    def _environment_name(self) -> str:
+        self._expect(("chr", "{"))
+        name: list[str] = []
+        while True:
+            kind, value = self._next()
+            if (kind, value) == ("chr", "}"):
+                return "".join(name)
+            if kind != "chr":
+                raise _Unsupported
+            name.append(value)
+
+    def _environment(self) -> str:
+        name = self._environment_name()
+        if name not in _MATRICES:
+            raise _Unsupported
+        stops = frozenset((("chr", "&"), ("cmd", "\\"), ("cmd", "end")))
+        rows: list[list[str]] = [[]]
+        while True:
+            rows[-1].append(self.expression(stops))
+            kind, value = self._next()
+            if value == "&":
+                continue
+            if value == "\\":
+                rows.append([])
+                continue
+            if self._environment_name() != name:
+                raise _Unsupported
+            break
+        if rows[-1] == [""]:
+            # A trailing \\ does not open another row.
+            rows.pop()
+        matrix = _matrix(rows)
+        delimiters = _MATRICES[name]
+        if delimiters is None:
+            return matrix
+        begin, end = delimiters
+        return (
+            f'<m:d><m:dPr><m:begChr m:val="{escape(begin)}"/><m:endChr m:val="{escape(end)}"/></m:dPr>'
+            f"<m:e>{matrix}</m:e></m:d>"
+        )
+
+
+def _matrix(rows: list[list[str]]) -> str:
+    width = max((len(row) for row in rows), default=0)
+    parts = ["<m:m>"]
+    for row in rows:
+        parts.append("<m:mr>")
+        parts.extend(f"<m:e>{cell}</m:e>" for cell in row)
+        parts.append("<m:e></m:e>" * (width - len(row)))
+        parts.append("</m:mr>")
+    parts.append("</m:m>")
+    return "".join(parts)
+
+
+def _convert(latex: str) -> str:
+    parser = _Parser(_tokenize(latex))
+    content = parser.expression()
+    if parser.pos != len(parser.tokens) or not content:
+        raise _Unsupported
+    return content
+
+
+def _convert_aligned(latex: str) -> str | None:
+    # Rows and cells are split on the raw text, as _convert_aligned_to_mathml does.
+    match = _ALIGNED_RE.fullmatch(latex.strip())
+    if not match:
+        return None
+    rows = [row.strip() for row in re.split(r"\\\\", match.group("body")) if row.strip()]
+    if not rows:
+        raise _Unsupported
+    cells = [[cell.strip() for cell in row.split("&")] for row in rows]
+    return _matrix([[_convert(cell) if cell else _EMPTY_CELL for cell in row] for row in cells])
+
+
+def direct_latex_to_omml(latex: str) -> str | None:
+    try:
+        content = _convert_aligned(latex)
+        if content is None:
+            content = _convert(latex)
+    except (_Unsupported, RecursionError):
+        return None
+    return f'<m:oMath xmlns:m="{OMML_NS}">{content}</m:oMath>'
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import re
+from typing import Any
+
+from formatter.ast_nodes import heading_level
+
+# Lines whose first character cannot open a block other than a paragraph take the
+# fast path; the rest are told apart by cheap character tests before any regex.
+_BLOCK_CHARS = frozenset("#`~$>|!-*+_=0123456789")
+_FENCE_RE = re.compile(r"(`{3,}|~{3,})(.*)")
+_ORDERED_ITEM_RE = re.compile(r"\d{1,9}([.)])(?:[ \t]|$)")
+_RULE_RE = re.compile(r"([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+_SETEXT_RE = re.compile(r"(?:=+|-+)$")
+_TABLE_DELIMITER_RE = re.compile(r"\|?(?:[ \t]*:?-+:?[ \t]*\|)+(?:[ \t]*:?-+:?)?$")
+_FIGURE_RE = re.compile(r"!\[[^\]\n]*\]\(")
+
+
+def build_outline(text: str) -> dict[str, Any]:
+    # One pass over the lines, tracking fences, $$ blocks and open lists. Heading
+    # levels are the AST's; counts follow summarize_ast but are approximate: raw
+    # HTML, footnote definitions and the generated footnote section, quotes nested
+    # in lists and unusual lazy continuations are not modelled. Cost is about 1 us
+    # per line, so it depends on line length: per 100 KB, about 0.2 ms for long
+    # prose lines, 2 ms for a mixed report and 10 ms for dense short-line markup
+    # (lists, tables), 30-80x less than a full parse.
+    headings: list[dict[str, Any]] = []
+    paragraphs = lists = tables = math_blocks = hidden_figures = 0
+    open_lists: list[tuple[int, str]] = []
+    fence = ""
+    in_math = False
+    # "para" while a paragraph, quote or table can absorb the next line, "code" in an
+    # indented code block and "" after a blank line or a single-line block.
+    block = ""
+    previous = ""
+    paragraph_line = 0
+
+    number = 0
+    for number, line in enumerate(text.split("\n"), 1):
+        if fence:
+            body = line.strip()
+            if body.startswith(fence) and not body.strip(fence[0]):
+                fence = ""
+            elif "![" in line:
+                hidden_figures += line.count("![")
+            continue
+        if in_math:
+            body = line.strip()
+            if body == "$$":
+                math_blocks += 1
+                in_math = False
+            elif not body:
+                # An unclosed $$ block cannot span a blank line; it stays paragraph text.
+                paragraphs += 1
+                in_math = False
+                block = ""
+            continue
+
+        body = line.strip()
+        if not body:
+            block = ""
+            continue
+        first = body[0]
+        if first not in _BLOCK_CHARS:
+            if block != "para":
+                indent = len(line) - len(line.lstrip())
+                if indent >= 4 and not open_lists:
+                    block = "code"
+                    continue
+                if indent < 2 and not block:
+                    open_lists.clear()
+                paragraphs += 1
+                paragraph_line = number
+                block = "para"
+            previous = body
+            continue
+
+        indent = len(line) - len(line.lstrip())
+        if indent >= 4 and not open_lists:
+            if block != "para":
+                block = "code"
+            continue
+
+        marker = ""
+        if first in "-*+" and (len(body) == 1 or body[1] in " \t"):
+            marker = first
+        elif "0" <= first <= "9":
+            match = _ORDERED_ITEM_RE.match(body)
+            if match:
+                marker = match.group(1)
+        if marker and not (first in "-*" and body.count(first) >= 3 and _RULE_RE.match(body)):
+            while open_lists and open_lists[-1][0] > indent + 1:
+                open_lists.pop()
+            if open_lists and open_lists[-1][0] >= indent - 1:
+                if open_lists[-1][1] != marker:
+                    open_lists[-1] = (indent, marker)
+                    lists += 1
+            else:
+                open_lists.append((indent, marker))
+                lists += 1
+            if len(body) > len(marker) + (first != marker):
+                paragraphs += 1
+            block = "para"
+            paragraph_line = 0
+            continue
+
+        if paragraph_line == number - 1 and block == "para":
+            # Lines that turn the paragraph just above into a setext heading or a table.
+            if first in "=-" and _SETEXT_RE.match(body):
+                paragraphs -= 1
+                level = heading_level(1 if first == "=" else 2)
+                headings.append({"level": level, "text": previous, "line": number - 1})
+                block = ""
+                continue
+            if first in "|-:" and "-" in body and _TABLE_DELIMITER_RE.match(body):
+                paragraphs -= 1
+                tables += 1
+                paragraph_line = 0
+                continue
+
+        if first == "#":
+            level = len(body) - len(body.lstrip("#"))
+            if level <= 6 and (level == len(body) or body[level] in " \t"):
+                title = body[level:].strip()
+                if title.rstrip("#") != title and (title.rstrip("#") == "" or title.rstrip("#")[-1] in " \t"):
+                    title = title.rstrip("#").rstrip()
+                headings.append({"level": heading_level(level), "text": title, "line": number})
+                block = ""
+                if indent < 2:
+                    open_lists.clear()
+                continue
+        elif first in "`~":
+            match = _FENCE_RE.match(body)
+            if match and not (first == "`" and "`" in match.group(2)):
+                fence = match.group(1)
+                block = ""
+                if indent < 2:
+                    open_lists.clear()
+                continue
+        elif first == "$" and body.startswith("$$"):
+            if body == "$$":
+                in_math = True
+            elif len(body) > 4 and body.endswith("$$"):
+                math_blocks += 1
+            block = ""
+            if indent < 2:
+                open_lists.clear()
+            continue
+        elif first in ">|":
+            if block != "para" and indent < 2 and not block:
+                open_lists.clear()
+            if first == "|" and block != "para":
+                paragraphs += 1
+                paragraph_line = number
+            block = "para"
+            continue
+        elif first in "-*_" and _RULE_RE.match(body):
+            block = ""
+            if indent < 2:
+                open_lists.clear()
+            continue
+        elif first == "!" and body.endswith(")") and body.count("![") == 1 and _FIGURE_RE.match(body):
+            block = ""
+            continue
+
+        if block != "para":
+            if indent < 2 and not block:
+                open_lists.clear()
+            paragraphs += 1
+            paragraph_line = number
+            block = "para"
+        previous = body
+
+    summary = {
+        "headings": len(headings),
+        "paragraphs": paragraphs,
+        "lists": lists,
+        "tables": tables,
+        "math_blocks": math_blocks,
+        "figures": len(_FIGURE_RE.findall(text)) - hidden_figures,
+    }
+    return {"headings": headings, "summary": summary, "lines": max(number, 1)}
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from formatter.ast_nodes import Node
+from formatter.markdown_parser import _detect_profile, _parse_blocks, build_ast, get_markdown_it, tokenize_markdown
+
+# Below this size a process pool costs more than it saves.
+PARALLEL_MIN_CHARS = 256 * 1024
+SECTIONS_PER_WORKER = 4
+
+_SECTION_LINE_RE = re.compile(r"^(?:(#{1,6})(?=[ \t\r\n]|\Z)|( {0,3})(`{3,}|~{3,})([^\r\n]*))", re.M)
+_OPEN_ENDED_BLOCKS = {"fence", "html_block"}
+
+
+def _line_count(text: str) -> int:
+    return text.count("\n") + text.count("\r") - text.count("\r\n")
+
+
+def _follows_blank_line(text: str, pos: int) -> bool:
+    if pos == 0:
+        return True
+    previous = text.rfind("\n", 0, pos - 1)
+    return not text[previous + 1 : pos].strip()
+
+
+def split_sections(text: str, target_chars: int) -> list[str]:
+    # Cut only before a column-0 ATX heading that follows a blank line and is outside
+    # a fence: every block that could span that point other than fences and raw HTML
+    # blocks ends at the blank line. Those two are re-checked after parsing.
+    sections: list[str] = []
+    start = 0
+    fence: tuple[str, int] | None = None
+    for match in _SECTION_LINE_RE.finditer(text):
+        heading, _, marker, rest = match.groups()
+        if marker:
+            if fence is None:
+                if not (marker[0] == "`" and "`" in rest):
+                    fence = (marker[0], len(marker))
+            elif marker[0] == fence[0] and len(marker) >= fence[1] and not rest.strip():
+                fence = None
+            continue
+        pos = match.start()
+        if heading and fence is None and pos - start >= target_chars and _follows_blank_line(text, pos):
+            sections.append(text[start:pos])
+            start = pos
+    sections.append(text[start:])
+    return sections
+
+
+def _parse_section(text: str) -> tuple[list[Node], bool]:
+    md = get_markdown_it(text)
+    tokens = md.parse(text)
+    nodes, _ = _parse_blocks(tokens, 0)
+    open_ended = False
+    for token in reversed(tokens):
+        if token.level == 0 and token.map:
+            open_ended = token.type in _OPEN_ENDED_BLOCKS and token.map[1] >= _line_count(text)
+            break
+    return nodes, open_ended
+
+
+def _resolves_across_sections(text: str) -> bool:
+    # Link reference definitions resolve across the whole document; footnotes,
+    # reference-style or inline, are numbered document-wide and collected into one
+    # section at the end.
+    return "]:" in text or _detect_profile(text)[1]
+
+
+def can_parse_in_parallel(text: str) -> bool:
+    return len(text) >= PARALLEL_MIN_CHARS and not _resolves_across_sections(text)
+
+
+def parse_markdown_parallel(
+    text: str, *, workers: int, executor: Executor | None = None
+) -> list[Node]:
+    if _resolves_across_sections(text):
+        sections = [text]
+    else:
+        sections = split_sections(text, max(1, len(text) // (workers * SECTIONS_PER_WORKER)))
+    if len(sections) > 1:
+        if executor is not None:
+            results = list(executor.map(_parse_section, sections))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_parse_section, sections))
+        if not any(open_ended for _, open_ended in results[:-1]):
+            return [node for nodes, _ in results for node in nodes]
+    # A section ended inside a fence or raw HTML block the scan did not see; the
+    # split is unsafe, so parse the document as a whole.
+    return build_ast(tokenize_markdown(text, normalized=True), compact=True)
@@ -1,14 +1,50 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Iterator
 
+from formatter.ast_cache import AstCache, document_key
+from formatter.ast_nodes import Node, ast_to_dicts, coerce_ast
+from formatter.bib_library import BibliographyLibrary
 from formatter.citations import (
+    Source,
     build_bibliography_nodes,
+    cited_source_keys,
     has_bibliography_heading,
-    normalize_citations,
-    parse_bibliography_sources,
+    parse_bibliography_report,
+    unresolved_citations,
 )
-from formatter.markdown_parser import parse_markdown
+from formatter.incremental import IncrementalParser
+from formatter.markdown_parser import (
+    AstNode,
+    build_ast,
+    parse_markdown_iter,
+    render_document_html,
+    tokenize_markdown,
+)
+from formatter.parallel import can_parse_in_parallel, parse_markdown_parallel
+from formatter.preprocess import CitationIndex, preprocess_markdown
+
+
+def collect_bibliography_sources(
+    bibliography_sources: str,
+    refs: list[str],
+    key_number_map: dict[int, str],
+    *,
+    library: BibliographyLibrary | None = None,
+    library_id: str = "",
+) -> tuple[dict[str, Source], dict[str, Any] | None]:
+    sources = parse_bibliography_report(bibliography_sources)[0]
+    if library is None or not library_id:
+        return sources, None
+    found = library.lookup(library_id, cited_source_keys(refs, key_number_map))
+    # Inline sources override library entries with the same key.
+    sources = {**found.sources, **sources}
+    coverage = {
+        "library_id": library_id,
+        "unresolved": unresolved_citations(refs, sources, key_number_map),
+        "unused": found.unused,
+    }
+    return sources, coverage
 
 
 def format_markdown(
@@ -16,19 +52,96 @@ def format_markdown(
     *,
     bibliography_style: str = "ieee",
     bibliography_sources: str = "",
+    parser: IncrementalParser | None = None,
+    compact: bool = False,
+    workers: int = 1,
+    cache: AstCache | None = None,
+    bibliography_library: BibliographyLibrary | None = None,
+    bibliography_library_id: str = "",
+    citations: CitationIndex | None = None,
 ) -> dict[str, Any]:
-    normalized, refs, key_number_map = normalize_citations(text)
-    ast = parse_markdown(normalized)
-    sources = parse_bibliography_sources(bibliography_sources)
+    preprocessed = preprocess_markdown(text, index=citations)
+    normalized, refs, key_number_map = preprocessed.text, preprocessed.refs, preprocessed.key_number_map
+    document = None
+    preview_html = None
+    library_id = bibliography_library_id if bibliography_library is not None else ""
+    coverage = None
+    if library_id:
+        # Resolved up front: coverage is reported on cache hits too.
+        sources, coverage = collect_bibliography_sources(
+            bibliography_sources, refs, key_number_map, library=bibliography_library, library_id=library_id
+        )
+    cache_key = (
+        document_key(text, bibliography_style, bibliography_sources, library_id) if cache is not None else ""
+    )
+    cached = cache.get(cache_key) if cache is not None else None
 
-    if refs and not has_bibliography_heading(ast):
-        ast.extend(
-            build_bibliography_nodes(
+    bibliography: list[AstNode] = []
+    if cached is not None:
+        nodes, preview_html = cached.nodes, cached.preview_html
+    else:
+        if parser is not None:
+            nodes, preview_html = parser.parse(normalized, compact=True, normalized=True)
+        elif workers > 1 and can_parse_in_parallel(normalized):
+            nodes = parse_markdown_parallel(normalized, workers=workers)
+        else:
+            document = tokenize_markdown(normalized, normalized=True)
+            nodes = build_ast(document, compact=True)
+        if coverage is None:
+            sources = parse_bibliography_report(bibliography_sources)[0]
+
+        if refs and not has_bibliography_heading(nodes):
+            bibliography = build_bibliography_nodes(
                 refs,
                 style=bibliography_style,
                 sources=sources,
                 key_number_map=key_number_map,
             )
-        )
 
-    return {"ast": ast, "refs": refs, "normalized_markdown": normalized}
+        if cache is not None:
+            if preview_html is None and document is not None:
+                preview_html = render_document_html(document)
+            cache.put(cache_key, [*nodes, *coerce_ast(bibliography)], preview_html)
+
+    if compact:
+        ast: list[Any] = [*nodes, *coerce_ast(bibliography)]
+    else:
+        ast = ast_to_dicts(nodes) + bibliography
+
+    result: dict[str, Any] = {
+        "ast": ast,
+        "refs": refs,
+        "normalized_markdown": normalized,
+        "offsets": preprocessed.offsets,
+        "document": document,
+    }
+    if preview_html is not None:
+        result["preview_html"] = preview_html
+    if coverage is not None:
+        result["bibliography_coverage"] = coverage
+    return result
+
+
+def iter_formatted_markdown(
+    text: str,
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    compact: bool = False,
+) -> Iterator[AstNode] | Iterator[Node]:
+    preprocessed = preprocess_markdown(text)
+    refs, key_number_map = preprocessed.refs, preprocessed.key_number_map
+    has_bibliography = False
+    for node in parse_markdown_iter(preprocessed.text, compact=True, normalized=True):
+        if not has_bibliography and has_bibliography_heading([node]):
+            has_bibliography = True
+        yield node if compact else node.to_dict()
+
+    if refs and not has_bibliography:
+        bibliography = build_bibliography_nodes(
+            refs,
+            style=bibliography_style,
+            sources=parse_bibliography_report(bibliography_sources)[0],
+            key_number_map=key_number_map,
+        )
+        yield from (coerce_ast(bibliography) if compact else bibliography)
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import re
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import chain
+from threading import Lock
+
+from formatter.citations import _CITATION_RE, _normalize_source_key
+
+# Line boundaries recognised by str.splitlines(), which the line-based normalizers
+# have always used; the padding rules below must see the same lines. markdown-it
+# folds \r\n and \r itself, so only the other separators are rewritten here.
+_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_SPACE = rf"[^\S{_BREAKS}]"
+# Every alternative starts with a literal so the regex engine can skip ahead quickly;
+# a character class or a leading group here makes the scan several times slower.
+_SCAN_RE = re.compile(r"\[@([A-Za-z0-9:_-]+)\]|\$\$|\x0b|\x0c|\x1c|\x1d|\x1e|\x85|\u2028|\u2029")
+_LINE_END_RE = re.compile(rf"{_SPACE}*(?:\r\n|[{_BREAKS}])")
+_BLANK_LINE_RE = re.compile(rf"{_SPACE}*(?:[{_BREAKS}]|\Z)")
+
+DEFAULT_MAX_CITATION_BLOCKS = 4096
+
+
+def _positions() -> array[int]:
+    return array("q")
+
+
+@dataclass
+class OffsetMap:
+    original_starts: array[int] = field(default_factory=_positions)
+    original_ends: array[int] = field(default_factory=_positions)
+    normalized_starts: array[int] = field(default_factory=_positions)
+    normalized_ends: array[int] = field(default_factory=_positions)
+
+    def _add(self, original_start: int, original_end: int, normalized_start: int, normalized_end: int) -> None:
+        self.original_starts.append(original_start)
+        self.original_ends.append(original_end)
+        self.normalized_starts.append(normalized_start)
+        self.normalized_ends.append(normalized_end)
+
+    def to_normalized(self, position: int) -> int:
+        idx = bisect_right(self.original_starts, position) - 1
+        if idx < 0:
+            return position
+        if position < self.original_ends[idx]:
+            return self.normalized_starts[idx]
+        return self.normalized_ends[idx] + position - self.original_ends[idx]
+
+    def to_original(self, position: int) -> int:
+        idx = bisect_right(self.normalized_starts, position) - 1
+        if idx < 0:
+            return position
+        if position < self.normalized_ends[idx]:
+            return self.original_starts[idx]
+        return self.original_ends[idx] + position - self.normalized_ends[idx]
+
+
+@dataclass
+class BlockOffsetMap:
+    # Per-block offset maps placed at their block's start, so a block rewrite is
+    # reused without shifting every entry it holds.
+    original_bases: array[int] = field(default_factory=_positions)
+    normalized_bases: array[int] = field(default_factory=_positions)
+    blocks: list[OffsetMap] = field(default_factory=list)
+
+    def _add_block(self, original_base: int, normalized_base: int, offsets: OffsetMap) -> None:
+        self.original_bases.append(original_base)
+        self.normalized_bases.append(normalized_base)
+        self.blocks.append(offsets)
+
+    def to_normalized(self, position: int) -> int:
+        idx = bisect_right(self.original_bases, position) - 1
+        if idx < 0:
+            return position
+        base = self.original_bases[idx]
+        return self.normalized_bases[idx] + self.blocks[idx].to_normalized(position - base)
+
+    def to_original(self, position: int) -> int:
+        idx = bisect_right(self.normalized_bases, position) - 1
+        if idx < 0:
+            return position
+        base = self.normalized_bases[idx]
+        return self.original_bases[idx] + self.blocks[idx].to_original(position - base)
+
+
+@dataclass
+class PreprocessedMarkdown:
+    text: str
+    refs: list[str]
+    key_number_map: dict[int, str]
+    offsets: OffsetMap | BlockOffsetMap
+
+
+def _line_start(text: str, pos: int) -> int:
+    while pos > 0 and text[pos - 1] not in _BREAKS and text[pos - 1].isspace():
+        pos -= 1
+    return pos
+
+
+def _previous_line_blank(text: str, line_start: int) -> bool:
+    pos = line_start - (2 if line_start > 1 and text.startswith("\r\n", line_start - 2) else 1)
+    pos = _line_start(text, pos)
+    return pos == 0 or text[pos - 1] in _BREAKS
+
+
+class _Rewriter:
+    __slots__ = ("text", "chunks", "offsets", "last", "delta")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.chunks: list[str] = []
+        self.offsets = OffsetMap()
+        self.last = 0
+        self.delta = 0
+
+    def replace(self, start: int, end: int, replacement: str) -> None:
+        if replacement.startswith("\n"):
+            # A "\n" written after a lone "\r" would fuse with it into one line break.
+            while start > self.last and self.text[start - 1] == "\r":
+                start -= 1
+                replacement = "\n" + replacement
+        if start > self.last:
+            self.chunks.append(self.text[self.last : start])
+        self.chunks.append(replacement)
+        normalized_start = start + self.delta
+        self.delta += len(replacement) - (end - start)
+        self.offsets._add(start, end, normalized_start, end + self.delta)
+        self.last = end
+
+    def finish(self) -> str:
+        if not self.chunks:
+            return self.text
+        self.chunks.append(self.text[self.last :])
+        return "".join(self.chunks)
+
+
+def _rewrite(text: str, key_numbers: dict[str, int], next_number: int, in_block: bool) -> tuple[_Rewriter, bool]:
+    # Keys missing from key_numbers are numbered in order of first appearance.
+    rewriter = _Rewriter(text)
+    pad_at = pending_pad = -1
+
+    for match in _SCAN_RE.finditer(text):
+        start = match.start()
+        if 0 <= pending_pad <= start:
+            rewriter.replace(pending_pad, pending_pad, "\n")
+            pending_pad = -1
+
+        key = match.group(1)
+        if key is not None:
+            source_key = _normalize_source_key(key)
+            number = key_numbers.get(source_key)
+            if number is None:
+                number = key_numbers[source_key] = next_number + len(key_numbers)
+            rewriter.replace(start, match.end(), f"[{number}]")
+            continue
+        if text[start] != "$":
+            rewriter.replace(start, match.end(), "\n")
+            continue
+
+        # "$$" only delimits a block when it is the whole line, as in _normalize_math_blocks.
+        start = _line_start(text, start)
+        if start and text[start - 1] not in _BREAKS:
+            continue
+        if _BLANK_LINE_RE.match(text, match.end()) is None:
+            continue
+        if not in_block:
+            in_block = True
+            if start and start != pad_at and not _previous_line_blank(text, start):
+                rewriter.replace(start, start, "\n")
+        else:
+            in_block = False
+            line_end = _LINE_END_RE.match(text, match.end())
+            if line_end and _BLANK_LINE_RE.match(text, line_end.end()) is None:
+                pending_pad = pad_at = line_end.end()
+
+    if pending_pad >= 0:
+        rewriter.replace(pending_pad, pending_pad, "\n")
+    return rewriter, in_block
+
+
+def _citation_result(
+    text: str, numbers: set[int], key_numbers: dict[str, int], offsets: OffsetMap | BlockOffsetMap
+) -> PreprocessedMarkdown:
+    key_number_map = {number: key for key, number in key_numbers.items()}
+    all_numbers = sorted(numbers.union(key_number_map))
+    return PreprocessedMarkdown(
+        text=text,
+        refs=[f"[{number}]" for number in all_numbers],
+        key_number_map=key_number_map,
+        offsets=offsets,
+    )
+
+
+@dataclass
+class _IndexedBlock:
+    numbers: frozenset[int]
+    # Normalized [@key] citations in order of first appearance within the block.
+    keys: tuple[str, ...]
+    scanned: bool
+    # The last rewrite, keyed by math state on entry and the numbers of its keys.
+    rewrite: tuple[tuple[bool, tuple[int, ...]], str, OffsetMap, bool] | None = None
+
+
+class CitationIndex:
+    # Records the citations of each blank-line separated block, keyed by block text.
+    # After an edit only the changed blocks are rescanned; numbering and refs are
+    # recomputed from the per-block records, and a block is rewritten again only
+    # when its text, math state or key numbers change.
+    def __init__(self, max_blocks: int = DEFAULT_MAX_CITATION_BLOCKS) -> None:
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self._blocks: OrderedDict[str, _IndexedBlock] = OrderedDict()
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._blocks)}
+
+    def _index_blocks(self, blocks: list[str]) -> list[_IndexedBlock]:
+        indexed: list[_IndexedBlock] = []
+        with self._lock:
+            for block in blocks:
+                entry = self._blocks.get(block)
+                if entry is None:
+                    self.misses += 1
+                    found = _SCAN_RE.findall(block)
+                    entry = _IndexedBlock(
+                        numbers=frozenset(int(number) for number in set(_CITATION_RE.findall(block))),
+                        keys=tuple(dict.fromkeys(_normalize_source_key(key) for key in found if key)),
+                        scanned=bool(found),
+                    )
+                    self._blocks[block] = entry
+                else:
+                    self.hits += 1
+                    self._blocks.move_to_end(block)
+                indexed.append(entry)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return indexed
+
+    def preprocess(self, text: str) -> PreprocessedMarkdown:
+        # "\n\n" always ends a blank line, so no padding rule looks across a block
+        # boundary; only the open/closed $$ state is carried from block to block.
+        # A lone "\r" can fuse with the "\n" after it, so such text is handled whole.
+        if "\r" in text or "\n\n" not in text:
+            return _preprocess_text(text)
+        blocks = text.split("\n\n")
+        indexed = self._index_blocks(blocks)
+
+        numbers: set[int] = set().union(*(entry.numbers for entry in indexed))
+        next_number = (max(numbers) + 1) if numbers else 1
+        ordered = dict.fromkeys(chain.from_iterable(entry.keys for entry in indexed))
+        key_numbers = {key: number for number, key in enumerate(ordered, next_number)}
+
+        chunks: list[str] = []
+        offsets = BlockOffsetMap()
+        original = normalized = 0
+        changed = False
+        in_block = False
+        for block, entry in zip(blocks, indexed):
+            rewritten = block
+            if entry.scanned:
+                signature = (in_block, tuple(map(key_numbers.__getitem__, entry.keys)))
+                rewrite = entry.rewrite
+                if rewrite is None or rewrite[0] != signature:
+                    rewriter, block_end = _rewrite(block, key_numbers, next_number, in_block)
+                    rewrite = entry.rewrite = (signature, rewriter.finish(), rewriter.offsets, block_end)
+                _, rewritten, block_offsets, in_block = rewrite
+                if block_offsets.original_starts:
+                    changed = True
+                    offsets._add_block(original, normalized, block_offsets)
+            chunks.append(rewritten)
+            original += len(block) + 2
+            normalized += len(rewritten) + 2
+
+        return _citation_result("\n\n".join(chunks) if changed else text, numbers, key_numbers, offsets)
+
+
+def _preprocess_text(text: str) -> PreprocessedMarkdown:
+    numbers = {int(number) for number in set(_CITATION_RE.findall(text))}
+    next_number = (max(numbers) + 1) if numbers else 1
+    key_numbers: dict[str, int] = {}
+    rewriter, _ = _rewrite(text, key_numbers, next_number, False)
+    return _citation_result(rewriter.finish(), numbers, key_numbers, rewriter.offsets)
+
+
+def preprocess_markdown(text: str, *, index: CitationIndex | None = None) -> PreprocessedMarkdown:
+    # A C-level findall gathers the numeric refs first so [@key] numbers are final
+    # when they are written; one scan then rewrites keys, line separators and pads
+    # $$ blocks. The text parses like normalize_citations followed by
+    # _normalize_math_blocks, and the offset map points back into the source.
+    # With an index, unchanged blocks reuse their recorded citations and rewrites.
+    if index is not None:
+        return index.preprocess(text)
+    return _preprocess_text(text)
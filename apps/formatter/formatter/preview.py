@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import re
-from typing import Any
+from typing import Any, Iterable
+
+from formatter.ast_nodes import LINK, Blockquote, Heading, Node, Paragraph, Run, coerce_ast, walk_nodes
+from formatter.bibtex import MalformedEntry
 
 AstNode = dict[str, Any]
 QualityWarning = dict[str, str]
 _REF_RE = re.compile(r"^\[(\d+)\]$")
 
 
-def summarize_ast(ast: list[AstNode]) -> dict[str, int]:
+def summarize_ast(ast: Iterable[AstNode | Node]) -> dict[str, int]:
     counts = {
         "headings": 0,
         "paragraphs": 0,
@@ -18,19 +21,19 @@ def summarize_ast(ast: list[AstNode]) -> dict[str, int]:
         "figures": 0,
     }
 
-    def walk(nodes: list[AstNode]) -> None:
-        for node in nodes:
-            if node.get("auto_generated"):
+    pending: list[Iterable[Node]] = [coerce_ast(ast)]
+    while pending:
+        for node in pending.pop():
+            if node.auto_generated:
                 continue
-            ntype = node.get("type")
+            ntype = node.type
             if ntype == "heading":
                 counts["headings"] += 1
             elif ntype == "paragraph":
                 counts["paragraphs"] += 1
             elif ntype == "list":
                 counts["lists"] += 1
-                for item in node.get("items", []):
-                    walk(item)
+                pending.extend(node.items)
             elif ntype == "table":
                 counts["tables"] += 1
             elif ntype == "math_block":
@@ -38,32 +41,21 @@ def summarize_ast(ast: list[AstNode]) -> dict[str, int]:
             elif ntype == "figure":
                 counts["figures"] += 1
 
-    walk(ast)
     return counts
 
 
-def _walk_nodes(nodes: list[AstNode]):
-    for node in nodes:
-        yield node
-        if node.get("type") == "list":
-            for item in node.get("items", []):
-                yield from _walk_nodes(item)
-        if node.get("type") == "blockquote":
-            yield from _walk_nodes(node.get("children", []))
-
-
-def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
+def lint_structure(ast: Iterable[AstNode | Node], refs: list[str]) -> list[QualityWarning]:
     warnings: list[QualityWarning] = []
     last_heading_level: int | None = None
 
-    for node in _walk_nodes(ast):
-        if node.get("auto_generated"):
+    for node in walk_nodes(coerce_ast(ast)):
+        if node.auto_generated:
             continue
-        if node.get("type") != "heading":
+        if not isinstance(node, Heading):
             continue
 
-        level = int(node.get("level", 1))
-        text = str(node.get("text", "")).strip()
+        level = int(node.level)
+        text = node.text.strip()
 
         if not text:
             warnings.append(
@@ -105,9 +97,50 @@ def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
     return warnings
 
 
+def lint_bibliography_sources(malformed: Iterable[MalformedEntry]) -> list[QualityWarning]:
+    warnings: list[QualityWarning] = []
+    for entry in malformed:
+        label = f"条目 {entry.key}" if entry.key else "条目"
+        warnings.append(
+            {
+                "code": "bibtex_entry_malformed",
+                "severity": "warning",
+                "message": f"参考文献源第 {entry.line} 行的{label}无法解析：{entry.message}。",
+            }
+        )
+    return warnings
+
+
+def lint_bibliography_coverage(coverage: dict[str, Any] | None) -> list[QualityWarning]:
+    if not coverage or not coverage["unresolved"]:
+        return []
+    return [
+        {
+            "code": "bibliography_key_unresolved",
+            "severity": "warning",
+            "message": f"参考文献库中找不到引用：{', '.join(coverage['unresolved'])}。",
+        }
+    ]
+
+
+def lint_math_budget(formulas: list[str]) -> list[QualityWarning]:
+    warnings: list[QualityWarning] = []
+    for latex in formulas:
+        excerpt = latex if len(latex) <= 40 else f"{latex[:40]}…"
+        warnings.append(
+            {
+                "code": "math_over_budget",
+                "severity": "warning",
+                "message": f"公式超出转换时间或大小限制，导出时按 LaTeX 原文输出：{excerpt}",
+            }
+        )
+    return warnings
+
+
 def build_export_quality_report(
-    ast: list[AstNode], refs: list[str], lint_warnings: list[QualityWarning]
+    ast: Iterable[AstNode | Node], refs: list[str], lint_warnings: list[QualityWarning]
 ) -> dict[str, Any]:
+    ast = list(coerce_ast(ast))
     stats = summarize_ast(ast)
     stats["refs"] = len(refs)
 
@@ -119,19 +152,19 @@ def build_export_quality_report(
     if stats.get("figures", 0) > 0:
         rules_applied.append("figure_caption_numbering")
 
-    has_blockquote = any(node.get("type") == "blockquote" for node in _walk_nodes(ast))
+    has_blockquote = any(isinstance(node, Blockquote) for node in walk_nodes(ast))
     if has_blockquote:
         rules_applied.append("blockquote_rendering")
 
-    has_task_items = any(node.get("task") is True for node in _walk_nodes(ast))
+    has_task_items = any(isinstance(node, Paragraph) and node.task for node in walk_nodes(ast))
     if has_task_items:
         rules_applied.append("task_list_checkbox_rendering")
 
     has_links = any(
-        run.get("link")
-        for node in _walk_nodes(ast)
-        for run in node.get("runs", [])
-        if isinstance(run, dict)
+        run.style & LINK
+        for node in walk_nodes(ast)
+        for run in getattr(node, "runs", [])
+        if type(run) is Run
     )
     if has_links:
         rules_applied.append("link_url_preserved")
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any
+
+DEFAULT_MARGIN_LINES = 20
+
+_FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.M)
+_HEADING_START_RE = re.compile(r"#{1,6}(?:[ \t\r\n]|$)")
+
+
+@dataclass
+class PreviewWindow:
+    start_line: int | None = None
+    end_line: int | None = None
+    section: int | None = None
+    margin_lines: int = DEFAULT_MARGIN_LINES
+
+
+def resolve_window_lines(outline: dict[str, Any], window: PreviewWindow) -> tuple[int, int]:
+    # Returns 1-based inclusive lines, margin included. A section spans its heading
+    # and every deeper heading after it.
+    total = outline["lines"]
+    if window.section is not None:
+        headings = outline["headings"]
+        if not 0 <= window.section < len(headings):
+            raise ValueError(f"section {window.section} is out of range (document has {len(headings)} headings)")
+        heading = headings[window.section]
+        first, last = heading["line"], total
+        for following in headings[window.section + 1 :]:
+            if following["level"] <= heading["level"]:
+                last = following["line"] - 1
+                break
+    else:
+        first = window.start_line or 1
+        last = window.end_line or total
+        if last < first:
+            raise ValueError("window end_line is before start_line")
+    margin = max(window.margin_lines, 0)
+    return max(1, first - margin), min(total, max(1, last + margin))
+
+
+def _line_offset(text: str, line: int) -> int:
+    pos = 0
+    for _ in range(line - 1):
+        pos = text.find("\n", pos) + 1
+        if pos == 0:
+            return len(text)
+    return pos
+
+
+def _fenced_ranges(text: str) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]] = []
+    start = -1
+    fence = ""
+    for match in _FENCE_LINE_RE.finditer(text):
+        marker, rest = match.groups()
+        if start < 0:
+            if not (marker[0] == "`" and "`" in rest):
+                start, fence = match.start(), marker
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not rest.strip():
+            ranges.append((start, match.end()))
+            start = -1
+    if start >= 0:
+        ranges.append((start, len(text)))
+    return ranges
+
+
+def _enclosing_fence(ranges: list[tuple[int, int]], pos: int) -> tuple[int, int] | None:
+    for fence_start, fence_end in ranges:
+        if fence_start < pos < fence_end:
+            return fence_start, fence_end
+        if fence_start >= pos:
+            break
+    return None
+
+
+def _is_cut(text: str, pos: int, ranges: list[tuple[int, int]]) -> bool:
+    # Blocks end at a blank line or in front of an ATX heading; an indented line
+    # after the blank still belongs to the list item above it.
+    if text[pos : pos + 1] in (" ", "\t"):
+        return False
+    if not _HEADING_START_RE.match(text, pos):
+        previous = text.rfind("\n", 0, pos - 1) + 1
+        if text[previous : pos - 1].strip():
+            return False
+    return _enclosing_fence(ranges, pos) is None
+
+
+def window_bounds(text: str, first_line: int, last_line: int) -> tuple[int, int]:
+    # Widens the line range to character offsets on block boundaries outside fenced
+    # code, so the slice parses the way those blocks parse in the whole document.
+    ranges = _fenced_ranges(text) if ("```" in text or "~~~" in text) else []
+
+    start = _line_offset(text, first_line)
+    while start > 0 and not _is_cut(text, start, ranges):
+        fence = _enclosing_fence(ranges, start)
+        start = fence[0] if fence is not None else text.rfind("\n", 0, start - 1) + 1
+
+    end = _line_offset(text, last_line + 1)
+    while end < len(text) and not _is_cut(text, end, ranges):
+        fence = _enclosing_fence(ranges, end)
+        end = fence[1] if fence is not None else text.find("\n", end) + 1 or len(text)
+    return start, max(start, end)
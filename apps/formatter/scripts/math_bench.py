@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+
+from lxml import etree
+
+from formatter.latex import OMML_NS, OmmlCache, latex_to_omml, mathml_latex_to_omml
+from formatter.math_prepare import prepare_formulas
+from formatter.math_store import OmmlStore
+from formatter.omml_direct import direct_latex_to_omml
+
+# Run from the repository root: python -m apps.formatter.scripts.math_bench
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+CORPUS_PATH = SCRIPTS_DIR / "math_corpus.txt"
+GOLDEN_PATH = SCRIPTS_DIR / "math_golden.tsv"
+
+# Variants rotate the single-letter identifiers of each seed: the formulas keep
+# the shape of the seeds but are distinct cache keys.
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+_ROTATIONS = tuple(str.maketrans(_LETTERS, _LETTERS[shift:] + _LETTERS[:shift]) for shift in range(1, 12))
+_LETTER_RE = re.compile(r"(?<![\\A-Za-z])[a-z](?![A-Za-z])")
+_NUMBER_RE = re.compile(r"\d+")
+_SYSTEM_SIZES = (2, 2, 3, 3, 4, 5, 6, 8, 12, 24)
+
+
+def load_seeds(path: Path = CORPUS_PATH) -> list[str]:
+    lines = (line.strip() for line in path.read_text(encoding="utf-8").splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _equation_rows(seeds: Iterable[str]) -> list[str]:
+    rows = []
+    for latex in seeds:
+        if latex.count("=") == 1 and "\\begin" not in latex and "&" not in latex:
+            lhs, rhs = latex.split("=")
+            rows.append(f"{lhs.strip()} &= {rhs.strip()}")
+    return rows
+
+
+def build_corpus(seeds: list[str], *, systems: int = 800, seed: int = 0) -> list[str]:
+    # Seeds, then letter and number variants of each, then aligned systems of
+    # 2-24 rows assembled from the single-equation seeds.
+    formulas = dict.fromkeys(seeds)
+    for table in _ROTATIONS:
+        for latex in seeds:
+            formulas[_LETTER_RE.sub(lambda match: match.group().translate(table), latex)] = None
+    for latex in seeds:
+        formulas[_NUMBER_RE.sub(lambda match: str(int(match.group()) + 7), latex)] = None
+    rng = random.Random(seed)
+    rows = _equation_rows(formulas)
+    for _ in range(systems):
+        body = r" \\ ".join(rng.sample(rows, rng.choice(_SYSTEM_SIZES)))
+        formulas[rf"\begin{{aligned}} {body} \end{{aligned}}"] = None
+    return list(formulas)
+
+
+def unboxed(omml: str) -> str:
+    # The MathML chain wraps runs in m:box elements that carry no formatting.
+    root = etree.fromstring(omml.encode("utf-8"))
+    for box in list(root.iter(f"{{{OMML_NS}}}box")):
+        parent, content = box.getparent(), box.find(f"{{{OMML_NS}}}e")
+        index = parent.index(box)
+        parent.remove(box)
+        for offset, child in enumerate(list(content) if content is not None else []):
+            parent.insert(index + offset, child)
+    return etree.tostring(root, encoding="unicode")
+
+
+def omml_digest(latex: str) -> str:
+    try:
+        omml = latex_to_omml(latex)
+    except Exception as exc:
+        return f"error:{type(exc).__name__}"
+    return hashlib.blake2b(omml.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_golden(path: Path = GOLDEN_PATH) -> dict[str, str]:
+    golden = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        digest, latex = line.split("\t", 1)
+        golden[latex] = digest
+    return golden
+
+
+def write_golden(seeds: Iterable[str], path: Path = GOLDEN_PATH) -> None:
+    path.write_text("".join(f"{omml_digest(latex)}\t{latex}\n" for latex in seeds), encoding="utf-8")
+
+
+def golden_mismatches(golden: dict[str, str]) -> list[str]:
+    return [latex for latex, digest in golden.items() if omml_digest(latex) != digest]
+
+
+def conformance_mismatches(formulas: Iterable[str]) -> list[str]:
+    # Formulas the direct converter takes must render as the MathML chain does.
+    mismatches = []
+    for latex in formulas:
+        direct = direct_latex_to_omml(latex)
+        if direct is None:
+            continue
+        try:
+            expected = mathml_latex_to_omml(latex)
+        except Exception:
+            mismatches.append(latex)
+            continue
+        if unboxed(direct) != unboxed(expected):
+            mismatches.append(latex)
+    return mismatches
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def time_conversions(formulas: Iterable[str], convert: Callable[[str], str], repeat: int) -> list[float]:
+    # Best of `repeat` runs per formula, in seconds; failures are timed too.
+    timings = []
+    for latex in formulas:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                convert(latex)
+            except Exception:
+                pass
+            best = min(best, time.perf_counter() - start)
+        timings.append(best)
+    return timings
+
+
+def _timing_line(label: str, timings: list[float]) -> str:
+    if not timings:
+        return f"  {label:<18} n=0"
+    mean = sum(timings) / len(timings)
+    return (
+        f"  {label:<18} n={len(timings):<5} p50={percentile(timings, 0.5) * 1e6:8.1f}us  "
+        f"p99={percentile(timings, 0.99) * 1e6:8.1f}us  mean={mean * 1e6:8.1f}us"
+    )
+
+
+def sample_documents(
+    formulas: list[str], *, documents: int, per_document: int, seed: int = 0
+) -> list[list[str]]:
+    # Formula frequency follows a Zipf curve: a few symbols recur in every report.
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(formulas))]
+    ranked = rng.sample(formulas, len(formulas))
+    return [rng.choices(ranked, weights=weights, k=per_document) for _ in range(documents)]
+
+
+def run_documents(
+    documents: list[list[str]], cache: OmmlCache, store: OmmlStore | None
+) -> tuple[list[float], int]:
+    # Mirrors build_docx: prepare the distinct formulas, then read every occurrence.
+    timings = []
+    converted = 0
+    for formulas in documents:
+        start = time.perf_counter()
+        converted += prepare_formulas(dict.fromkeys(formulas), workers=1, cache=cache, store=store).converted
+        for latex in formulas:
+            try:
+                cache.convert(latex)
+            except Exception:
+                pass
+        timings.append(time.perf_counter() - start)
+    return timings, converted + cache.stats()["misses"]
+
+
+def _document_report(label: str, documents: list[list[str]], cache: OmmlCache, store: OmmlStore | None) -> None:
+    timings, converted = run_documents(documents, cache, store)
+    occurrences = sum(len(formulas) for formulas in documents)
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    print(f"  {label}")
+    print(
+        f"    memory cache: {stats['hits']}/{lookups} hits ({stats['hits'] / max(lookups, 1):.1%}), "
+        f"{stats['size']} entries"
+    )
+    if store is not None:
+        store_stats = store.stats()
+        store_lookups = store_stats["hits"] + store_stats["misses"]
+        print(f"    store: {store_stats['hits']}/{store_lookups} hits ({store_stats['hits'] / max(store_lookups, 1):.1%})")
+    print(f"    conversions: {converted} for {occurrences} formula occurrences")
+    print(
+        f"    per document: p50={percentile(timings, 0.5) * 1e3:.2f}ms  "
+        f"p99={percentile(timings, 0.99) * 1e3:.2f}ms"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark LaTeX to OMML conversion on the formula corpus.")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per formula; the best is kept")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--per-document", type=int, default=60)
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--no-baseline", action="store_true", help="skip timing the MathML chain")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on golden or conformance failures")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite the golden digests and exit")
+    args = parser.parse_args(argv)
+
+    seeds = load_seeds()
+    if args.update_golden:
+        write_golden(seeds)
+        print(f"wrote {len(seeds)} golden digests to {GOLDEN_PATH}")
+        return 0
+    formulas = build_corpus(seeds)
+    direct = [latex for latex in formulas if direct_latex_to_omml(latex) is not None]
+    print(f"corpus: {len(formulas)} formulas from {len(seeds)} seeds, {len(direct) / len(formulas):.1%} direct")
+
+    print("conversion (uncached)")
+    timings = dict(zip(formulas, time_conversions(formulas, latex_to_omml, args.repeat)))
+    direct_set = set(direct)
+    print(_timing_line("latex_to_omml", list(timings.values())))
+    print(_timing_line("  direct", [timings[latex] for latex in direct]))
+    print(_timing_line("  fallback", [t for latex, t in timings.items() if latex not in direct_set]))
+    if not args.no_baseline:
+        print(_timing_line("mathml chain", time_conversions(formulas, mathml_latex_to_omml, args.repeat)))
+
+    print(f"documents: {args.documents} x {args.per_document} formulas")
+    documents = sample_documents(formulas, documents=args.documents, per_document=args.per_document)
+    _document_report("in-memory cache", documents, OmmlCache(args.cache_size), None)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = OmmlStore(Path(tmp) / "omml_cache.db")
+        run_documents(documents, OmmlCache(args.cache_size), store)
+        _document_report("restarted process, shared store", documents, OmmlCache(args.cache_size), OmmlStore(store.path))
+
+    golden = golden_mismatches(load_golden())
+    conformance = conformance_mismatches(formulas)
+    print(f"golden: {len(golden)} changed of {len(seeds)}")
+    for latex in golden[:10]:
+        print(f"  {latex}")
+    print(f"conformance: {len(conformance)} direct conversions differ from the MathML chain")
+    for latex in conformance[:10]:
+        print(f"  {latex}")
+    return 1 if args.check and (golden or conformance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -70,3 +70,92 @@ def test_preview_endpoint_supports_bibliography_source_manager():
     assert response.status_code == 200
     payload = response.json()
     assert payload["refs"] == ["[1]"]
+
+
+def test_preview_endpoint_returns_binary_ast_when_accepted(tmp_path, monkeypatch):
+    from formatter.ast_codec import AST_MEDIA_TYPE, decode_ast
+    from formatter.markdown_parser import parse_markdown
+
+    monkeypatch.setenv("AST_CACHE_DIR", str(tmp_path))
+    client = TestClient(app)
+    for _ in range(2):
+        response = client.post(
+            "/api/preview",
+            json={"markdown": "# Title\n\nHello **world**."},
+            headers={"Accept": f"{AST_MEDIA_TYPE}, application/json;q=0.5"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == AST_MEDIA_TYPE
+        assert decode_ast(response.content) == parse_markdown("# Title\n\nHello **world**.", compact=True)
+    assert len(list(tmp_path.glob("*.ast"))) == 1
+
+
+def test_outline_endpoint_returns_headings_and_counts():
+    client = TestClient(app)
+    response = client.post("/api/outline", json={"markdown": "# 一\n\n正文\n\n```\n# 不是标题\n```\n\n## 二\n"})
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["headings"] == [
+        {"level": 1, "text": "一", "line": 1},
+        {"level": 1, "text": "二", "line": 9},
+    ]
+    assert payload["summary"]["paragraphs"] == 1
+
+
+def test_preview_endpoint_renders_requested_window():
+    client = TestClient(app)
+    markdown = "# 一\n\n第一段\n\n# 二\n\n第二段\n"
+    response = client.post(
+        "/api/preview",
+        json={"markdown": markdown, "window": {"section": 1, "margin_lines": 0}},
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [node["text"] for node in payload["ast"]] == ["二", "第二段"]
+    assert "第一段" not in payload["preview_html"]
+    assert payload["summary"]["headings"] == 2
+    assert [item["text"] for item in payload["outline"]] == ["一", "二"]
+
+    response = client.post("/api/preview", json={"markdown": markdown, "window": {"section": 5}})
+    assert response.status_code == 422
+
+
+def test_preview_endpoint_resolves_citations_from_uploaded_library(tmp_path, monkeypatch):
+    monkeypatch.setenv("BIBLIOGRAPHY_DB_PATH", str(tmp_path / "bibliography.db"))
+    client = TestClient(app)
+
+    upload = client.post(
+        "/api/bibliography",
+        json={"sources_text": "@article{smith2024, title = {Cited Study}, year = {2024}}\n@book{doe2020, title = {Unused}}"},
+    )
+    assert upload.status_code == 200
+    library_id = upload.json()["library_id"]
+    assert upload.json()["entries"] == 2
+
+    response = client.post(
+        "/api/preview",
+        json={
+            "markdown": "Claim [@smith2024] and [@lee2021].",
+            "bibliography": {"library_id": library_id},
+        },
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["bibliography_coverage"] == {
+        "library_id": library_id,
+        "unresolved": ["lee2021"],
+        "unused": ["doe2020"],
+    }
+    assert [warning["code"] for warning in payload["lint_warnings"]] == ["bibliography_key_unresolved"]
+    reference_text = [run["text"] for item in payload["ast"][-1]["items"] for run in item[0]["runs"]]
+    assert reference_text == ['[1] "Cited Study," 2024.', "[2] 待补充参考文献"]
+
+    unknown = client.post(
+        "/api/preview",
+        json={"markdown": "Claim [@smith2024].", "bibliography": {"library_id": "missing"}},
+    )
+    assert unknown.status_code == 422
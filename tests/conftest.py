@@ -3,8 +3,17 @@ from __future__ import annotations
 import sys
 from pathlib import Path
 
+import pytest
+
 
 ROOT = Path(__file__).resolve().parents[1]
 APPS_FORMATTER = ROOT / "apps" / "formatter"
 if str(APPS_FORMATTER) not in sys.path:
     sys.path.insert(0, str(APPS_FORMATTER))
+
+
+@pytest.fixture(autouse=True)
+def _isolated_api_caches(tmp_path, monkeypatch):
+    # Keep the API's on-disk caches out of apps/api/data while tests run.
+    monkeypatch.setenv("AST_CACHE_DIR", str(tmp_path / "ast_cache"))
+    monkeypatch.setenv("MATH_CACHE_PATH", str(tmp_path / "omml_cache.db"))
@@ -7,3 +7,41 @@ def test_build_preview_payload_returns_summary_and_refs():
     assert payload["refs"] == ["[1]"]
     assert payload["lint_warnings"] == []
     assert "quality_report" in payload
+
+
+def test_build_preview_payload_tokenizes_markdown_once(monkeypatch):
+    import formatter.markdown_parser as markdown_parser
+
+    calls = []
+    original = markdown_parser.MarkdownIt.parse
+
+    def counting_parse(self, src, env=None):
+        calls.append(src)
+        return original(self, src, env)
+
+    monkeypatch.setattr(markdown_parser.MarkdownIt, "parse", counting_parse)
+
+    payload = build_preview_payload(
+        "# Title\n\n公式：\n$$\nx\n$$\n\n| A | B |\n| --- | --- |\n| 1 | 2 |",
+        incremental=False,
+    )
+
+    assert len(calls) == 1
+    assert "<table>" in payload["preview_html"]
+    assert payload["summary"]["math_blocks"] == 1
+
+
+def test_build_preview_payload_incremental_matches_full_parse():
+    text = "# Title\n\nHello [1].\n\n- [x] done\n\n| A | B |\n| --- | --- |\n| 1 | 2 |"
+    assert build_preview_payload(text) == build_preview_payload(text, incremental=False)
+
+
+def test_build_preview_payload_warns_about_malformed_bibtex_sources():
+    payload = build_preview_payload(
+        "结论 [@good]",
+        bibliography_style="ieee",
+        bibliography_sources="@article{good, title = {Fine}}\n@article{bad, title = {open\n",
+    )
+
+    assert [warning["code"] for warning in payload["lint_warnings"]] == ["bibtex_entry_malformed"]
+    assert "第 2 行" in payload["lint_warnings"][0]["message"]
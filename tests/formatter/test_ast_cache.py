@@ -0,0 +1,66 @@
+import formatter.pipeline as pipeline
+from formatter.ast_nodes import coerce_ast
+from formatter.ast_cache import AstCache, document_key
+from formatter.pipeline import format_markdown
+
+TEXT = "# 标题\n\n正文 [@smith] 与 $x$。\n\n| A |\n|---|\n| 1 |\n"
+SOURCES = "@article{smith, author = {Smith, John}, title = {Deep Work}, journal = {Nature}, year = {2024}}"
+
+
+def test_format_markdown_reuses_cached_ast(tmp_path, monkeypatch):
+    cache = AstCache(tmp_path)
+    first = format_markdown(TEXT, compact=True, cache=cache)
+    uncached_dicts = format_markdown(TEXT)["ast"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached documents must not be re-tokenized")
+
+    monkeypatch.setattr(pipeline, "tokenize_markdown", fail)
+    second = format_markdown(TEXT, compact=True, cache=cache)
+
+    assert second["ast"] == first["ast"]
+    assert second["refs"] == first["refs"] == ["[1]"]
+    assert "<table>" in second["preview_html"]
+    assert list(coerce_ast(format_markdown(TEXT, cache=cache)["ast"])) == list(coerce_ast(uncached_dicts))
+    assert cache.stats() == {"hits": 2, "misses": 1}
+
+
+def test_cache_key_covers_bibliography_inputs(tmp_path):
+    cache = AstCache(tmp_path)
+    ieee = format_markdown(TEXT, bibliography_sources=SOURCES, compact=True, cache=cache)
+    apa = format_markdown(TEXT, bibliography_style="apa", bibliography_sources=SOURCES, compact=True, cache=cache)
+    format_markdown(TEXT, compact=True, cache=cache)
+
+    assert document_key(TEXT, "ieee", SOURCES) != document_key(TEXT, "apa", SOURCES)
+    assert cache.stats() == {"hits": 0, "misses": 3}
+    assert apa["ast"] == format_markdown(TEXT, bibliography_style="apa", bibliography_sources=SOURCES, compact=True)["ast"]
+    assert ieee["ast"] != apa["ast"]
+
+
+def test_cache_evicts_oldest_entries_and_ignores_corrupt_files(tmp_path):
+    cache = AstCache(tmp_path, max_entries=2)
+    for i in range(4):
+        format_markdown(f"# 第{i}章\n", cache=cache)
+
+    assert len(list(tmp_path.glob("*.ast"))) == 2
+
+    key = document_key("# 第3章\n", "ieee", "")
+    (tmp_path / f"{key}.ast").write_bytes(b"RFAC\x00garbage")
+    assert cache.get(key) is None
+    assert format_markdown("# 第3章\n", compact=True, cache=cache)["ast"][0].text == "第3章"
+    assert cache.get(key) is not None
+
+
+def test_cache_counts_entries_instead_of_scanning_on_every_write(tmp_path, monkeypatch):
+    cache = AstCache(tmp_path, max_entries=16)
+    scans = []
+    evict = cache._evict
+    monkeypatch.setattr(cache, "_evict", lambda: scans.append(1) or evict())
+
+    for i in range(40):
+        format_markdown(f"# 第{i}章\n", cache=cache)
+
+    # One scan counts the directory; after that only overshooting the 2-entry slack
+    # (the 19th file, then every third) triggers a sweep.
+    assert len(scans) == 9
+    assert 16 <= len(list(tmp_path.glob("*.ast"))) <= 18
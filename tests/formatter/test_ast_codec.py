@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from formatter.ast_codec import decode_ast, encode_ast
+from formatter.ast_nodes import (
+    BOLD,
+    ITALIC,
+    Blockquote,
+    Cell,
+    CodeBlock,
+    Figure,
+    Heading,
+    ListNode,
+    MathBlock,
+    MathRun,
+    Paragraph,
+    Run,
+    Table,
+    ast_to_dicts,
+)
+from formatter.markdown_parser import parse_markdown
+
+
+def test_encode_ast_round_trips_every_node_type():
+    nodes = [
+        Heading(2, "标题", [Run("标题", BOLD | ITALIC), MathRun("x^2")], auto_generated=True),
+        Paragraph("done", [Run("done")], checked=True),
+        Paragraph("todo", [Run("todo")], checked=False),
+        ListNode(True, 1, 0, [[Paragraph("a", [Run("a")])], [], [Blockquote([MathBlock("E=mc^2")])]]),
+        ListNode(False, 2, -3, []),
+        Table(["left", ""], [Cell("A", [Run("A")]), Cell("", [])], [[Cell("1", [Run("1", BOLD)])]]),
+        CodeBlock("print(1)", "python"),
+        Figure("a.png", "图", "图 1 示例"),
+    ]
+
+    assert decode_ast(encode_ast(nodes)) == nodes
+
+
+def test_encoded_ast_is_smaller_than_json_and_survives_deep_nesting():
+    text = "".join(f"## 第{i}节\n\n正文 **粗体** $x_{i}$ [1]。\n\n- 项目\n  - 子项\n\n" for i in range(50))
+    nodes = parse_markdown(text, compact=True)
+    encoded = encode_ast(nodes)
+
+    assert decode_ast(encoded) == nodes
+    assert len(encoded) * 5 < len(json.dumps(ast_to_dicts(nodes), ensure_ascii=False).encode("utf-8"))
+
+    deep = [Paragraph("leaf", [Run("leaf")])]
+    for _ in range(3000):
+        deep = [Blockquote(deep)]
+    encoded = encode_ast(deep)
+    assert encode_ast(decode_ast(encoded)) == encoded
+
+
+@pytest.mark.parametrize("data", [b"", b"not an ast", encode_ast([Heading(1, "t", [])])[:-1]])
+def test_decode_ast_rejects_corrupt_input(data):
+    with pytest.raises(ValueError):
+        decode_ast(data)
@@ -0,0 +1,93 @@
+from formatter.ast_nodes import (
+    BOLD,
+    Blockquote,
+    LINK,
+    SUPERSCRIPT,
+    Heading,
+    ListNode,
+    MathRun,
+    Paragraph,
+    Run,
+    ast_to_dicts,
+    coerce_ast,
+    style_from_dict,
+    style_to_dict,
+    walk_nodes,
+)
+from formatter.markdown_parser import parse_markdown
+
+
+def test_style_bitmask_round_trips_through_dict():
+    style = BOLD | SUPERSCRIPT | LINK
+    data = style_to_dict(style)
+
+    assert data == {
+        "bold": True,
+        "italic": False,
+        "strike": False,
+        "highlight": False,
+        "superscript": True,
+        "subscript": False,
+        "code": False,
+        "link": True,
+    }
+    assert style_from_dict(data) == style
+
+
+def test_compact_nodes_use_slots():
+    run = Run("text", BOLD)
+    paragraph = Paragraph("text", [run, MathRun("x")])
+
+    assert not hasattr(run, "__dict__")
+    assert not hasattr(paragraph, "__dict__")
+
+
+def test_compact_ast_converts_to_json_shape():
+    text = (
+        "# 标题\n\n**粗体** [链接](https://example.com) $x$\n\n- [x] 完成\n\n> 引用\n\n"
+        "| A | B |\n| --- | ---: |\n| 1 | 2 |\n\n```py\ncode\n```\n\n$$\ny\n$$\n\n![图](a.png)"
+    )
+    nodes = parse_markdown(text, compact=True)
+    dicts = ast_to_dicts(nodes)
+
+    assert dicts == parse_markdown(text)
+    assert list(coerce_ast(dicts)) == nodes
+
+
+def test_coerce_ast_fills_defaults_for_partial_dicts():
+    nodes = list(
+        coerce_ast(
+            [
+                {"type": "heading", "text": "Title"},
+                {"type": "paragraph", "text": "Hi", "runs": [{"text": "Hi", "bold": True}]},
+                {"type": "unknown"},
+            ]
+        )
+    )
+
+    assert nodes == [
+        Heading(1, "Title", []),
+        Paragraph("Hi", [Run("Hi", BOLD)]),
+    ]
+
+
+def test_deep_nodes_convert_without_recursion():
+    node = Paragraph("deep", [Run("deep")])
+    for level in range(3000, 0, -1):
+        node = ListNode(False, level, 1, [[Blockquote([node])]])
+
+    data = ast_to_dicts([node])[0]
+    restored = next(coerce_ast([data]))
+    for _ in range(3000):
+        data = data["items"][0][0]["children"][0]
+        restored = restored.items[0][0].children[0]
+
+    assert data["text"] == "deep"
+    assert restored == Paragraph("deep", [Run("deep")])
+
+
+def test_walk_nodes_visits_list_items_and_quotes_in_document_order():
+    nodes = parse_markdown("# h\n\n- a\n  > b\n- c\n\n> d\n", compact=True)
+
+    visited = [node.type for node in walk_nodes(nodes)]
+    assert visited == ["heading", "list", "paragraph", "blockquote", "paragraph", "paragraph", "blockquote", "paragraph"]
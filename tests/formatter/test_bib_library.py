@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from formatter.bib_library import BibliographyLibrary
+
+SOURCES = """
+[1] Manual source entry.
+@article{smith2024, author = {Smith, John}, title = {A Practical Study}, year = {2024}}
+@book{doe2020, title = {Unused Book}, year = {2020}}
+@misc{broken, title = {never closed
+"""
+
+
+def test_store_is_idempotent_and_reports_malformed_entries(tmp_path):
+    library = BibliographyLibrary(tmp_path / "bibliography.db")
+
+    first = library.store(SOURCES)
+    second = library.store(SOURCES)
+
+    assert first.library_id == second.library_id
+    assert first.entries == second.entries == 3
+    assert [entry.key for entry in first.malformed] == ["broken"]
+    with sqlite3.connect(tmp_path / "bibliography.db") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM bibliography_entries").fetchone()[0] == 3
+
+
+def test_store_tolerates_a_concurrent_upload_of_the_same_library(tmp_path):
+    path = tmp_path / "bibliography.db"
+
+    class _RacedConnection:
+        # Another worker commits the same library after this one's existence check.
+        def __init__(self, conn):
+            self._conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def executemany(self, *args):
+            BibliographyLibrary(path).store(SOURCES)
+            return self._conn.executemany(*args)
+
+    class RacedLibrary(BibliographyLibrary):
+        def _connect(self):
+            return _RacedConnection(super()._connect())
+
+    stored = RacedLibrary(path).store(SOURCES)
+
+    assert stored.entries == 3
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM bibliography_entries").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM bibliography_libraries").fetchone()[0] == 1
+
+
+def test_lookup_fetches_only_requested_keys_and_lists_unused_entries(tmp_path):
+    library = BibliographyLibrary(tmp_path / "bibliography.db")
+    library_id = library.store(SOURCES).library_id
+
+    found = library.lookup(library_id, ["1", "smith2024", "missing"])
+
+    assert found.sources["1"] == "Manual source entry."
+    assert found.sources["smith2024"].fields == {
+        "author": "Smith, John",
+        "title": "A Practical Study",
+        "year": "2024",
+    }
+    assert set(found.sources) == {"1", "smith2024"}
+    assert found.unused == ["doe2020"]
+    with pytest.raises(ValueError):
+        library.lookup("0" * 32, ["1"])
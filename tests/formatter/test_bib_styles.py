@@ -0,0 +1,91 @@
+import pytest
+
+from formatter.bib_styles import FormattedEntryCache, format_bib_entry
+from formatter.bibtex import BibEntry
+from formatter.citations import build_bibliography_nodes
+
+ARTICLE = BibEntry(
+    "article",
+    "smith2024",
+    {
+        "author": "Smith, John Ronald and Jean-Paul Doe and Li, Wei",
+        "title": "Deep Learning for Reports",
+        "journal": "Journal of Testing",
+        "volume": "12",
+        "number": "3",
+        "pages": "101--110",
+        "year": "2024",
+    },
+)
+BOOK = BibEntry(
+    "book",
+    "knuth1997",
+    {
+        "author": "Knuth, Donald E.",
+        "title": "The Art of Computer Programming",
+        "publisher": "Addison-Wesley",
+        "address": "Reading, MA",
+        "edition": "3",
+        "year": "1997",
+    },
+)
+
+
+@pytest.mark.parametrize(
+    ("style", "entry", "expected"),
+    [
+        (
+            "ieee",
+            ARTICLE,
+            'J. R. Smith, J.-P. Doe, and W. Li, "Deep Learning for Reports," Journal of Testing, '
+            "vol. 12, no. 3, pp. 101–110, 2024.",
+        ),
+        (
+            "gbt",
+            ARTICLE,
+            "SMITH J R, DOE J-P, LI W. Deep Learning for Reports[J]. Journal of Testing, 2024, 12(3): 101-110.",
+        ),
+        (
+            "apa",
+            ARTICLE,
+            "Smith, J. R., Doe, J.-P., & Li, W. (2024). Deep Learning for Reports. Journal of Testing, "
+            "12(3), 101–110.",
+        ),
+        ("ieee", BOOK, "D. E. Knuth, The Art of Computer Programming, 3rd ed. Reading, MA: Addison-Wesley, 1997."),
+        ("gbt", BOOK, "KNUTH D E. The Art of Computer Programming[M]. 3版. Reading, MA: Addison-Wesley, 1997."),
+        ("apa", BOOK, "Knuth, D. E. (1997). The Art of Computer Programming (3rd ed.). Addison-Wesley."),
+        (
+            "gbt",
+            BibEntry("phdthesis", "zhang", {"author": "张三 and 李四 and 王五 and 赵六", "title": "论文", "school": "清华大学", "year": "2020"}),
+            "张三, 李四, 王五, 等. 论文[D]. 清华大学, 2020.",
+        ),
+    ],
+)
+def test_format_bib_entry_follows_each_style(style, entry, expected):
+    assert format_bib_entry(entry, style) == expected
+
+
+def test_formatted_entry_cache_reuses_text_per_style_and_entry():
+    cache = FormattedEntryCache(max_entries=4)
+
+    first = cache.format(ARTICLE, "ieee")
+    cache.format(ARTICLE, "apa")
+    again = cache.format(BibEntry("article", "other-key", dict(ARTICLE.fields)), "IEEE")
+
+    assert again == first
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2}
+
+
+def test_build_bibliography_nodes_formats_bibtex_sources_in_the_requested_style():
+    nodes = build_bibliography_nodes(
+        refs=["[1]", "[2]"],
+        style="gbt",
+        sources={"smith2024": ARTICLE, "2": "手工条目。"},
+        key_number_map={1: "smith2024"},
+    )
+
+    texts = [item[0]["text"] for item in nodes[-1]["items"]]
+    assert texts == [
+        "[1] SMITH J R, DOE J-P, LI W. Deep Learning for Reports[J]. Journal of Testing, 2024, 12(3): 101-110.",
+        "[2] 手工条目。",
+    ]
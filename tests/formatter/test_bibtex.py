@@ -0,0 +1,77 @@
+import io
+import mmap
+
+import pytest
+
+from formatter.bibtex import BibEntry, MalformedEntry, parse_bibtex
+
+LIBRARY = """% exported for user@example.com
+@string{press = "Test Press"}
+@article{Smith2024,
+  author = {Smith, John and Doe, Jane},
+  title = {The {GPU} Book: {Nested {deep}} braces},
+  publisher = press # " Ltd",
+  year = 2024,
+}
+@comment{ignored {entry} }
+@book(li2019, title = "Quoted {Title}", year = {2019})
+@misc{broken, title = {never closed
+@inproceedings{ok2021, title = {Fine}}
+@article{, title = {no key}}
+"""
+
+
+def test_parse_bibtex_handles_nested_braces_macros_and_reports_malformed_entries():
+    entries, malformed = parse_bibtex(LIBRARY)
+
+    assert entries == [
+        BibEntry(
+            "article",
+            "Smith2024",
+            {
+                "author": "Smith, John and Doe, Jane",
+                "title": "The GPU Book: Nested deep braces",
+                "publisher": "Test Press Ltd",
+                "year": "2024",
+            },
+            line=3,
+        ),
+        BibEntry("book", "li2019", {"title": "Quoted Title", "year": "2019"}, line=10),
+        BibEntry("inproceedings", "ok2021", {"title": "Fine"}, line=12),
+    ]
+    assert malformed == [
+        MalformedEntry(11, "broken", "花括号不配对"),
+        MalformedEntry(13, "", "缺少条目键"),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, 4096])
+def test_parse_bibtex_streams_file_objects_and_mmap_across_chunk_boundaries(tmp_path, chunk_size):
+    expected = parse_bibtex(LIBRARY)
+
+    assert parse_bibtex(io.StringIO(LIBRARY), chunk_size=chunk_size) == expected
+    assert parse_bibtex(io.BytesIO(LIBRARY.encode("utf-8")), chunk_size=chunk_size) == expected
+
+    path = tmp_path / "library.bib"
+    path.write_bytes(LIBRARY.encode("utf-8"))
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert parse_bibtex(mapped, chunk_size=chunk_size) == expected
+
+
+def test_parse_bibtex_unbalanced_entry_does_not_swallow_the_rest_of_the_library():
+    body = "".join(f"@article{{k{i},\n  title = {{Title {i}}},\n  year = {{2020}}\n}}\n" for i in range(2000))
+    entries, malformed = parse_bibtex("@misc{bad, title = {open\n" + body)
+
+    assert len(entries) == 2000
+    assert malformed == [MalformedEntry(1, "bad", "花括号不配对")]
+    assert entries[-1].line == 1 + 4 * 1999 + 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_parse_bibtex_keeps_the_entry_after_one_missing_its_closing_brace(chunk_size):
+    text = "@article{a, title={A}, year={2020}\n@article{b, title={B}}\n  @misc{c, title = {C}"
+
+    entries, malformed = parse_bibtex(io.StringIO(text), chunk_size=chunk_size)
+
+    assert entries == [BibEntry("article", "b", {"title": "B"}, line=2)]
+    assert [(item.line, item.key) for item in malformed] == [(1, "a"), (3, "c")]
@@ -1,4 +1,10 @@
-from formatter.citations import build_bibliography_nodes, normalize_citations, parse_bibliography_sources
+from formatter.citations import (
+    BibliographySourceCache,
+    build_bibliography_nodes,
+    normalize_citations,
+    parse_bibliography_report,
+    parse_bibliography_sources,
+)
 
 
 def test_normalize_citations_extracts_sorted_unique_refs():
@@ -46,3 +52,38 @@ def test_build_bibliography_nodes_uses_source_text_and_style():
     bibliography = nodes[-1]
     assert bibliography["type"] == "list"
     assert bibliography["items"][0][0]["text"] == "Wang, L. (2024). Report Writing."
+
+
+def test_parse_bibliography_report_lists_malformed_bibtex_entries():
+    raw = """
+@article{good, title = {Kept {Nested} Title}, year = {2024}}
+@article{bad, title = {missing brace
+@book{after, title = {Still Parsed}}
+"""
+
+    sources, malformed = parse_bibliography_report(raw)
+    assert {key: source.fields["title"] for key, source in sources.items()} == {
+        "good": "Kept Nested Title",
+        "after": "Still Parsed",
+    }
+    assert [(entry.line, entry.key) for entry in malformed] == [(3, "bad")]
+
+
+def test_bibliography_source_cache_parses_unchanged_sources_once(monkeypatch):
+    import formatter.citations as citations
+
+    calls = []
+    parse = citations._parse_bibliography_report
+    monkeypatch.setattr(citations, "_parse_bibliography_report", lambda text: calls.append(text) or parse(text))
+    cache = BibliographySourceCache(max_entries=2)
+    first = "[1] First source."
+
+    sources, _ = cache.parse(first)
+    sources["1"] = "mutated by a caller"
+    assert cache.parse(first)[0] == {"1": "First source."}
+    cache.parse("[2] Second source.")
+    cache.parse("[3] Third source.")
+    cache.parse(first)
+
+    assert calls == [first, "[2] Second source.", "[3] Third source.", first]
+    assert cache.stats() == {"hits": 1, "misses": 4, "size": 2}
@@ -3,8 +3,10 @@ import base64
 from docx import Document
 from docx.enum.text import WD_COLOR_INDEX, WD_ALIGN_PARAGRAPH
 
+from formatter import docx_builder
 from formatter.config import FormatConfig
-from formatter.docx_builder import build_docx
+from formatter.docx_builder import OmmlElementCache, build_docx
+from formatter.pipeline import iter_formatted_markdown
 
 
 ONE_PIXEL_PNG = base64.b64decode(
@@ -299,6 +301,19 @@ def test_build_docx_renders_math(tmp_path):
     assert "oMath" in xml
 
 
+def test_omml_element_cache_hands_out_independent_copies():
+    cache = OmmlElementCache()
+    first = cache.element(r"\alpha")
+    second = cache.element(r"\alpha")
+
+    assert first is not second
+    assert first.tag.endswith("}oMath")
+    size = len(first)
+    first.append(second)
+    assert len(cache.element(r"\alpha")) == size
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 1}
+
+
 def test_math_block_adds_equation_number(tmp_path):
     ast = [{"type": "math_block", "latex": "x"}]
     output = tmp_path / "out.docx"
@@ -493,6 +508,34 @@ def test_build_docx_renders_blockquotes(tmp_path):
     assert 'w:left="420"' in paragraph._p.xml
 
 
+def test_build_docx_renders_nested_blockquotes_with_deeper_indent(tmp_path):
+    from formatter.markdown_parser import parse_markdown
+
+    output = tmp_path / "quotes.docx"
+    build_docx(parse_markdown("> 第一层\n>\n> > 第二层"), output, FormatConfig())
+
+    doc = Document(output)
+    assert [paragraph.text for paragraph in doc.paragraphs] == ["第一层", "第二层"]
+    assert 'w:left="420"' in doc.paragraphs[0]._p.xml
+    assert 'w:left="840"' in doc.paragraphs[1]._p.xml
+
+
+def test_build_docx_handles_nesting_deeper_than_recursion_limit(tmp_path):
+    from formatter.ast_nodes import Blockquote, ListNode, Paragraph, Run
+
+    node = Paragraph("最内层", [Run("最内层")])
+    for _ in range(1500):
+        node = Blockquote([node])
+    node = ListNode(False, 1, 1, [[Paragraph("外层", [Run("外层")]), node]])
+
+    output = tmp_path / "deep.docx"
+    build_docx([node], output, FormatConfig())
+
+    doc = Document(output)
+    assert [paragraph.text for paragraph in doc.paragraphs] == ["外层", "最内层"]
+    assert 'w:left="3360"' in doc.paragraphs[1]._p.xml
+
+
 def test_build_docx_renders_figures_with_caption_numbering(tmp_path):
     image_path = tmp_path / "figure.png"
     image_path.write_bytes(ONE_PIXEL_PNG)
@@ -524,3 +567,48 @@ def test_build_docx_renders_figures_with_caption_numbering(tmp_path):
     assert "图 1 系统总体架构" in paragraph_texts
     assert "图 2 数据处理流程" in paragraph_texts
     assert "graphicData" in doc.part._element.xml
+
+
+def test_build_docx_consumes_streamed_nodes(tmp_path):
+    output = tmp_path / "streamed.docx"
+    build_docx(iter_formatted_markdown("# Title\n\nHello [1].\n\n- item"), output, FormatConfig())
+
+    doc = Document(output)
+    texts = [paragraph.text for paragraph in doc.paragraphs]
+    assert texts[:3] == ["Title", "Hello [1].", "item"]
+    assert "[1] 待补充参考文献" in texts
+
+
+def test_build_docx_streams_nodes_with_math_without_preparing_them(tmp_path, monkeypatch):
+    events = []
+    add_math_run = docx_builder._add_math_run
+
+    def recording_add_math_run(paragraph, latex):
+        events.append(f"math:{latex}")
+        add_math_run(paragraph, latex)
+
+    def streamed():
+        for node in iter_formatted_markdown("Sum $x$ first.\n\nSum $y$ second.\n\nEnd."):
+            events.append("node")
+            yield node
+
+    monkeypatch.setattr(docx_builder, "_add_math_run", recording_add_math_run)
+    monkeypatch.setattr(docx_builder, "prepare_formulas", None)
+    output = tmp_path / "streamed-math.docx"
+    assert build_docx(streamed(), output, FormatConfig(), math_workers=4) == []
+
+    assert events[:4] == ["node", "math:x", "node", "math:y"]
+    assert "oMath" in Document(output).paragraphs[1]._p.xml
+
+
+def test_build_docx_accepts_compact_nodes(tmp_path):
+    from formatter.markdown_parser import parse_markdown
+
+    output = tmp_path / "compact.docx"
+    build_docx(parse_markdown("# Title\n\n**Bold** ==mark==", compact=True), output, FormatConfig())
+
+    doc = Document(output)
+    runs = doc.paragraphs[1].runs
+    assert doc.paragraphs[0].text == "Title"
+    assert runs[0].bold is True
+    assert runs[2].font.highlight_color == WD_COLOR_INDEX.YELLOW
@@ -0,0 +1,72 @@
+from formatter.incremental import IncrementalParser
+from formatter.markdown_parser import parse_markdown, render_preview_html
+
+
+def _sections(count):
+    return "\n\n".join(f"## 第 {idx} 节\n\n正文 **{idx}**，公式 $x_{idx}$。" for idx in range(count))
+
+
+def test_incremental_parser_matches_full_parse():
+    text = (
+        "# 标题\n\n- [x] 完成\n- [ ] 待办\n\n> 引用\n延续\n\n| A | B |\n|:--|--:|\n| 1 | 2 |\n\n"
+        "```py\nx = 1\n\n\ny = 2\n```\n\n$$\nx^2\n$$\n参见 [文档][docs]\n\n[docs]: https://example.com\n"
+    )
+    parser = IncrementalParser()
+
+    for _ in range(2):
+        ast, html = parser.parse(text)
+        assert ast == parse_markdown(text)
+        assert html == render_preview_html(text)
+
+
+def test_incremental_parser_keys_blocks_on_trailing_newline():
+    parser = IncrementalParser()
+    for text in ("<u>", "<u>\n\n# ", "```\nx", "```\nx\n\n", "<u>\n"):
+        _, html = parser.parse(text)
+        assert html == render_preview_html(text), text
+
+
+def test_incremental_parser_only_reparses_edited_blocks():
+    parser = IncrementalParser()
+    text = _sections(200)
+    parser.parse(text)
+    assert parser.stats()["misses"] == 400
+
+    edited = text.replace("正文 **100**", "正文 **100**!")
+    ast, _ = parser.parse(edited)
+
+    stats = parser.stats()
+    assert stats["misses"] == 401
+    assert stats["hits"] == 399
+    assert ast == parse_markdown(edited)
+
+
+def test_incremental_parser_invalidates_blocks_when_references_change():
+    parser = IncrementalParser()
+    before = "See [docs].\n\n[docs]: https://a.example"
+    after = "See [docs].\n\n[docs]: https://b.example"
+
+    parser.parse(before)
+    ast, _ = parser.parse(after)
+
+    assert ast == parse_markdown(after)
+    assert "https://b.example" in ast[0]["text"]
+
+
+def test_incremental_parser_rebuilds_footnote_documents():
+    parser = IncrementalParser()
+    parser.parse("正文[^1]\n\n[^1]: 旧注释")
+    text = "正文[^1]\n\n[^1]: 新注释"
+
+    ast, html = parser.parse(text)
+
+    assert ast == parse_markdown(text)
+    assert ast[-1]["text"] == "[1] 新注释"
+    assert html == render_preview_html(text)
+
+
+def test_incremental_parser_evicts_least_recently_used_blocks():
+    parser = IncrementalParser(max_blocks=10)
+    parser.parse(_sections(20))
+
+    assert parser.stats()["size"] == 10
@@ -1,4 +1,13 @@
-from formatter.latex import latex_to_omml
+from apps.formatter.scripts.math_bench import (
+    build_corpus,
+    conformance_mismatches,
+    golden_mismatches,
+    load_golden,
+    load_seeds,
+    unboxed,
+)
+from formatter.latex import OmmlCache, latex_to_omml, mathml_latex_to_omml
+from formatter.omml_direct import direct_latex_to_omml
 
 
 def test_latex_to_omml_returns_xml_string():
@@ -16,3 +25,58 @@ f(x) &= (x+1)^2 \\
     omml = latex_to_omml(latex)
     assert omml.strip().startswith("<m:oMath")
     assert "begin{aligned}" not in omml
+
+
+def test_omml_cache_converts_each_formula_once_and_evicts_oldest():
+    cache = OmmlCache(max_entries=2)
+
+    assert cache.convert("x") == latex_to_omml("x")
+    assert cache.convert("x") == latex_to_omml("x")
+    cache.convert(r"\alpha")
+    cache.convert("n")
+    assert cache.stats() == {"hits": 1, "misses": 3, "size": 2}
+
+    cache.convert("x")
+    assert cache.stats()["misses"] == 4
+
+
+
+def test_direct_converter_matches_mathml_chain():
+    formulas = [
+        "E = mc^2",
+        r"x_i^2 + \alpha \le \sqrt[3]{y}",
+        r"\frac{a+b}{c_{n+1}} \cdot \sin x",
+        r"x^23 - \frac12",
+        r"f(x) = \begin{cases} 1 & x > 0 \\ 0 \end{cases}",
+        r"\begin{bmatrix} a & b \\ c & d \end{bmatrix}",
+        r"\begin{aligned} f(x) &= (x+1)^2 \\ &= x^2 + 2x + 1 \end{aligned}",
+    ]
+    for latex in formulas:
+        direct = direct_latex_to_omml(latex)
+        assert direct is not None, latex
+        assert unboxed(direct) == unboxed(mathml_latex_to_omml(latex)), latex
+        assert latex_to_omml(latex) == direct
+
+
+def test_direct_converter_declines_unsupported_constructs():
+    for latex in (r"\left( x \right)", r"\mathbf{x}", r"\sum_{i=1}^n i"):
+        assert direct_latex_to_omml(latex) is None
+        assert latex_to_omml(latex) == mathml_latex_to_omml(latex)
+    # Input the chain rejects is left to it, so errors surface unchanged.
+    assert direct_latex_to_omml("x^") is None
+    assert direct_latex_to_omml(r"\begin{pmatrix} a \end{pmatrix}^2") is None
+
+
+def test_corpus_seeds_match_golden_omml():
+    golden = load_golden()
+    assert list(golden) == load_seeds()
+    # After an intended output change, refresh with: python -m apps.formatter.scripts.math_bench --update-golden
+    assert golden_mismatches(golden) == []
+
+
+def test_direct_converter_conforms_on_corpus_seeds():
+    seeds = load_seeds()
+    corpus = build_corpus(seeds)
+    assert len(corpus) > 2500
+    # The full corpus takes seconds through the MathML chain; the benchmark checks all of it.
+    assert conformance_mismatches(seeds + corpus[-20:]) == []
@@ -1,4 +1,18 @@
-from formatter.markdown_parser import parse_markdown
+from markdown_it.token import Token
+
+from formatter.ast_nodes import HIGHLIGHT, SUBSCRIPT, SUPERSCRIPT, Blockquote, ListNode, Run
+from formatter.markdown_parser import (
+    _emit_text_with_markers,
+    _build_markdown_it,
+    _parse_blocks,
+    build_ast,
+    get_markdown_it,
+    parse_markdown,
+    parse_markdown_iter,
+    render_document_html,
+    render_preview_html,
+    tokenize_markdown,
+)
 
 
 def run(text, **overrides):
@@ -200,6 +214,14 @@ def test_parse_markdown_footnotes_append_footnote_section():
     assert ast[-1]["text"] == "[1] 脚注内容"
 
 
+def test_parse_markdown_inline_footnotes_append_footnote_section():
+    ast = parse_markdown("正文^[这是行内脚注]结束")
+
+    assert ast[0]["text"] == "正文[1]结束"
+    assert ast[-1]["text"] == "[1] 这是行内脚注"
+    assert "footnote" in render_document_html(tokenize_markdown("正文^[这是行内脚注]结束"))
+
+
 def test_parse_markdown_image_generates_figure_node():
     ast = parse_markdown('![系统架构图](https://example.com/arch.png "总体架构")')
 
@@ -211,3 +233,170 @@ def test_parse_markdown_image_generates_figure_node():
             "caption": "总体架构",
         }
     ]
+
+
+def test_get_markdown_it_reuses_instances_per_profile():
+    plain = get_markdown_it("# Title\n\nHello")
+    assert get_markdown_it("Another plain document") is plain
+    assert get_markdown_it("$x$") is not plain
+    assert get_markdown_it("$x$ and $y$") is get_markdown_it("$z$")
+
+
+def test_parse_markdown_plain_profile_matches_full_profile():
+    text = "# 标题\n\n- 列表 **加粗**\n\n| A | B |\n| --- | --- |\n| 1 | 2 |\n\n> 引用 ~~删除~~"
+    tokens = _build_markdown_it().parse(text)
+    expected, _ = _parse_blocks(tokens, 0)
+
+    assert parse_markdown(text, compact=True) == expected
+
+
+def test_parse_markdown_is_safe_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    documents = [f"# 标题 {idx}\n\n正文 $x_{idx}$ 与脚注[^1]\n\n[^1]: 注释 {idx}" for idx in range(32)]
+    expected = [parse_markdown(text) for text in documents]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(parse_markdown, documents))
+
+    assert results == expected
+
+
+def test_parsed_document_feeds_ast_and_html():
+    text = "# Title\n\n正文[^1]\n\n[^1]: 注释"
+    document = tokenize_markdown(text)
+
+    assert build_ast(document) == parse_markdown(text)
+    assert render_document_html(document) == render_preview_html(text)
+
+
+def test_parse_markdown_iter_streams_same_nodes_as_parse_markdown():
+    import types
+
+    text = "# 标题\n\n段落 $x$\n\n- [x] 完成\n\n> 引用\n\n| A |\n| --- |\n| 1 |\n\n![图](a.png)"
+    nodes = parse_markdown_iter(text)
+
+    assert isinstance(nodes, types.GeneratorType)
+    assert list(nodes) == parse_markdown(text)
+
+
+def test_parse_markdown_iter_handles_footnotes():
+    text = "正文[^1]\n\n[^1]: 脚注内容"
+    assert list(parse_markdown_iter(text)) == parse_markdown(text)
+
+
+def test_emit_text_with_markers_keeps_unmatched_markers_as_text():
+    runs = []
+    _emit_text_with_markers("a^b ~c ==d", 0, runs)
+    assert runs == [Run("a^b"), Run(" ~c"), Run(" ==d")]
+
+    runs = []
+    _emit_text_with_markers("a==b ^c ~d==", 0, runs)
+    assert runs == [Run("a"), Run("b ^c ~d", HIGHLIGHT)]
+
+
+def test_emit_text_with_markers_skips_scanning_plain_text():
+    runs = [Run("前文")]
+    _emit_text_with_markers("没有任何标记的文本", 0, runs)
+    assert runs == [Run("前文没有任何标记的文本")]
+
+
+def test_emit_text_with_markers_is_linear_on_pathological_input(monkeypatch):
+    import formatter.markdown_parser as markdown_parser
+
+    calls = {"append": 0, "lookup": 0}
+    append_run, next_position = markdown_parser._append_run, markdown_parser._next_position
+
+    def counted_append(*args, **kwargs):
+        calls["append"] += 1
+        return append_run(*args, **kwargs)
+
+    def counted_lookup(*args):
+        calls["lookup"] += 1
+        return next_position(*args)
+
+    monkeypatch.setattr(markdown_parser, "_append_run", counted_append)
+    monkeypatch.setattr(markdown_parser, "_next_position", counted_lookup)
+
+    # Each marker costs at most a couple of run appends and one bisect, so work grows
+    # with the input instead of rescanning it per unmatched marker.
+    for size in (4_000, 16_000):
+        cases = ["x" * size + "^", "^" * (size + 1), "a~" * size, "==a" * size, "=^" * size, "~^=a" * size]
+        for text in cases:
+            runs = []
+            calls.update(append=0, lookup=0)
+            _emit_text_with_markers(text, 0, runs)
+            assert calls["append"] <= 2 * len(text) + 2, (text[:10], calls)
+            assert calls["lookup"] <= len(text) + 1, (text[:10], calls)
+            assert "".join(run.text for run in runs if run.style == 0).count("x") == text.count("x")
+
+
+def test_emit_text_with_markers_styles_long_segments_in_bulk():
+    runs = []
+    _emit_text_with_markers("H~" + "2" * 10_000 + "~O ^n^", 0, runs)
+
+    assert runs == [Run("H"), Run("2" * 10_000, SUBSCRIPT), Run("O"), Run(" "), Run("n", SUPERSCRIPT)]
+
+
+def test_parse_markdown_keeps_display_math_inline_in_headings_and_cells():
+    ast = parse_markdown("# 能量 $$E=mc^2$$\n\n| 公式 |\n| --- |\n| $$a+b$$ |")
+
+    assert ast[0]["runs"][-1] == math_run("E=mc^2")
+    assert ast[0]["text"] == "能量"
+    assert ast[1]["rows"][0][0]["runs"] == [math_run("a+b")]
+
+
+def test_parse_markdown_table_cell_image_keeps_alt_text():
+    ast = parse_markdown("| 图 |\n| --- |\n| ![架构](a.png) |")
+    assert ast[0]["rows"][0][0]["text"] == "架构"
+
+
+def test_parse_markdown_style_toggles_inside_links():
+    ast = parse_markdown("[**粗** 文](https://e.com)")
+    assert ast[0]["runs"] == [
+        run("粗", bold=True, link=True),
+        run(" 文", link=True),
+        run(" (https://e.com)"),
+    ]
+
+
+def test_parse_markdown_keeps_quotes_nested_past_commonmark_limit():
+    node = parse_markdown(">" * 60 + " 原文", compact=True)[0]
+    depth = 0
+    while isinstance(node, Blockquote):
+        depth += 1
+        node = node.children[0]
+
+    assert depth == 60
+    assert node.text == "原文"
+
+
+def test_parse_blocks_handles_nesting_deeper_than_recursion_limit():
+    depth = 1500
+    tokens = []
+    for _ in range(depth):
+        tokens += [
+            Token("bullet_list_open", "ul", 1),
+            Token("list_item_open", "li", 1),
+            Token("blockquote_open", "blockquote", 1),
+        ]
+    inline = Token("inline", "", 0, content="deep", children=[Token("text", "", 0, content="deep")])
+    tokens += [Token("paragraph_open", "p", 1), inline, Token("paragraph_close", "p", -1)]
+    for _ in range(depth):
+        tokens += [
+            Token("blockquote_close", "blockquote", -1),
+            Token("list_item_close", "li", -1),
+            Token("bullet_list_close", "ul", -1),
+        ]
+    tokens.append(Token("hr", "hr", 0))
+
+    ast, end = _parse_blocks(tokens, 0)
+
+    assert end == len(tokens)
+    node = ast[0]
+    for level in range(1, depth + 1):
+        assert isinstance(node, ListNode) and node.level == level
+        quote = node.items[0][0]
+        assert isinstance(quote, Blockquote)
+        node = quote.children[0]
+    assert node.text == "deep"
@@ -0,0 +1,116 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from docx import Document
+
+from formatter import math_prepare
+from formatter.docx_builder import build_docx
+from formatter.latex import _OMML_CACHE, OmmlCache, latex_to_omml
+from formatter.markdown_parser import parse_markdown
+from formatter.math_prepare import (
+    PARALLEL_MIN_FORMULAS,
+    MathBudget,
+    collect_formulas,
+    prepare_formulas,
+)
+from formatter.preview import lint_math_budget
+
+
+def test_collect_formulas_finds_nested_math_once_in_document_order():
+    text = (
+        "# $h$\n\n$x$ and $x$\n\n- item $y$\n  > quote $z$\n\n"
+        "| $a$ | b |\n| --- | --- |\n| $c$ | $x$ |\n\n$$\nE=mc^2\n$$\n"
+    )
+    nodes = parse_markdown(text, compact=True)
+
+    assert collect_formulas(nodes) == ["h", "x", "y", "z", "a", "c", "E=mc^2"]
+
+
+def test_prepare_formulas_fills_cache_from_executor_and_marks_failures():
+    cache = OmmlCache(max_entries=1000)
+    formulas = [f"x_{{{i}}}" for i in range(PARALLEL_MIN_FORMULAS)] + [r"\frac{"]
+
+    assert prepare_formulas(formulas[:10], workers=4, cache=cache).converted == 0
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prepared = prepare_formulas(formulas, workers=2, executor=executor, cache=cache)
+    assert prepared.converted == len(formulas)
+    assert prepared.rejected == []
+
+    assert cache.missing(formulas) == []
+    assert cache.convert("x_{7}") == latex_to_omml("x_{7}")
+    # The builder falls back to text instead of converting the failure again.
+    with pytest.raises(ValueError):
+        cache.convert(r"\frac{")
+    assert cache.stats()["hits"] == 2
+
+
+def test_formulas_over_budget_fall_back_to_latex_text_and_are_linted():
+    slow = "+".join([r"\frac{a}{b}"] * 5000)
+    large = r"\sum_{i=1}^{n} x_i^2"
+    cache = OmmlCache()
+
+    prepared = prepare_formulas(["x", slow], workers=1, cache=cache, budget=MathBudget(seconds=0.02))
+    assert prepared.rejected == [slow]
+    prepared = prepare_formulas([large], workers=1, cache=cache, budget=MathBudget(max_omml_chars=100))
+    assert prepared.rejected == [large]
+    assert cache.rejected(["x", slow, large]) == [slow, large]
+
+    _OMML_CACHE.reject(large)
+    try:
+        nodes = parse_markdown(f"Sum $y$ then\n\n$$\n{large}\n$$\n", compact=True)
+        output = io.BytesIO()
+        rejected = build_docx(nodes, output, math_workers=1)
+        paragraphs = Document(output).paragraphs
+        assert large in paragraphs[1].text
+        assert "oMath" in paragraphs[0]._p.xml
+
+        warnings = lint_math_budget(rejected)
+        assert [warning["code"] for warning in warnings] == ["math_over_budget"]
+    finally:
+        _OMML_CACHE.clear()
+
+
+def test_budgeted_pool_is_reused_and_replaced_after_a_late_formula(monkeypatch):
+    monkeypatch.setattr(math_prepare, "PARALLEL_MIN_FORMULAS", 4)
+    # Converted by the MathML chain in roughly a third of a second.
+    slow = "+".join([r"\mathbf{a}"] * 5000)
+    budget = MathBudget(seconds=0.1)
+    cache = OmmlCache()
+    try:
+        prepared = prepare_formulas([f"x_{{{i}}}" for i in range(8)], workers=2, cache=cache, budget=budget)
+        assert prepared.converted == 8 and prepared.rejected == []
+        pool = math_prepare._pool
+        prepare_formulas([f"w_{{{i}}}" for i in range(8)], workers=2, cache=cache, budget=budget)
+        assert math_prepare._pool is pool
+
+        formulas = ["y_{1}", slow, "y_{2}", "y_{3}", r"\frac{"]
+        prepared = prepare_formulas(formulas, workers=2, cache=cache, budget=budget)
+        assert prepared.rejected == [slow]
+        assert cache.missing(formulas) == []
+        assert cache.convert("y_{3}") == latex_to_omml("y_{3}")
+
+        prepared = prepare_formulas([f"z_{{{i}}}" for i in range(8)], workers=2, cache=cache, budget=budget)
+        assert prepared.converted == 8
+        assert math_prepare._pool is not None and math_prepare._pool is not pool
+    finally:
+        math_prepare._discard_pool()
+
+
+def test_small_batch_with_a_slow_formula_finishes_in_about_the_budget():
+    # About two seconds in the MathML chain.
+    slow = "+".join([r"\mathbf{a}"] * 20000)
+    budget = MathBudget(seconds=0.3)
+    cache = OmmlCache()
+    try:
+        prepare_formulas(["w"], workers=1, cache=cache, budget=budget)
+        start = time.perf_counter()
+        prepared = prepare_formulas(["x", slow], workers=1, cache=cache, budget=budget)
+        elapsed = time.perf_counter() - start
+
+        assert prepared.rejected == [slow]
+        assert cache.convert("x") == latex_to_omml("x")
+        assert elapsed < 1.0
+    finally:
+        math_prepare._discard_pool()
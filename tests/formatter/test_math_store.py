@@ -0,0 +1,47 @@
+import sqlite3
+
+from formatter.latex import OmmlCache, latex_to_omml
+from formatter.math_prepare import prepare_formulas
+from formatter.math_store import OmmlStore
+
+
+def test_omml_store_is_shared_between_instances_and_evicts_least_recent(tmp_path):
+    path = tmp_path / "omml_cache.db"
+    writer = OmmlStore(path, max_entries=2)
+    writer.put_many({"x": "<x/>", "y": "<y/>"})
+
+    reader = OmmlStore(path, max_entries=2)
+    assert reader.get_many(["x", "z"]) == {"x": "<x/>"}
+    assert reader.stats() == {"hits": 1, "misses": 1}
+
+    writer.put_many({"z": "<z/>"})
+    assert reader.get_many(["x", "y", "z"]) == {"x": "<x/>", "z": "<z/>"}
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    reader.signature = "other-converter"
+    assert reader.get_many(["x"]) == {}
+
+
+def test_prepare_formulas_loads_and_persists_conversions_through_store(tmp_path):
+    store = OmmlStore(tmp_path / "omml_cache.db")
+    first = OmmlCache()
+
+    assert prepare_formulas(["x^2", r"\frac{"], workers=1, cache=first, store=store).converted == 2
+    assert store.get_many(["x^2", r"\frac{"]) == {"x^2": latex_to_omml("x^2")}
+
+    restarted = OmmlCache()
+    assert prepare_formulas(["x^2"], workers=1, cache=restarted, store=store).converted == 0
+    assert restarted.convert("x^2") == latex_to_omml("x^2")
+    assert restarted.stats()["misses"] == 0
+
+
+def test_unusable_store_path_falls_back_to_converting(tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    store = OmmlStore(blocker / "omml_cache.db")
+    cache = OmmlCache()
+
+    assert store.get_many(["x^2"]) == {}
+    assert prepare_formulas(["x^2"], workers=1, cache=cache, store=store).converted == 1
+    assert cache.convert("x^2") == latex_to_omml("x^2")
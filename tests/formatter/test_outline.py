@@ -0,0 +1,73 @@
+import pytest
+
+from formatter.markdown_parser import parse_markdown
+from formatter.outline import build_outline
+from formatter.preview import summarize_ast
+
+DOCUMENT = """# 引言 #
+
+正文第一段，
+延续的一行。
+
+- 要点一
+- 要点二
+  - 细节
+
+1. 步骤
+2. 步骤
+
+| 指标 | 数值 |
+| --- | --- |
+| 延迟 | 12ms |
+
+```markdown
+# 代码里的标题
+- 代码里的列表
+![代码里的图](x.png)
+```
+
+$$
+E = mc^2
+$$
+
+![图 1](fig.png)
+
+方法
+----
+
+    缩进代码
+
+> 引用段落
+"""
+
+
+def test_build_outline_lists_headings_with_line_numbers():
+    outline = build_outline(DOCUMENT)
+
+    assert outline["headings"] == [
+        {"level": 1, "text": "引言", "line": 1},
+        {"level": 1, "text": "方法", "line": 29},
+    ]
+    assert outline["lines"] == DOCUMENT.count("\n") + 1
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        DOCUMENT,
+        "- a\n\n  more a\n\n- b\n\n1. x\n1) y\n",
+        "- a\n    - deep\n        - deeper\n",
+        "~~~\n```\n~~~\n# real\n\n* * *\n\n$$x$$\n",
+        "",
+    ],
+)
+def test_build_outline_counts_match_full_parse(text):
+    assert build_outline(text)["summary"] == summarize_ast(parse_markdown(text, compact=True))
+
+
+def test_build_outline_uses_ast_heading_levels():
+    text = "# 一\n\n## 二\n\n### 三\n\n#### 四\n\n##### 五\n\n###### 六\n\n七\n===\n\n八\n---\n"
+
+    levels = [item["level"] for item in build_outline(text)["headings"]]
+    assert levels == [node.level for node in parse_markdown(text, compact=True)]
+    assert levels == [1, 1, 2, 3, 4, 4, 1, 1]
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from formatter import parallel
+from formatter.markdown_parser import parse_markdown
+from formatter.parallel import _parse_section, can_parse_in_parallel, parse_markdown_parallel, split_sections
+from formatter.pipeline import format_markdown
+
+SECTION = (
+    "# 第{i}章\n\n正文 **粗体** $x^{i}$ [1]。\n\n- 项目\n  - 子项\n\n$$\nE=mc^2\n$$\n\n"
+    "```bash\n# 不是标题\n\n# 也不是\n```\n\n| a |\n|---|\n| {i} |\n\n> 引用\n\n![图{i}](a.png)\n\n"
+)
+
+
+def _document(count: int) -> str:
+    return "".join(SECTION.format(i=i) for i in range(count))
+
+
+def test_split_sections_cuts_only_before_safe_headings():
+    text = "# A\n\n```\n\n# in fence\n```\n\ntext\n# no blank line\n\n## B\n"
+    sections = split_sections(text, 1)
+
+    assert sections == ["# A\n\n```\n\n# in fence\n```\n\ntext\n# no blank line\n\n", "## B\n"]
+    assert "".join(split_sections(_document(5), 1)) == _document(5)
+
+
+def test_parallel_parse_matches_serial_parse():
+    text = _document(12)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        nodes = parse_markdown_parallel(text, workers=3, executor=executor)
+
+    assert nodes == parse_markdown(text, compact=True)
+
+
+def test_parallel_parse_runs_in_worker_processes():
+    text = _document(6)
+    assert parse_markdown_parallel(text, workers=2) == parse_markdown(text, compact=True)
+
+
+def test_section_ending_inside_raw_html_falls_back_to_serial_parse():
+    text = "前文\n\n<pre>\n\n# 仍在 pre 中\n\n</pre>\n\n# 标题\n"
+
+    assert _parse_section(split_sections(text, 1)[0])[1] is True
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        nodes = parse_markdown_parallel(text, workers=2, executor=executor)
+    assert nodes == parse_markdown(text, compact=True)
+
+
+def test_inline_footnotes_keep_document_wide_numbering(monkeypatch):
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_CHARS", 0)
+    text = "# A\n\n甲^[第一条]。\n\n# B\n\n乙^[第二条]。\n"
+
+    assert not can_parse_in_parallel(text)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        nodes = parse_markdown_parallel(text, workers=2, executor=executor)
+    assert nodes == parse_markdown(text, compact=True)
+    assert format_markdown(text, workers=2)["ast"] == format_markdown(text)["ast"]
+
+
+def test_format_markdown_parses_large_inputs_in_parallel(monkeypatch):
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_CHARS", 0)
+    text = _document(4) + "另见 [@smith]。\n"
+
+    result = format_markdown(text, workers=2)
+    serial = format_markdown(text)
+
+    assert result["document"] is None
+    assert result["ast"] == serial["ast"]
+    assert result["refs"] == ["[1]", "[2]"]
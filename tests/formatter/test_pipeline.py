@@ -1,4 +1,4 @@
-from formatter.pipeline import format_markdown
+from formatter.pipeline import format_markdown, iter_formatted_markdown
 
 
 def test_pipeline_returns_ast_and_refs():
@@ -68,3 +68,17 @@ def test_pipeline_renders_apa_style_without_bracket_prefix():
 
     bibliography = result["ast"][-1]
     assert bibliography["items"][0][0]["text"] == "Wang, L. (2024). Report Writing."
+
+
+def test_iter_formatted_markdown_matches_format_markdown():
+    text = "# Title\n\nSee [@smith2024] and [2]."
+    sources = "[smith2024] Smith, J. A Practical Study."
+
+    streamed = list(iter_formatted_markdown(text, bibliography_sources=sources))
+
+    assert streamed == format_markdown(text, bibliography_sources=sources)["ast"]
+
+
+def test_iter_formatted_markdown_skips_bibliography_when_heading_present():
+    streamed = list(iter_formatted_markdown("# 参考文献\n\n[1] Source."))
+    assert [node["text"] for node in streamed if node["type"] == "heading"] == ["参考文献"]
@@ -0,0 +1,72 @@
+from formatter.citations import normalize_citations
+from formatter.markdown_parser import _normalize_math_blocks, build_ast, parse_markdown, tokenize_markdown
+from formatter.preprocess import CitationIndex, preprocess_markdown
+
+
+def test_preprocess_matches_citation_and_math_normalizers():
+    text = "See [@Smith2024] and [3].\n$$\nE=mc^2\n$$\nThen [@doe] and [@smith2024].\n"
+    normalized, refs, key_number_map = normalize_citations(text)
+    result = preprocess_markdown(text)
+
+    assert result.text.rstrip("\n") == _normalize_math_blocks(normalized)
+    assert result.text == "See [4] and [3].\n\n$$\nE=mc^2\n$$\n\nThen [5] and [4].\n"
+    assert result.refs == refs == ["[3]", "[4]", "[5]"]
+    assert result.key_number_map == key_number_map == {4: "smith2024", 5: "doe"}
+
+
+def test_preprocess_pads_indented_fences_and_lone_carriage_returns():
+    text = "- item\n  $$\n  x\n  $$\n  after\rline\r$$\ry\r$$\rz"
+    result = preprocess_markdown(text)
+
+    assert result.text == "- item\n\n  $$\n  x\n  $$\n\n  after\rline\n\n$$\ry\r$$\n\nz"
+    expected = parse_markdown(_normalize_math_blocks(text))
+    assert build_ast(tokenize_markdown(result.text, normalized=True)) == expected
+
+
+def test_preprocess_offsets_point_back_into_source():
+    text = "前文 [@key] 后文\n$$\nx\n$$\n结尾"
+    result = preprocess_markdown(text)
+    offsets = result.offsets
+
+    tail = text.index("后文")
+    assert result.text[offsets.to_normalized(tail) :].startswith("后文")
+    assert offsets.to_normalized(text.index("[@key]") + 2) == result.text.index("[1]")
+    assert offsets.to_original(result.text.index("结尾")) == text.index("结尾")
+    assert offsets.to_original(result.text.index("[1]")) == text.index("[@key]")
+
+
+def test_preprocess_returns_input_unchanged_without_edits():
+    text = "plain [1] text\r\n\r\nmore\n"
+    result = preprocess_markdown(text)
+
+    assert result.text is text
+    assert result.refs == ["[1]"]
+    assert list(result.offsets.original_starts) == []
+
+
+def test_citation_index_rescans_only_edited_blocks_and_renumbers():
+    blocks = [f"Para {i} cites [@key{i % 3}] and [2]." for i in range(6)]
+    blocks[3] = "$$\nx\n\ny\n$$\nafter"
+    index = CitationIndex()
+    text = "\n\n".join(blocks)
+    first = preprocess_markdown(text, index=index)
+    assert index.stats() == {"hits": 0, "misses": 7, "size": 7}
+
+    # A new key in the first block shifts every later number.
+    blocks[0] = "Para 0 cites [@new] first, then [@key0]."
+    edited = "\n\n".join(blocks)
+    result = preprocess_markdown(edited, index=index)
+    expected = preprocess_markdown(edited)
+
+    assert index.stats()["misses"] == 8
+    assert first.key_number_map == {3: "key0", 4: "key1", 5: "key2"}
+    assert (result.text, result.refs, result.key_number_map) == (
+        expected.text,
+        expected.refs,
+        expected.key_number_map,
+    )
+    assert result.key_number_map == {3: "new", 4: "key0", 5: "key1", 6: "key2"}
+    for position in range(len(edited) + 1):
+        assert result.offsets.to_normalized(position) == expected.offsets.to_normalized(position)
+    tail = edited.index("after")
+    assert result.offsets.to_original(result.offsets.to_normalized(tail)) == tail
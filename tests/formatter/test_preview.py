@@ -1,4 +1,5 @@
-from formatter.preview import summarize_ast
+from formatter.ast_nodes import Heading, ListNode, Paragraph, Run
+from formatter.preview import lint_structure, summarize_ast
 
 
 def test_summarize_ast_counts_blocks():
@@ -29,3 +30,13 @@ def test_summarize_ast_counts_blocks():
     assert summary["lists"] == 1
     assert summary["tables"] == 1
     assert summary["math_blocks"] == 1
+
+
+def test_summary_and_lint_walk_deeply_nested_lists():
+    node = Heading(4, "", [])
+    for level in range(2000, 0, -1):
+        node = ListNode(False, level, 1, [[Paragraph("item", [Run("item")]), node]])
+
+    assert summarize_ast([node])["lists"] == 2000
+    assert summarize_ast([node])["paragraphs"] == 2000
+    assert [warning["code"] for warning in lint_structure([node], [])] == ["empty_heading"]
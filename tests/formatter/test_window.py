@@ -0,0 +1,51 @@
+import pytest
+
+from formatter.app_logic import build_preview_payload
+from formatter.outline import build_outline
+from formatter.window import PreviewWindow, resolve_window_lines, window_bounds
+
+TEXT = "# A\n\npara one\nline two\n\n```\ncode\n\nmore code\n```\n\n- item\n\n    cont\n\n# B\npara\n### C\nlast\n"
+
+
+def test_window_bounds_snap_to_block_boundaries():
+    def window(first, last):
+        start, end = window_bounds(TEXT, first, last)
+        return TEXT[start:end]
+
+    assert window(3, 3) == "para one\nline two\n\n"
+    assert window(8, 8) == "```\ncode\n\nmore code\n```\n\n"
+    assert window(14, 14) == "- item\n\n    cont\n\n"
+    assert window(17, 17) == "# B\npara\n"
+
+
+def test_resolve_window_lines_covers_a_section_and_its_subsections():
+    outline = build_outline(TEXT)
+
+    assert resolve_window_lines(outline, PreviewWindow(section=1, margin_lines=0)) == (16, 20)
+    assert resolve_window_lines(outline, PreviewWindow(start_line=3, end_line=4, margin_lines=2)) == (1, 6)
+    with pytest.raises(ValueError):
+        resolve_window_lines(outline, PreviewWindow(section=3))
+
+
+def test_windowed_preview_parses_only_the_window():
+    text = "".join(f"## 第{i}节\n\n正文 {i} [{i + 1}]。\n\n" for i in range(200))
+    full = build_preview_payload(text)
+    payload = build_preview_payload(text, window={"section": 100, "margin_lines": 0})
+
+    assert [node["text"] for node in payload["ast"]] == ["第100节", "正文 100 [101]。"]
+    assert payload["window"] == {"start_line": 401, "end_line": 404, "total_lines": 801}
+    assert payload["outline"][100] == {"level": 1, "text": "第100节", "line": 401}
+    assert payload["summary"] == full["summary"]
+    assert payload["refs"] == full["refs"]
+
+    tail = build_preview_payload(text, window={"start_line": 800})
+    assert tail["ast"][-2:] == full["ast"][-2:]
+
+
+def test_windowed_preview_keeps_inline_footnote_numbering():
+    text = "# A\n\n甲^[第一条]。\n\n# B\n\n乙^[第二条]。\n"
+    full = build_preview_payload(text)
+    payload = build_preview_payload(text, window={"section": 1, "margin_lines": 0})
+
+    assert payload["preview_html"] == full["preview_html"]
+    assert full["preview_html"].count("footnote-ref") == 2